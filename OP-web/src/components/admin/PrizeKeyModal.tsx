@@ -21,6 +21,7 @@ interface PrizeKeyListResponse {
     used: number;
     available: number;
     keys: PrizeKey[];
+    next_cursor: number | null;
 }
 
 interface Props {
@@ -32,7 +33,9 @@ interface Props {
 export default function PrizeKeyModal({ prizeId, prizeName, onClose }: Props) {
     const [keys, setKeys] = useState<PrizeKey[]>([]);
     const [stats, setStats] = useState({ total: 0, used: 0, available: 0 });
+    const [nextCursor, setNextCursor] = useState<number | null>(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [uploading, setUploading] = useState(false);
     
     // 批量导入
@@ -44,12 +47,19 @@ export default function PrizeKeyModal({ prizeId, prizeName, onClose }: Props) {
         fetchKeys();
     }, [prizeId]);
 
+    const fetchPage = async (cursor?: number | null): Promise<PrizeKeyListResponse | null> => {
+        const params = new URLSearchParams({ limit: '100' });
+        if (cursor) params.set('cursor', String(cursor));
+        const res = await fetch(`${BACKEND_URL}/api/incentive/prize/${prizeId}/keys?${params}`);
+        return res.ok ? res.json() : null;
+    };
+
     const fetchKeys = async () => {
         try {
-            const res = await fetch(`${BACKEND_URL}/api/incentive/prize/${prizeId}/keys`);
-            if (res.ok) {
-                const data: PrizeKeyListResponse = await res.json();
+            const data = await fetchPage();
+            if (data) {
                 setKeys(data.keys);
+                setNextCursor(data.next_cursor);
                 setStats({ total: data.total, used: data.used, available: data.available });
             }
         } catch (err) {
@@ -59,6 +69,24 @@ export default function PrizeKeyModal({ prizeId, prizeName, onClose }: Props) {
         }
     };
 
+    const loadMoreKeys = async () => {
+        if (!nextCursor) return;
+
+        setLoadingMore(true);
+        try {
+            const data = await fetchPage(nextCursor);
+            if (data) {
+                setKeys(prev => [...prev, ...data.keys]);
+                setNextCursor(data.next_cursor);
+                setStats({ total: data.total, used: data.used, available: data.available });
+            }
+        } catch (err) {
+            console.error('Failed to fetch keys:', err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleBulkUpload = async () => {
         if (!bulkKeys.trim()) return;
 
@@ -116,8 +144,18 @@ export default function PrizeKeyModal({ prizeId, prizeName, onClose }: Props) {
         }
     };
 
-    const exportKeys = () => {
-        const csv = keys.map(k => 
+    const exportKeys = async () => {
+        // 导出整个密钥库, 而不只是已加载的页
+        const allKeys: PrizeKey[] = [...keys];
+        let cursor = nextCursor;
+        while (cursor) {
+            const data = await fetchPage(cursor);
+            if (!data) break;
+            allKeys.push(...data.keys);
+            cursor = data.next_cursor;
+        }
+
+        const csv = allKeys.map(k => 
             `${k.key_value},${k.key_type},${k.is_used ? '已使用' : '未使用'},${k.created_at}`
         ).join('\n');
         
@@ -301,6 +339,15 @@ export default function PrizeKeyModal({ prizeId, prizeName, onClose }: Props) {
                                     )}
                                 </div>
                             ))}
+                            {nextCursor && (
+                                <button
+                                    onClick={loadMoreKeys}
+                                    disabled={loadingMore}
+                                    className="w-full py-2 text-sm text-primary hover:bg-primary/5 rounded-lg transition-colors disabled:opacity-50"
+                                >
+                                    {loadingMore ? '加载中...' : `加载更多 (已显示 ${keys.length} / ${stats.total})`}
+                                </button>
+                            )}
                         </div>
                     )}
                 </div>
@@ -14,6 +14,13 @@ class Settings(BaseSettings):
     matrix_homeserver_url: str = "http://localhost:8008"
     matrix_server_name: str = "localhost"
     matrix_registration_shared_secret: str = ""
+    matrix_room_name_ttl_seconds: int = 300
+    matrix_room_name_cache_size: int = 10000
+    matrix_fallback_concurrency: int = 8  # rooms fetched at once by fallback search
+    matrix_fallback_messages_per_room: int = 50
+    matrix_fallback_deadline_seconds: float = 5.0
+    matrix_bot_user_id: str = ""  # account the RAG sync indexer follows
+    matrix_bot_access_token: str = ""
 
     # CORS
     cors_origin: str = "http://localhost:5173"
@@ -26,10 +33,96 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     openai_model: str = "deepseek-chat"
 
+    # LLM answer cache
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_seconds: int = 3600
+    llm_cache_max_entries: int = 1000
+    llm_semantic_cache_enabled: bool = False  # reuse answers for similar questions
+    llm_semantic_cache_threshold: float = 0.95  # min cosine similarity of the questions
+
+    # RAG indexing
+    rag_embedding_batch_size: int = 64  # texts per embeddings request
+    rag_embedding_concurrency: int = 4  # embedding requests in flight
+    rag_chunk_min_chars: int = 4  # shorter messages get no vector of their own
+    rag_chunk_max_chars: int = 2000  # longer messages are split into chunks
+    rag_chunk_overlap_chars: int = 200
+    rag_conversation_embeddings: bool = True  # also embed threads and time windows
+    rag_conversation_window_seconds: int = 600
+    rag_conversation_max_chars: int = 4000  # per segment
+    rag_conversation_segment_messages: int = 20  # messages per thread/window embedding
+    rag_conversation_min_messages: int = 3  # smaller segments get no embedding
+    rag_conversation_refresh_seconds: float = 30.0  # batch re-embeds of touched conversations, 0 = immediately
+    rag_conversation_refresh_max_pending: int = 500  # re-embed right away once this many are waiting
+    embedding_cache_max_entries: int = 4096  # in-process LRU tier size
+    embedding_cache_persist: bool = True  # also use the Postgres tier
+    rag_sync_indexer_enabled: bool = False  # follow /sync as the bot account
+    rag_sync_timeout_ms: int = 30000  # /sync long-poll timeout
+    rag_sync_timeline_limit: int = 100  # timeline events per room per sync
+    rag_backfill_page_size: int = 500  # events per /messages page when backfilling
+
+    # Indexing job queue (indexing_jobs table)
+    rag_job_workers: int = 2  # concurrent jobs per process, 0 = do not run jobs here
+    rag_job_poll_seconds: float = 2.0  # idle workers check for new jobs this often
+    rag_job_max_attempts: int = 5
+    rag_job_backoff_seconds: float = 10.0  # first retry delay, doubled per attempt
+    rag_job_backoff_max_seconds: float = 600.0
+    rag_job_lease_seconds: int = 300  # running jobs without a heartbeat for this long are reclaimed
+
+    # Hybrid retrieval (full-text + vector, reciprocal rank fusion)
+    rag_hybrid_enabled: bool = True
+    rag_hybrid_candidates: int = 50  # hits taken from each retriever before fusion
+    rag_rrf_k: int = 60
+    rag_fulltext_config: str = "simple"  # text search config of content_tsv
+
+    # Reranking
+    rag_rerank_enabled: bool = False
+    rag_rerank_candidates: int = 100  # first-stage hits handed to the reranker
+    rag_rerank_budget_ms: float = 150  # keep first-stage order beyond this
+    rag_rerank_model: str = ""  # sentence-transformers cross-encoder; empty = BM25
+    rag_rerank_weight: float = 0.5  # model score vs first-stage rank
+    rag_rerank_workers: int = 2
+
+    # Context packing
+    rag_context_max_tokens: int = 2000  # chat history tokens sent to the LLM
+    rag_tokenizer_encoding: str = "cl100k_base"  # tiktoken encoding used for counting
+    rag_context_tokens_per_message: int = 40  # sizes retrieval to the budget
+    rag_context_collapse_gap_seconds: int = 300  # same-sender messages merged within this gap
+    rag_context_dedupe_threshold: float = 0.9  # trigram Jaccard of near-duplicates
+    rag_context_expand_windows: bool = False  # widen hits with neighbouring messages
+    rag_context_window_messages: int = 3  # neighbours on each side of a hit
+    rag_context_window_seconds: int = 1800  # max distance of a neighbour from the hit
+
+    # pgvector ANN index
+    rag_vector_index: str = "hnsw"  # hnsw / ivfflat / none
+    rag_hnsw_m: int = 16
+    rag_hnsw_ef_construction: int = 64
+    rag_hnsw_ef_search: int = 40  # candidate list size per query (recall vs latency)
+    rag_ivfflat_lists: int = 1000  # ~rows/1000 up to 1M rows, ~sqrt(rows) beyond
+    rag_ivfflat_probes: int = 10  # lists scanned per query
+
+    # On-disk embedding store used instead of the in-memory index without pgvector
+    rag_embedding_store_dir: str = ""  # empty disables the store
+    rag_embedding_store_dtype: str = "float16"  # float16 / float32
+    rag_embedding_store_segment_rows: int = 65536
+    rag_embedding_store_compact_ratio: float = 0.25  # rewrite segments once this share of rows is deleted
+
+    # Incentive leaderboards (in-process ranked boards)
+    leaderboard_refresh_seconds: int = 60  # reload boards from the database this often
+    leaderboard_max_boards: int = 256  # least recently used boards beyond this are dropped
+
     # Web Search
     web_search_api_key: str = ""
     web_search_cx: str = ""
 
+    # Outbound HTTP (shared pooled clients)
+    http_timeout_seconds: float = 10.0
+    http_connect_timeout_seconds: float = 5.0
+    http_max_connections: int = 100
+    http_synapse_max_connections: int = 200
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_seconds: float = 30.0
+    http2_enabled: bool = True
+
     # Server
     port: int = 3000
 
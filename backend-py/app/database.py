@@ -2,8 +2,12 @@
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ARRAY, BigInteger, text
+from sqlalchemy import (
+    Column, Integer, String, Text, TIMESTAMP, ARRAY, BigInteger, Float, Index, LargeBinary, MetaData, Table, text
+)
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
+from pgvector.sqlalchemy import Vector
 
 from .config import get_settings
 
@@ -12,6 +16,16 @@ settings = get_settings()
 # Flag to track if pgvector is available
 PGVECTOR_AVAILABLE = False
 
+# Flag to track if the content_tsv full-text column is available
+FULLTEXT_AVAILABLE = False
+
+# Flag to track if pgvector supports iterative index scans (0.8+), which keep
+# scanning the ANN index until filtered queries have enough rows
+PGVECTOR_ITERATIVE_SCAN = False
+
+# Dimension of the stored message embeddings (text-embedding-3-small)
+EMBEDDING_DIMENSION = 1536
+
 # Create async engine
 engine = create_async_engine(
     settings.database_url,
@@ -74,6 +88,10 @@ class RepositorySettings(Base):
 # Chat message embeddings table - stores embeddings as JSON when pgvector not available
 class ChatMessageEmbedding(Base):
     __tablename__ = "chat_message_embeddings"
+    __table_args__ = (
+        # Range scans for neighbouring-message windows
+        Index("ix_chat_message_embeddings_room_timestamp", "room_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True)
     room_id = Column(String(255), nullable=False, index=True)
@@ -83,13 +101,106 @@ class ChatMessageEmbedding(Base):
     timestamp = Column(TIMESTAMP, nullable=False)
     # Embedding stored as JSON text since pgvector may not be available
     embedding_json = Column(Text)
+    # message / chunk / thread / window, see services.chunker
+    kind = Column(String(20), nullable=False, server_default="message")
+    thread_id = Column(String(255), index=True)  # root event of the thread or reply chain
+
+
+# Write/query view of chat_message_embeddings including the pgvector column.
+# It lives in its own MetaData so create_all never emits the vector type; the
+# column and its ANN index are added by init_database when pgvector is available.
+chat_message_vectors = Table(
+    "chat_message_embeddings",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("room_id", String(255), nullable=False),
+    Column("event_id", String(255), unique=True, nullable=False),
+    Column("sender", String(255), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("timestamp", TIMESTAMP, nullable=False),
+    Column("embedding_json", Text),
+    Column("kind", String(20), nullable=False, server_default="message"),
+    Column("thread_id", String(255)),
+    Column("embedding", Vector(EMBEDDING_DIMENSION)),
+)
+
+
+# Content-addressed embedding cache - persistent tier of EmbeddingCache
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    model = Column(String(100), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)  # sha256 hex of the input text
+    embedding = Column(LargeBinary, nullable=False)  # float32 little-endian bytes
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+# /sync position of each account followed by the RAG sync indexer
+class MatrixSyncState(Base):
+    __tablename__ = "matrix_sync_state"
+
+    account = Column(String(255), primary_key=True)  # Matrix user ID of the bot
+    since_token = Column(Text)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+# Checkpointed progress of a full-history room backfill (/ai/index-room)
+class RoomBackfillJob(Base):
+    __tablename__ = "room_backfill_jobs"
+
+    id = Column(Integer, primary_key=True)
+    room_id = Column(String(255), unique=True, nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running/paused/completed/failed
+    from_token = Column(Text)  # /messages token of the next page to fetch
+    max_messages = Column(Integer)  # None = whole history
+    pages_done = Column(Integer, nullable=False, default=0)
+    messages_fetched = Column(Integer, nullable=False, default=0)
+    messages_indexed = Column(Integer, nullable=False, default=0)
+    newest_ts = Column(TIMESTAMP)  # newest message seen when the job started
+    oldest_ts = Column(TIMESTAMP)  # oldest message indexed so far
+    room_start_ts = Column(TIMESTAMP)  # first event in the room, used for the ETA
+    elapsed_seconds = Column(Float, nullable=False, default=0.0)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+# Background indexing work (index / backfill / reembed), claimed by job_queue workers
+class IndexingJob(Base):
+    __tablename__ = "indexing_jobs"
+    __table_args__ = (
+        # Claim query: next due queued job
+        Index("ix_indexing_jobs_status_run_after", "status", "run_after"),
+        # One active job per (kind, room); enqueue relies on it for ON CONFLICT
+        Index(
+            "uq_indexing_jobs_active", "kind", "room_id", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # index/backfill/reembed
+    room_id = Column(String(255), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued/running/succeeded/failed
+    payload = Column(JSONB, nullable=False, default=dict)  # handler arguments
+    result = Column(JSONB)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(TIMESTAMP, nullable=False, server_default=func.now())  # retry backoff
+    locked_by = Column(String(100))  # worker holding the job
+    locked_at = Column(TIMESTAMP)  # last heartbeat of that worker
+    last_error = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    finished_at = Column(TIMESTAMP)
 
 
 # Import incentive models to ensure they're registered with Base
 # This import is at the end to avoid circular imports
 def _import_incentive_models():
     from .models.incentive import (
-        Campaign, Activity, Task, TaskClaim, UserPoints, Prize, PrizeRedemption
+        Campaign, Activity, Task, TaskClaim, UserPoints, PointsLedger, LeaderboardSnapshot,
+        Prize, PrizeRedemption
     )
 
 _import_incentive_models()
@@ -104,9 +215,114 @@ async def get_db():
             await session.close()
 
 
+async def _ensure_vector_index(conn):
+    """Add the pgvector column to chat_message_embeddings and build its ANN index."""
+    global PGVECTOR_ITERATIVE_SCAN
+
+    version = await conn.scalar(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))
+    PGVECTOR_ITERATIVE_SCAN = tuple(int(part) for part in version.split(".")[:2]) >= (0, 8)
+
+    await conn.execute(text(
+        f"ALTER TABLE chat_message_embeddings "
+        f"ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIMENSION})"
+    ))
+
+    index_type = settings.rag_vector_index.lower()
+    if index_type == "hnsw":
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_embedding_hnsw "
+            "ON chat_message_embeddings USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {int(settings.rag_hnsw_m)}, "
+            f"ef_construction = {int(settings.rag_hnsw_ef_construction)})"
+        ))
+    elif index_type == "ivfflat":
+        # IVFFlat centroids come from the rows present at build time, so build
+        # (or REINDEX) it after the bulk of the embeddings has been loaded
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_embedding_ivfflat "
+            "ON chat_message_embeddings USING ivfflat (embedding vector_cosine_ops) "
+            f"WITH (lists = {int(settings.rag_ivfflat_lists)})"
+        ))
+    print(f"✅ pgvector column ready (index: {index_type}, iterative scans: {PGVECTOR_ITERATIVE_SCAN})")
+
+
+async def _ensure_fulltext_index(conn):
+    """Add the generated tsvector column used by lexical retrieval, with its GIN index."""
+    # regconfig names cannot be bound as parameters inside a generated column
+    config = settings.rag_fulltext_config.replace("'", "")
+    await conn.execute(text(
+        "ALTER TABLE chat_message_embeddings ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{config}', content)) STORED"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_content_tsv "
+        "ON chat_message_embeddings USING gin (content_tsv)"
+    ))
+    print(f"✅ Full-text index ready (config: {config})")
+
+
+async def _ensure_incentive_indexes():
+    """
+    Indexes that incentive writes rely on (ON CONFLICT targets, key claiming).
+
+    Each table is handled in its own transaction: creating an index fails
+    while duplicates left by older code remain, see
+    migrations/add_task_claim_once_index.sql, add_points_ledger.sql and
+    add_prize_keys_unique_index.sql.
+    """
+    from .models.incentive import TaskClaim, UserPoints, PrizeKey
+
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "UPDATE task_claims c SET recurrence = COALESCE(t.recurrence, 'once') "
+            "FROM tasks t WHERE c.task_id = t.id AND c.recurrence IS NULL"
+        ))
+
+    for model in (TaskClaim, UserPoints, PrizeKey):
+        try:
+            async with engine.begin() as conn:
+                for index in model.__table__.indexes:
+                    await conn.run_sync(index.create, checkfirst=True)
+        except Exception as e:
+            print(f"⚠️ Could not create indexes on {model.__tablename__}: {e}")
+            print("   Writes relying on these indexes fail until the duplicates are removed")
+
+
+async def _seed_opening_balances():
+    """
+    Record balances that predate the points ledger as opening entries.
+
+    A user_points row whose totals differ from the sum of its ledger entries
+    gets the difference as an 'opening_balance' entry keyed by the row id, so
+    replaying the ledger (points/rebuild) reproduces it. Rows written through
+    the ledger have no difference, and the unique source index makes reruns
+    no-ops (without that index the INSERT fails instead of seeding twice).
+    See migrations/add_points_ledger.sql.
+    """
+    async with engine.begin() as conn:
+        for entry_type, column, note, sign in (
+            ("adjust", "total_points", "期初积分", ""),
+            ("spend", "spent_points", "期初已消耗积分", "-"),
+        ):
+            await conn.execute(text(f"""
+                INSERT INTO points_ledger (user_id, org_id, entry_type, amount, source_type, source_id, note)
+                SELECT p.user_id, p.org_id, '{entry_type}',
+                       {sign}(COALESCE(p.{column}, 0) - COALESCE(l.{column}, 0)), 'opening_balance', p.id, '{note}'
+                FROM user_points p
+                LEFT JOIN (
+                    SELECT user_id, org_id,
+                           SUM(amount) FILTER (WHERE entry_type IN ('earn', 'adjust')) AS total_points,
+                           -SUM(amount) FILTER (WHERE entry_type NOT IN ('earn', 'adjust')) AS spent_points
+                    FROM points_ledger GROUP BY user_id, org_id
+                ) l ON l.user_id = p.user_id AND l.org_id = p.org_id
+                WHERE COALESCE(p.{column}, 0) <> COALESCE(l.{column}, 0)
+                ON CONFLICT (entry_type, source_type, source_id) WHERE source_id IS NOT NULL DO NOTHING
+            """))
+
+
 async def init_database():
     """Initialize database tables. pgvector extension is optional."""
-    global PGVECTOR_AVAILABLE
+    global PGVECTOR_AVAILABLE, FULLTEXT_AVAILABLE
 
     # First try to enable pgvector in a separate connection
     try:
@@ -123,7 +339,50 @@ async def init_database():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # Columns added after the table was first created
+            await conn.execute(text(
+                "ALTER TABLE chat_message_embeddings "
+                "ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'message', "
+                "ADD COLUMN IF NOT EXISTS thread_id VARCHAR(255)"
+            ))
+            await conn.execute(text("ALTER TABLE task_claims ADD COLUMN IF NOT EXISTS recurrence VARCHAR(20)"))
+            await conn.execute(text("ALTER TABLE prizes ADD COLUMN IF NOT EXISTS key_count INTEGER"))
+            # Rows that predate the column; new prizes start at 0
+            await conn.execute(text(
+                "UPDATE prizes SET key_count = "
+                "(SELECT COUNT(*) FROM prize_keys WHERE prize_keys.prize_id = prizes.id) "
+                "WHERE key_count IS NULL"
+            ))
+            # create_all skips indexes on tables that already exist
+            for index in ChatMessageEmbedding.__table__.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
         print("✅ Database tables initialized")
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
         raise
+
+    try:
+        async with engine.begin() as conn:
+            await _ensure_fulltext_index(conn)
+        FULLTEXT_AVAILABLE = True
+    except Exception as e:
+        FULLTEXT_AVAILABLE = False
+        print(f"⚠️ Could not set up full-text index: {e}")
+        print("   AI retrieval will use vector search only")
+
+    await _ensure_incentive_indexes()
+
+    try:
+        await _seed_opening_balances()
+    except Exception as e:
+        print(f"⚠️ Could not record opening points balances: {e}")
+        print("   Do not rebuild balances from the ledger until this succeeds")
+
+    if PGVECTOR_AVAILABLE:
+        try:
+            async with engine.begin() as conn:
+                await _ensure_vector_index(conn)
+        except Exception as e:
+            PGVECTOR_AVAILABLE = False
+            print(f"⚠️ Could not set up pgvector column: {e}")
+            print("   AI embeddings will be stored as JSON (slower search)")
@@ -6,6 +6,11 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from .config import get_settings
 from .database import init_database
+from .services.http_clients import http_clients
+from .services.sync_indexer import sync_indexer
+from .services.job_queue import job_queue
+from .services.rag_service import rag_service
+from .services.reranker import reranker
 from .routers import auth, matrix, user, orgs, repos, search, ai_chat, github, incentive
 from .models import incentive as incentive_models  # Ensure tables are created
 
@@ -21,11 +26,19 @@ async def lifespan(app: FastAPI):
     print(f"🔗 Matrix server: {settings.matrix_homeserver_url}")
 
     await init_database()
+    rag_service.start()
+    reranker.start()
+    sync_indexer.start()
+    job_queue.start()
 
     yield
 
     # Shutdown
     print("👋 Shutting down...")
+    await sync_indexer.stop()
+    await job_queue.stop()
+    await rag_service.stop()
+    await http_clients.aclose()
 
 
 app = FastAPI(
@@ -1,6 +1,6 @@
 """Incentive system database models."""
 
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, TIMESTAMP, Boolean, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB
 
@@ -66,11 +66,19 @@ class Task(Base):
 class TaskClaim(Base):
     """任务领取记录"""
     __tablename__ = "task_claims"
+    __table_args__ = (
+        # once 类型任务每个用户只能有一条 approved 记录, 由数据库保证不会重复发放
+        Index(
+            "uq_task_claims_once_approved", "user_id", "task_id", unique=True,
+            postgresql_where=text("status = 'approved' AND recurrence = 'once'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False, index=True)
     task_id = Column(Integer, ForeignKey('tasks.id'), nullable=False, index=True)
     status = Column(String(20), default='pending')  # pending/approved/rejected
+    recurrence = Column(String(20), default='once')  # 领取时任务的 recurrence 快照
     points_earned = Column(Integer, default=0)
     submission_data = Column(JSONB)  # 用户提交的数据
     submitted_at = Column(TIMESTAMP, server_default=func.now())
@@ -80,8 +88,11 @@ class TaskClaim(Base):
 
 
 class UserPoints(Base):
-    """用户积分账户 - 每个组织独立"""
+    """用户积分账户 - 每个组织独立, 由 points_ledger 物化而来的余额"""
     __tablename__ = "user_points"
+    __table_args__ = (
+        Index("uq_user_points_user_org", "user_id", "org_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False, index=True)
@@ -92,6 +103,51 @@ class UserPoints(Base):
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
 
+# 组织排行榜按总积分倒序读取
+Index("ix_user_points_org_total", UserPoints.org_id, UserPoints.total_points.desc())
+
+
+class PointsLedger(Base):
+    """积分流水 - 只追加不修改, user_points 的余额可由它重放得到"""
+    __tablename__ = "points_ledger"
+    __table_args__ = (
+        Index("ix_points_ledger_user_org", "user_id", "org_id", "id"),
+        # 同一来源事件只记一次账
+        Index(
+            "uq_points_ledger_source", "entry_type", "source_type", "source_id", unique=True,
+            postgresql_where=text("source_id IS NOT NULL"),
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    org_id = Column(Integer, nullable=False)
+    campaign_id = Column(Integer, index=True)  # 积分来自哪个活动 (任务奖励时有值)
+    entry_type = Column(String(20), nullable=False)  # earn/spend/adjust/refund
+    amount = Column(Integer, nullable=False)  # 对可用积分的变动, spend 为负数
+    source_type = Column(String(30))  # task_claim/prize_redemption/admin
+    source_id = Column(Integer)
+    note = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+
+
+class LeaderboardSnapshot(Base):
+    """排行榜快照 - 某一时刻各用户的名次, 用于展示名次变化"""
+    __tablename__ = "leaderboard_snapshots"
+    __table_args__ = (
+        Index("ix_leaderboard_snapshots_board", "org_id", "scope", "scope_key", "snapshot_at", "rank"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    org_id = Column(Integer, nullable=False)
+    scope = Column(String(20), nullable=False)  # global/campaign/weekly
+    scope_key = Column(String(50), nullable=False, default='')  # campaign_id 或周一日期, global 为空
+    user_id = Column(Integer, nullable=False)
+    points = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+    snapshot_at = Column(TIMESTAMP, nullable=False)  # 同一次快照的行时间相同
+
+
 class Prize(Base):
     """奖品"""
     __tablename__ = "prizes"
@@ -104,11 +160,12 @@ class Prize(Base):
     type = Column(String(50), default='digital')  # physical/digital/badge/voucher
     points_required = Column(Integer, nullable=False)
     stock = Column(Integer)  # NULL 表示无限
-    claimed_count = Column(Integer, default=0)
+    claimed_count = Column(Integer, default=0)  # 密钥库奖品不维护, 领取数 = key_count - 未使用密钥数
     delivery_type = Column(String(20), default='manual')  # shipping/code/manual/key_pool
     prize_config = Column(JSONB)  # 额外配置
     # 密钥库配置（当 delivery_type='key_pool' 时使用）
     use_key_pool = Column(Boolean, default=False)  # 是否使用密钥库
+    key_count = Column(Integer, default=0)  # 密钥库中的密钥数, 只在导入/删除密钥时更新, 兑换不写奖品行
     is_active = Column(Boolean, default=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
@@ -116,6 +173,12 @@ class Prize(Base):
 class PrizeKey(Base):
     """密钥库 - 存储奖品的兑换密钥"""
     __tablename__ = "prize_keys"
+    __table_args__ = (
+        # 兑换时按 id 顺序领取某奖品的未使用密钥
+        Index("ix_prize_keys_unused", "prize_id", "id", postgresql_where=text("is_used = false")),
+        # 同一奖品的密钥不重复, 批量导入依赖它做 ON CONFLICT DO NOTHING
+        Index("unique_prize_key", "prize_id", "key_value", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     prize_id = Column(Integer, ForeignKey('prizes.id'), nullable=False, index=True)
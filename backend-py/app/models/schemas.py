@@ -113,6 +113,7 @@ class SearchResult(BaseModel):
 class SearchResponse(BaseModel):
     answer: str
     results: List[SearchResult]
+    cache_status: Optional[str] = None  # hit / miss / disabled
 
 
 # AI Chat schemas
@@ -121,19 +122,28 @@ class AIChatRequest(BaseModel):
     room_ids: Optional[List[str]] = None
     include_history: bool = True
     search_context: Optional[str] = None  # Pre-searched messages from Cinny
+    expand_context: Optional[bool] = None  # Include neighbouring messages (server default if None)
+    rerank_budget_ms: Optional[float] = None  # Reranking latency budget (server default if None)
 
 
 class ChatMessageSource(BaseModel):
     room_id: str
     room_name: Optional[str] = None
+    event_id: Optional[str] = None  # Matrix event ID, when known
+    thread_id: Optional[str] = None  # Thread root or replied-to event, when known
+    # message, or an indexed chunk / thread / window row (see services.chunker);
+    # thread and window rows carry a transcript and have no single sender
+    kind: str = "message"
     sender: str
     content: str
     timestamp: datetime
+    score: Optional[float] = None  # Retrieval relevance, when available
 
 
 class AIChatResponse(BaseModel):
     answer: str
     sources: List[ChatMessageSource] = []
+    cache_status: Optional[str] = None  # hit / semantic_hit / miss / disabled
 
 
 # Incentive schemas
@@ -210,6 +220,38 @@ class UserPointsResponse(BaseModel):
     level: int = 1
 
 
+class PointsLedgerEntryResponse(BaseModel):
+    id: int
+    entry_type: str  # earn/spend/adjust/refund
+    amount: int  # 对可用积分的变动, spend 为负数
+    campaign_id: Optional[int] = None
+    source_type: Optional[str] = None
+    source_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+
+class PointsAdjustRequest(BaseModel):
+    user_id: int
+    amount: int  # 正数加分, 负数扣分
+    note: Optional[str] = None
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int  # 同分同名次
+    user_id: int
+    points: int
+    previous_rank: Optional[int] = None  # 最近一次快照中的名次
+
+
+class LeaderboardResponse(BaseModel):
+    scope: str  # global/campaign/weekly
+    scope_key: str = ""  # campaign_id 或周一日期
+    total_participants: int = 0
+    entries: List[LeaderboardEntry] = []
+    me: Optional[LeaderboardEntry] = None  # 请求中 user_id 的名次
+
+
 class PrizeResponse(BaseModel):
     id: int
     name: str
@@ -316,4 +358,5 @@ class PrizeKeyListResponse(BaseModel):
     used: int
     available: int
     keys: List[PrizeKeyResponse]
+    next_cursor: Optional[int] = None  # 下一页的 cursor, 没有更多时为 None
 
@@ -7,33 +7,36 @@ from ..config import get_settings
 from ..models.schemas import AIChatRequest, AIChatResponse, ChatMessageSource
 from ..services.matrix_messages import matrix_messages_service
 from ..services.rag_service import rag_service
+from ..services.room_backfill import room_backfill_service
+from ..services.job_queue import job_queue, JOB_KINDS, KIND_BACKFILL, KIND_INDEX
+from ..services.embedding_cache import embedding_cache
+from ..services.answer_cache import answer_cache
 from ..services.llm_service import llm_service
+from ..services.context_packer import pack_context
+from ..services.streaming import sse_response, stream_answer_events
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 settings = get_settings()
 
 
-@router.post("/chat", response_model=AIChatResponse)
-async def ai_chat(
-    request: AIChatRequest,
-    authorization: Optional[str] = Header(None),
-):
-    """
-    Chat with AI using Matrix room messages as context.
-    
-    The AI will search through chat history to find relevant information
-    and generate a helpful response.
-    """
-    if not request.message:
-        raise HTTPException(status_code=400, detail="Message is required")
-
-    # Get Matrix token if provided
-    matrix_token = None
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
     if authorization and authorization.startswith("Bearer "):
-        matrix_token = authorization.replace("Bearer ", "")
+        return authorization.replace("Bearer ", "")
+    return None
 
+
+async def _retrieve_chat_context(
+    request: AIChatRequest, matrix_token: Optional[str]
+) -> tuple[str, List[ChatMessageSource], Optional[List[float]]]:
+    """
+    Context string and sources for a chat request, with room names resolved.
+
+    Also returns the RAG query embedding when the semantic answer cache is
+    enabled (None otherwise).
+    """
     sources: List[ChatMessageSource] = []
     context = ""
+    query_embedding = None
 
     # Use provided search context from Cinny if available
     if request.search_context:
@@ -43,7 +46,13 @@ async def ai_chat(
         context, sources = await rag_service.get_relevant_context(
             request.message,
             room_ids=request.room_ids,
+            max_tokens=settings.rag_context_max_tokens,
+            expand=request.expand_context,
+            rerank_budget_ms=request.rerank_budget_ms,
         )
+        if settings.llm_semantic_cache_enabled:
+            # Served from the embedding cache filled by the search above
+            query_embedding = await rag_service.get_embedding(request.message)
 
     # If no results from RAG and we have a Matrix token, try direct search
     if not sources and matrix_token:
@@ -54,75 +63,154 @@ async def ai_chat(
             limit=10,
         )
 
-        if sources:
-            context = "\n".join(
-                [
-                    f"[{msg.sender}] ({msg.timestamp.strftime('%Y-%m-%d %H:%M')}): {msg.content}"
-                    for msg in sources
-                ]
-            )
-
-    # Generate AI response
-    if context:
-        answer = await llm_service.chat_with_context(
-            message=request.message,
-            chat_context=context,
-        )
-    else:
-        # No context available, generate response without chat history
-        answer = await llm_service.chat_with_context(
-            message=request.message,
-            chat_context="No relevant chat messages found in the rooms.",
-        )
+        context, sources = pack_context(sources, settings.rag_context_max_tokens)
 
     # Add room names to sources if we have a token
     if matrix_token and sources:
+        room_names = await matrix_messages_service.get_room_names(
+            [source.room_id for source in sources], matrix_token
+        )
         for source in sources:
-            room_name = await matrix_messages_service.get_room_name(
-                source.room_id, matrix_token
-            )
-            source.room_name = room_name
+            source.room_name = room_names.get(source.room_id)
+
+    if not context:
+        # No context available, generate response without chat history
+        context = "No relevant chat messages found in the rooms."
+    return context, sources, query_embedding
+
+
+@router.post("/chat", response_model=AIChatResponse)
+async def ai_chat(
+    request: AIChatRequest,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Chat with AI using Matrix room messages as context.
+    
+    The AI will search through chat history to find relevant information
+    and generate a helpful response.
+    """
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+
+    context, sources, query_embedding = await _retrieve_chat_context(
+        request, _bearer_token(authorization)
+    )
+
+    # Generate AI response
+    answer, cache_status = await llm_service.chat_with_context(
+        message=request.message,
+        chat_context=context,
+        query_embedding=query_embedding,
+    )
+
+    return AIChatResponse(answer=answer, sources=sources, cache_status=cache_status)
+
+
+@router.post("/chat/stream")
+async def ai_chat_stream(
+    request: AIChatRequest,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Streaming variant of /ai/chat over Server-Sent Events.
+
+    Emits a ``sources`` event as soon as retrieval finishes, then ``token``
+    events as the model generates the answer, then ``done``.
+    """
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
 
-    return AIChatResponse(answer=answer, sources=sources)
+    context, sources, query_embedding = await _retrieve_chat_context(
+        request, _bearer_token(authorization)
+    )
+
+    tokens, cache_status = await llm_service.stream_chat_with_context(
+        message=request.message,
+        chat_context=context,
+        query_embedding=query_embedding,
+    )
+    return sse_response(stream_answer_events(
+        {
+            "sources": [source.model_dump(mode="json") for source in sources],
+            "cache_status": cache_status,
+        },
+        tokens,
+    ))
 
 
 @router.post("/index-room")
 async def index_room(
     room_id: str,
     authorization: str = Header(...),
-    limit: int = 500,
+    limit: Optional[int] = None,
+    restart: bool = False,
 ):
     """
     Index messages from a room for semantic search.
     
-    This fetches recent messages and stores their embeddings for RAG.
+    Queues (or resumes) a background backfill that pages through the room's
+    history, newest first, and stores embeddings for RAG. ``limit`` caps the
+    number of messages; by default the whole history is indexed. Once it has
+    been, later calls index the messages sent since. Returns the
+    job straight away; poll ``/ai/jobs/{job_id}`` or ``/ai/index-room/progress``
+    for progress and ETA.
     """
-    if not authorization.startswith("Bearer "):
+    return await create_job(KIND_BACKFILL, room_id, authorization, limit, restart)
+
+
+@router.post("/jobs")
+async def create_job(
+    kind: str,
+    room_id: str,
+    authorization: str = Header(...),
+    limit: Optional[int] = None,
+    restart: bool = False,
+):
+    """
+    Queue an indexing job for a room.
+
+    ``kind`` is ``index`` (catch up on the newest messages), ``backfill``
+    (full history, resumable) or ``reembed`` (rebuild the embeddings of
+    already indexed messages). If the room already has an active job of that
+    kind it is returned instead of queueing another; a queued one is updated
+    with this request's token and limit, a running one is not
+    (``payload_applied`` is false).
+    """
+    matrix_token = _bearer_token(authorization)
+    if not matrix_token:
         raise HTTPException(status_code=401, detail="Matrix token required")
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(JOB_KINDS)}")
 
-    matrix_token = authorization.replace("Bearer ", "")
+    payload = {}
+    if kind in (KIND_INDEX, KIND_BACKFILL):
+        payload = {"access_token": matrix_token, "max_messages": limit, "restart": restart}
+    job, applied = await job_queue.enqueue(kind, room_id, payload)
+    message = f"Job {job.status}" if applied else "Job already running; this request's parameters were not applied"
+    return {**job_queue.describe(job), "payload_applied": applied, "message": message}
 
-    # Get messages from room
-    messages, _ = await matrix_messages_service.get_room_messages(
-        room_id=room_id,
-        access_token=matrix_token,
-        limit=limit,
-    )
 
-    if not messages:
-        return {"indexed": 0, "message": "No messages found in room"}
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    """Status of an indexing job, with progress and ETA for backfills."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    # Generate fake event IDs (in real implementation, get actual event IDs)
-    event_ids = [f"{room_id}:{i}" for i in range(len(messages))]
+    status = job_queue.describe(job)
+    if job.kind == KIND_BACKFILL:
+        status["progress"] = await room_backfill_service.progress(job.room_id)
+    return status
 
-    # Store embeddings
-    indexed_count = await rag_service.store_messages_batch(messages, event_ids)
 
-    return {
-        "indexed": indexed_count,
-        "total_messages": len(messages),
-        "message": f"Successfully indexed {indexed_count} messages",
-    }
+@router.get("/index-room/progress")
+async def get_index_room_progress(room_id: str):
+    """Progress and ETA of a room backfill."""
+    progress = await room_backfill_service.progress(room_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Room has not been indexed")
+    return progress
 
 
 @router.get("/search")
@@ -130,12 +218,15 @@ async def search_messages(
     query: str,
     room_ids: Optional[str] = None,
     limit: int = 10,
+    rerank: Optional[bool] = None,
+    rerank_budget_ms: Optional[float] = None,
     authorization: Optional[str] = Header(None),
 ):
     """
     Search for messages semantically.
     
-    Uses vector similarity search on indexed messages.
+    Uses vector similarity search on indexed messages, optionally reranked
+    within ``rerank_budget_ms``. ``timings`` reports each retrieval stage.
     """
     if not query:
         raise HTTPException(status_code=400, detail="Query is required")
@@ -143,10 +234,12 @@ async def search_messages(
     room_id_list = room_ids.split(",") if room_ids else None
 
     # Search using RAG
-    messages = await rag_service.semantic_search(
+    messages, timings = await rag_service.retrieve_with_timings(
         query=query,
         room_ids=room_id_list,
         limit=limit,
+        rerank=rerank,
+        rerank_budget_ms=rerank_budget_ms,
     )
 
     # If no results from RAG and we have a token, fall back to Matrix search
@@ -159,4 +252,16 @@ async def search_messages(
             limit=limit,
         )
 
-    return {"results": messages, "count": len(messages)}
+    return {"results": messages, "count": len(messages), "timings": timings}
+
+
+@router.get("/embedding-cache/stats")
+async def get_embedding_cache_stats():
+    """Hit/miss counters and estimated savings of the embedding cache."""
+    return embedding_cache.stats()
+
+
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats():
+    """Hit/miss counters of the LLM answer cache."""
+    return answer_cache.stats()
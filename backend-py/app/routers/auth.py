@@ -2,7 +2,6 @@
 
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import RedirectResponse
-import httpx
 from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
 
@@ -10,6 +9,7 @@ from ..config import get_settings
 from ..database import async_session, UserPreferences
 from ..models.schemas import GitHubCallbackRequest, AuthResponse, GitHubUser, MatrixCredentials
 from ..services.matrix_service import create_matrix_account
+from ..services.http_clients import http_clients
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
@@ -38,53 +38,53 @@ async def github_callback(request: GitHubCallbackRequest):
     if not request.code:
         raise HTTPException(status_code=400, detail="Authorization code is required")
 
-    async with httpx.AsyncClient() as client:
-        # Exchange code for GitHub access token
-        token_response = await client.post(
-            "https://github.com/login/oauth/access_token",
-            json={
-                "client_id": settings.github_client_id,
-                "client_secret": settings.github_client_secret,
-                "code": request.code,
-                "redirect_uri": settings.github_redirect_uri,
-            },
-            headers={"Accept": "application/json"},
-        )
+    client = http_clients.get("github")
+    # Exchange code for GitHub access token
+    token_response = await client.post(
+        "https://github.com/login/oauth/access_token",
+        json={
+            "client_id": settings.github_client_id,
+            "client_secret": settings.github_client_secret,
+            "code": request.code,
+            "redirect_uri": settings.github_redirect_uri,
+        },
+        headers={"Accept": "application/json"},
+    )
 
-        if token_response.status_code != 200:
-            error_detail = token_response.text
-            print(f"[Auth] GitHub token exchange failed: {token_response.status_code} - {error_detail}")
-            raise HTTPException(status_code=500, detail=f"Failed to exchange code for token: {error_detail}")
-
-        token_data = token_response.json()
-        github_token = token_data.get("access_token")
-
-        if not github_token:
-            print(f"[Auth] No access_token in response: {token_data}")
-            # Check if there's an error in the response
-            if "error" in token_data:
-                raise HTTPException(status_code=500, detail=f"GitHub OAuth error: {token_data.get('error_description', token_data['error'])}")
-            raise HTTPException(status_code=500, detail="Failed to get GitHub access token")
-
-        # Get GitHub user info
-        user_response = await client.get(
-            "https://api.github.com/user",
-            headers={"Authorization": f"Bearer {github_token}"},
-        )
+    if token_response.status_code != 200:
+        error_detail = token_response.text
+        print(f"[Auth] GitHub token exchange failed: {token_response.status_code} - {error_detail}")
+        raise HTTPException(status_code=500, detail=f"Failed to exchange code for token: {error_detail}")
+
+    token_data = token_response.json()
+    github_token = token_data.get("access_token")
+
+    if not github_token:
+        print(f"[Auth] No access_token in response: {token_data}")
+        # Check if there's an error in the response
+        if "error" in token_data:
+            raise HTTPException(status_code=500, detail=f"GitHub OAuth error: {token_data.get('error_description', token_data['error'])}")
+        raise HTTPException(status_code=500, detail="Failed to get GitHub access token")
+
+    # Get GitHub user info
+    user_response = await client.get(
+        "https://api.github.com/user",
+        headers={"Authorization": f"Bearer {github_token}"},
+    )
 
-        if user_response.status_code != 200:
-            error_detail = user_response.text
-            print(f"[Auth] GitHub user API failed: {user_response.status_code} - {error_detail}")
-            raise HTTPException(status_code=500, detail=f"Failed to get GitHub user info: {error_detail}")
-
-        github_user_data = user_response.json()
-        github_user = GitHubUser(
-            login=github_user_data["login"],
-            id=github_user_data["id"],
-            avatar_url=github_user_data["avatar_url"],
-            name=github_user_data.get("name"),
-            email=github_user_data.get("email"),
-        )
+    if user_response.status_code != 200:
+        error_detail = user_response.text
+        print(f"[Auth] GitHub user API failed: {user_response.status_code} - {error_detail}")
+        raise HTTPException(status_code=500, detail=f"Failed to get GitHub user info: {error_detail}")
+
+    github_user_data = user_response.json()
+    github_user = GitHubUser(
+        login=github_user_data["login"],
+        id=github_user_data["id"],
+        avatar_url=github_user_data["avatar_url"],
+        name=github_user_data.get("name"),
+        email=github_user_data.get("email"),
+    )
 
     # Create or login Matrix account
     matrix_credentials = await create_matrix_account(
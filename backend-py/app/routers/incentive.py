@@ -1,21 +1,29 @@
 """Incentive system API routes."""
 
-from fastapi import APIRouter, Depends, HTTPException
+import codecs
+import csv
+import json
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import and_, func, or_, select, text, update
 from sqlalchemy.dialects.postgresql import insert
+from datetime import date
 from typing import Optional
 
 from ..database import get_db
 from ..models.incentive import (
     Campaign, Activity, Task, TaskClaim, UserPoints, Prize, PrizeRedemption, PrizeKey
 )
+from ..services.points_ledger import points_ledger, ENTRY_ADJUST, ENTRY_EARN, ENTRY_REFUND
+from ..services.leaderboard import leaderboard_service, scope_key, SCOPE_GLOBAL
 from ..models.schemas import (
     CampaignResponse, CampaignListResponse, ActivityResponse, TaskResponse,
     TaskClaimRequest, TaskClaimResponse, UserPointsResponse,
     PrizeResponse, PrizeRedeemRequest, PrizeRedeemResponse,
     CampaignCreate, ActivityCreate, TaskCreate, PrizeCreate,
-    PrizeKeyCreate, PrizeKeyResponse, PrizeKeyListResponse
+    PrizeKeyCreate, PrizeKeyResponse, PrizeKeyListResponse,
+    PointsLedgerEntryResponse, PointsAdjustRequest, LeaderboardResponse
 )
 
 router = APIRouter(tags=["incentive"])
@@ -27,7 +35,11 @@ async def get_campaigns(
     user_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取组织的所有活动计划，按类型分组返回"""
+    """获取组织的所有活动计划，按类型分组返回
+
+    整棵 Campaign → Activity → Task 树以及用户的已完成记录固定用 4 次查询取回，
+    与树的大小无关。
+    """
     
     # 获取所有活动的 campaigns
     result = await db.execute(
@@ -37,44 +49,61 @@ async def get_campaigns(
     )
     campaigns = result.scalars().all()
     
+    if not campaigns:
+        return CampaignListResponse(permanent=[], limited=[])
+    
+    # 一次性获取所有 activities
+    activities_result = await db.execute(
+        select(Activity)
+        .where(
+            Activity.campaign_id.in_([c.id for c in campaigns]),
+            Activity.is_active == True
+        )
+        .order_by(Activity.order_index, Activity.id)
+    )
+    activities = activities_result.scalars().all()
+    
+    activities_by_campaign: dict[int, list[Activity]] = {}
+    for activity in activities:
+        activities_by_campaign.setdefault(activity.campaign_id, []).append(activity)
+    
+    # 一次性获取所有 tasks
+    tasks_by_activity: dict[int, list[Task]] = {}
+    if activities:
+        tasks_result = await db.execute(
+            select(Task)
+            .where(
+                Task.activity_id.in_([a.id for a in activities]),
+                Task.is_active == True
+            )
+            .order_by(Task.order_index, Task.id)
+        )
+        for task in tasks_result.scalars().all():
+            tasks_by_activity.setdefault(task.activity_id, []).append(task)
+    
+    # 一次性获取用户已完成的任务
+    claimed_task_ids: set[int] = set()
+    all_task_ids = [t.id for tasks in tasks_by_activity.values() for t in tasks]
+    if user_id and all_task_ids:
+        claims_result = await db.execute(
+            select(TaskClaim.task_id)
+            .where(
+                TaskClaim.task_id.in_(all_task_ids),
+                TaskClaim.user_id == user_id,
+                TaskClaim.status == 'approved'
+            )
+            .distinct()
+        )
+        claimed_task_ids = set(claims_result.scalars().all())
+    
     permanent = []
     limited = []
     
     for campaign in campaigns:
-        # 获取 activities
-        activities_result = await db.execute(
-            select(Activity)
-            .where(Activity.campaign_id == campaign.id, Activity.is_active == True)
-            .order_by(Activity.order_index)
-        )
-        activities = activities_result.scalars().all()
-        
         activity_list = []
-        for activity in activities:
-            # 获取 tasks
-            tasks_result = await db.execute(
-                select(Task)
-                .where(Task.activity_id == activity.id, Task.is_active == True)
-                .order_by(Task.order_index)
-            )
-            tasks = tasks_result.scalars().all()
-            
-            task_list = []
-            for task in tasks:
-                # 检查用户是否已完成
-                user_claimed = False
-                if user_id:
-                    claim_result = await db.execute(
-                        select(TaskClaim)
-                        .where(
-                            TaskClaim.task_id == task.id,
-                            TaskClaim.user_id == user_id,
-                            TaskClaim.status == 'approved'
-                        )
-                    )
-                    user_claimed = claim_result.scalar_one_or_none() is not None
-                
-                task_list.append(TaskResponse(
+        for activity in activities_by_campaign.get(campaign.id, []):
+            task_list = [
+                TaskResponse(
                     id=task.id,
                     title=task.title,
                     description=task.description,
@@ -84,10 +113,12 @@ async def get_campaigns(
                     stock_limit=task.stock_limit,
                     claimed_count=task.claimed_count or 0,
                     is_active=task.is_active,
-                    user_claimed=user_claimed,
+                    user_claimed=task.id in claimed_task_ids,
                     chat_room_id=task.chat_room_id,
                     chat_required=task.chat_required or False
-                ))
+                )
+                for task in tasks_by_activity.get(activity.id, [])
+            ]
             
             activity_list.append(ActivityResponse(
                 id=activity.id,
@@ -127,81 +158,76 @@ async def claim_task(
     request: TaskClaimRequest = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """用户领取/完成任务"""
+    """用户领取/完成任务 (重复领取和名额都由原子语句保证, 不做先读后写的检查)"""
     
-    # 获取任务信息
+    # 获取任务信息及所属组织
     task_result = await db.execute(
-        select(Task).where(Task.id == task_id)
+        select(Task, Campaign.org_id, Campaign.id)
+        .join(Activity, Activity.id == Task.activity_id)
+        .join(Campaign, Campaign.id == Activity.campaign_id)
+        .where(Task.id == task_id)
     )
-    task = task_result.scalar_one_or_none()
+    row = task_result.one_or_none()
     
-    if not task:
+    if not row:
         raise HTTPException(status_code=404, detail="Task not found")
+    task, org_id, campaign_id = row
     
     if not task.is_active:
         raise HTTPException(status_code=400, detail="Task is not active")
     
-    # 检查库存
-    if task.stock_limit and task.claimed_count >= task.stock_limit:
+    # 快速失败; 以下面的条件 UPDATE 为准
+    if task.stock_limit and (task.claimed_count or 0) >= task.stock_limit:
         raise HTTPException(status_code=400, detail="Task limit reached")
     
-    # 检查是否已完成 (对于 once 类型)
-    if task.recurrence == 'once':
-        existing = await db.execute(
-            select(TaskClaim).where(
-                TaskClaim.task_id == task_id,
-                TaskClaim.user_id == user_id,
-                TaskClaim.status == 'approved'
-            )
+    # 创建 claim 记录 (Demo 模式直接 approved); once 类型已领取过则不插入
+    recurrence = task.recurrence or 'once'
+    claim_result = await db.execute(
+        insert(TaskClaim)
+        .values(
+            user_id=user_id,
+            task_id=task_id,
+            status='approved',  # Demo 模式直接通过
+            recurrence=recurrence,
+            points_earned=task.points,
+            submission_data=request.submission_data if request else None
         )
-        if existing.scalar_one_or_none():
-            raise HTTPException(status_code=400, detail="Task already claimed")
-    
-    # 创建 claim 记录 (Demo 模式直接 approved)
-    claim = TaskClaim(
-        user_id=user_id,
-        task_id=task_id,
-        status='approved',  # Demo 模式直接通过
-        points_earned=task.points,
-        submission_data=request.submission_data if request else None
-    )
-    db.add(claim)
-    
-    # 更新任务完成计数
-    task.claimed_count = (task.claimed_count or 0) + 1
-    
-    # 获取活动的组织 ID
-    activity_result = await db.execute(
-        select(Activity).where(Activity.id == task.activity_id)
+        .on_conflict_do_nothing(
+            index_elements=[TaskClaim.user_id, TaskClaim.task_id],
+            index_where=text("status = 'approved' AND recurrence = 'once'")
+        )
+        .returning(TaskClaim)
     )
-    activity = activity_result.scalar_one()
-    
-    campaign_result = await db.execute(
-        select(Campaign).where(Campaign.id == activity.campaign_id)
+    claim = claim_result.scalar_one_or_none()
+    if claim is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Task already claimed")
+    
+    # 记积分流水并更新余额
+    await points_ledger.record(
+        db, user_id, org_id, ENTRY_EARN, task.points,
+        source_type='task_claim', source_id=claim.id, campaign_id=campaign_id
     )
-    campaign = campaign_result.scalar_one()
     
-    # 更新用户积分
-    points_result = await db.execute(
-        select(UserPoints).where(
-            UserPoints.user_id == user_id,
-            UserPoints.org_id == campaign.org_id
+    # 原子扣减名额, 名额已满时不更新任何行; 放在事务最后以缩短任务行锁的持有时间
+    counted = await db.execute(
+        update(Task)
+        .where(
+            Task.id == task_id,
+            Task.is_active.is_(True),
+            or_(
+                func.coalesce(Task.stock_limit, 0) == 0,
+                func.coalesce(Task.claimed_count, 0) < Task.stock_limit
+            )
         )
+        .values(claimed_count=func.coalesce(Task.claimed_count, 0) + 1)
+        .returning(Task.claimed_count)
     )
-    user_points = points_result.scalar_one_or_none()
-    
-    if user_points:
-        user_points.total_points += task.points
-    else:
-        user_points = UserPoints(
-            user_id=user_id,
-            org_id=campaign.org_id,
-            total_points=task.points
-        )
-        db.add(user_points)
+    if counted.scalar_one_or_none() is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Task limit reached")
     
     await db.commit()
-    await db.refresh(claim)
     
     return TaskClaimResponse(
         id=claim.id,
@@ -250,6 +276,84 @@ async def get_user_points(
     )
 
 
+@router.get("/{org_id}/points/history", response_model=list[PointsLedgerEntryResponse])
+async def get_points_history(
+    org_id: int,
+    user_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取用户在组织中的积分流水 (按时间倒序, 用 before_id 翻页)"""
+    
+    entries = await points_ledger.history(db, user_id, org_id, min(limit, 200), before_id)
+    return [
+        PointsLedgerEntryResponse(
+            id=entry.id,
+            entry_type=entry.entry_type,
+            amount=entry.amount,
+            campaign_id=entry.campaign_id,
+            source_type=entry.source_type,
+            source_id=entry.source_id,
+            note=entry.note,
+            created_at=entry.created_at
+        )
+        for entry in entries
+    ]
+
+
+@router.get("/{org_id}/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    org_id: int,
+    scope: str = SCOPE_GLOBAL,
+    campaign_id: Optional[int] = None,
+    week: Optional[date] = None,
+    limit: int = 20,
+    offset: int = 0,
+    user_id: Optional[int] = None
+):
+    """
+    获取组织排行榜
+
+    scope 为 global (总积分)、campaign (活动内积分, 需要 campaign_id) 或 weekly
+    (week 所在周获得的积分, 默认本周). 传入 user_id 时同时返回该用户的名次.
+    """
+    
+    try:
+        key = scope_key(scope, campaign_id, week)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await leaderboard_service.leaderboard(
+        org_id, scope, key, min(max(limit, 1), 100), max(offset, 0), user_id
+    )
+
+
+def _prize_response(prize: Prize, available_keys: int = 0) -> PrizeResponse:
+    """奖品响应; 密钥库奖品以可用密钥数判断是否可兑换, 领取数为密钥总数减可用数"""
+    if prize.use_key_pool:
+        is_available = available_keys > 0
+        claimed_count = max((prize.key_count or 0) - available_keys, 0)
+    else:
+        is_available = prize.stock is None or prize.stock > (prize.claimed_count or 0)
+        claimed_count = prize.claimed_count or 0
+    
+    return PrizeResponse(
+        id=prize.id,
+        name=prize.name,
+        description=prize.description,
+        image_url=prize.image_url,
+        type=prize.type,
+        points_required=prize.points_required,
+        stock=prize.stock,
+        claimed_count=claimed_count,
+        is_available=is_available,
+        use_key_pool=prize.use_key_pool or False,
+        available_keys=available_keys,
+        delivery_type=prize.delivery_type or 'manual'
+    )
+
+
 @router.get("/{org_id}/prizes", response_model=list[PrizeResponse])
 async def get_prizes(
     org_id: int,
@@ -257,42 +361,21 @@ async def get_prizes(
 ):
     """获取组织的奖品列表"""
     
+    # 一条分组查询同时统计各奖品的可用密钥数 (走未使用密钥的部分索引, 不加载密钥内容)
+    # 领取数由 Prize.key_count 减可用数得到, 不读取已使用的密钥
     result = await db.execute(
-        select(Prize)
+        select(Prize, func.count(PrizeKey.id).label("available_keys"))
+        .outerjoin(PrizeKey, and_(
+            PrizeKey.prize_id == Prize.id,
+            Prize.use_key_pool == True,
+            PrizeKey.is_used == False
+        ))
         .where(Prize.org_id == org_id, Prize.is_active == True)
+        .group_by(Prize.id)
         .order_by(Prize.points_required)
     )
-    prizes = result.scalars().all()
-    
-    prize_responses = []
-    for prize in prizes:
-        # 计算可用密钥数
-        available_keys = 0
-        if prize.use_key_pool:
-            keys_result = await db.execute(
-                select(PrizeKey).where(
-                    PrizeKey.prize_id == prize.id,
-                    PrizeKey.is_used == False
-                )
-            )
-            available_keys = len(keys_result.scalars().all())
-        
-        prize_responses.append(PrizeResponse(
-            id=prize.id,
-            name=prize.name,
-            description=prize.description,
-            image_url=prize.image_url,
-            type=prize.type,
-            points_required=prize.points_required,
-            stock=prize.stock,
-            claimed_count=prize.claimed_count or 0,
-            is_available=(prize.stock is None or prize.stock > (prize.claimed_count or 0)),
-            use_key_pool=prize.use_key_pool or False,
-            available_keys=available_keys,
-            delivery_type=prize.delivery_type or 'manual'
-        ))
     
-    return prize_responses
+    return [_prize_response(prize, available_keys) for prize, available_keys in result.all()]
 
 
 @router.post("/prize/{prize_id}/redeem", response_model=PrizeRedeemResponse)
@@ -316,62 +399,80 @@ async def redeem_prize(
     if not prize.is_active:
         raise HTTPException(status_code=400, detail="Prize is not available")
     
-    # 密钥库类型奖品：检查可用密钥
-    assigned_key = None
-    if prize.use_key_pool:
-        # 查找未使用的密钥
-        keys_result = await db.execute(
-            select(PrizeKey).where(
-                PrizeKey.prize_id == prize_id,
-                PrizeKey.is_used == False
-            ).limit(1)
-        )
-        assigned_key = keys_result.scalar_one_or_none()
-        
-        if not assigned_key:
-            raise HTTPException(status_code=400, detail="No available keys in pool")
-    else:
-        # 普通奖品：检查库存
-        if prize.stock is not None and (prize.claimed_count or 0) >= prize.stock:
-            raise HTTPException(status_code=400, detail="Prize out of stock")
-    
-    # 检查用户积分
-    points_result = await db.execute(
-        select(UserPoints).where(
-            UserPoints.user_id == user_id,
-            UserPoints.org_id == prize.org_id
-        )
-    )
-    user_points = points_result.scalar_one_or_none()
+    # 普通奖品：检查库存 (快速失败; 以下面的条件 UPDATE 为准)
+    if not prize.use_key_pool and prize.stock is not None and (prize.claimed_count or 0) >= prize.stock:
+        raise HTTPException(status_code=400, detail="Prize out of stock")
     
-    available = (user_points.total_points - (user_points.spent_points or 0)) if user_points else 0
-    
-    if available < prize.points_required:
-        raise HTTPException(status_code=400, detail="Insufficient points")
-    
-    # 创建兑换记录
+    # 创建兑换记录 (flush 后才有 id, 供密钥和积分流水关联)
     redemption = PrizeRedemption(
         user_id=user_id,
         prize_id=prize_id,
         points_spent=prize.points_required,
         status='completed' if prize.use_key_pool else 'pending',  # 密钥库直接完成
-        shipping_info=request.shipping_info if request else None,
-        assigned_key_id=assigned_key.id if assigned_key else None
+        shipping_info=request.shipping_info if request else None
     )
     db.add(redemption)
+    await db.flush()
     
-    # 如果是密钥库，标记密钥为已使用
-    if assigned_key:
-        assigned_key.is_used = True
-        assigned_key.used_by_user_id = user_id
-        assigned_key.used_at = func.now()
-        assigned_key.redemption_id = redemption.id
-    
-    # 更新用户积分
-    user_points.spent_points = (user_points.spent_points or 0) + prize.points_required
+    # 扣减积分 (余额检查与扣减是同一条条件 UPDATE)
+    spent = await points_ledger.spend(
+        db, user_id, prize.org_id, prize.points_required,
+        source_type='prize_redemption', source_id=redemption.id
+    )
+    if spent is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient points")
     
-    # 更新奖品领取计数
-    prize.claimed_count = (prize.claimed_count or 0) + 1
+    # 密钥库类型奖品：原子领取一个未使用的密钥
+    # SKIP LOCKED 跳过其他事务正在领取的密钥, 并发兑换各拿到不同的密钥且互不等待
+    assigned_key = None
+    if prize.use_key_pool:
+        next_key = (
+            select(PrizeKey.id)
+            .where(PrizeKey.prize_id == prize_id, PrizeKey.is_used == False)
+            .order_by(PrizeKey.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        key_result = await db.execute(
+            update(PrizeKey)
+            .where(PrizeKey.id == next_key)
+            .values(
+                is_used=True,
+                used_by_user_id=user_id,
+                used_at=func.now(),
+                redemption_id=redemption.id
+            )
+            .returning(PrizeKey)
+            .execution_options(synchronize_session=False)
+        )
+        assigned_key = key_result.scalar_one_or_none()
+        
+        if not assigned_key:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="No available keys in pool")
+        redemption.assigned_key_id = assigned_key.id
+    
+    # 普通奖品：更新领取计数并原子检查库存. 放在事务最后以缩短奖品行锁的持有时间
+    # 密钥库奖品不写奖品行 (领取数由 key_count 和未使用密钥数得出), 并发兑换只在各自的密钥行上加锁
+    if not prize.use_key_pool:
+        counted = await db.execute(
+            update(Prize)
+            .where(
+                Prize.id == prize_id,
+                or_(
+                    Prize.stock.is_(None),
+                    func.coalesce(Prize.claimed_count, 0) < Prize.stock
+                )
+            )
+            .values(claimed_count=func.coalesce(Prize.claimed_count, 0) + 1)
+            .returning(Prize.claimed_count)
+            .execution_options(synchronize_session=False)
+        )
+        if counted.scalar_one_or_none() is None:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Prize out of stock")
     
     await db.commit()
     await db.refresh(redemption)
@@ -730,6 +831,83 @@ async def delete_task(
 
 # ==================== 密钥库管理 API ====================
 
+# 每条 INSERT 的行数 (每行 4 个参数, 不超过 asyncpg 的 32767 参数上限)
+_KEY_INSERT_BATCH = 5000
+# 上传文件每次读取的字节数
+_UPLOAD_READ_SIZE = 1 << 20
+# CSV 表头中表示密钥列的名称
+_KEY_CSV_HEADERS = {"key", "key_value", "code", "voucher"}
+# 导入响应中最多列出的无效行号
+_MAX_REPORTED_LINES = 100
+
+
+def _check_key_type(key_type: str) -> None:
+    """key_type 超出列长度时返回 400, 而不是让整批 INSERT 以 DataError 失败"""
+    max_length = PrizeKey.key_type.type.length
+    if len(key_type) > max_length:
+        raise HTTPException(status_code=400, detail=f"key_type must be at most {max_length} characters")
+
+
+async def _insert_prize_keys(
+    db: AsyncSession,
+    prize_id: int,
+    keys: list[str],
+    key_type: str,
+    key_metadata: Optional[dict]
+) -> int:
+    """分批多行 INSERT ... ON CONFLICT DO NOTHING, 返回实际新增的密钥数"""
+    added = 0
+    for start in range(0, len(keys), _KEY_INSERT_BATCH):
+        result = await db.execute(
+            insert(PrizeKey)
+            .values([
+                {
+                    "prize_id": prize_id,
+                    "key_value": key_value,
+                    "key_type": key_type,
+                    "key_metadata": key_metadata
+                }
+                for key_value in keys[start:start + _KEY_INSERT_BATCH]
+            ])
+            .on_conflict_do_nothing(index_elements=[PrizeKey.prize_id, PrizeKey.key_value])
+            .returning(PrizeKey.id)
+        )
+        added += len(result.fetchall())
+    return added
+
+
+async def _iter_upload_keys(file: UploadFile):
+    """逐行读取上传的 CSV (取第一列) 或每行一个密钥的文本文件, 产出 (行号, 密钥)"""
+    is_csv = (file.filename or "").lower().endswith(".csv") or file.content_type == "text/csv"
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    first_row = True
+    line_no = 0
+    while True:
+        chunk = await file.read(_UPLOAD_READ_SIZE)
+        text = buffer + decoder.decode(chunk, final=not chunk)
+        # 最后一行可能不完整, 留到下一块
+        if chunk:
+            text, _, buffer = text.rpartition("\n")
+        
+        for line in text.splitlines():
+            line_no += 1
+            if is_csv:
+                row = next(csv.reader([line]), None)
+                value = row[0].strip() if row else ""
+                if first_row and value.lower() in _KEY_CSV_HEADERS:
+                    first_row = False
+                    continue
+            else:
+                value = line.strip()
+            first_row = False
+            if value:
+                yield line_no, value
+        
+        if not chunk:
+            return
+
+
 @router.post("/prize/{prize_id}/keys", response_model=dict)
 async def add_prize_keys(
     prize_id: int,
@@ -747,31 +925,23 @@ async def add_prize_keys(
     if not prize:
         raise HTTPException(status_code=404, detail="Prize not found")
     
-    # 批量创建密钥
-    added_count = 0
-    for key_value in request.keys:
-        # 检查密钥是否已存在
-        existing = await db.execute(
-            select(PrizeKey).where(
-                PrizeKey.prize_id == prize_id,
-                PrizeKey.key_value == key_value
+    # 先校验长度, 超长的值会让整批 INSERT 失败
+    _check_key_type(request.key_type)
+    max_length = PrizeKey.key_value.type.length
+    for index, key in enumerate(request.keys):
+        if len(key.strip()) > max_length:
+            raise HTTPException(
+                status_code=400, detail=f"keys[{index}] is longer than {max_length} characters"
             )
-        )
-        if existing.scalar_one_or_none():
-            continue  # 跳过重复密钥
-        
-        prize_key = PrizeKey(
-            prize_id=prize_id,
-            key_value=key_value,
-            key_type=request.key_type,
-            key_metadata=request.key_metadata
-        )
-        db.add(prize_key)
-        added_count += 1
     
-    # 更新奖品配置
+    # 去重后批量插入, 已存在的密钥由唯一索引跳过
+    keys = list(dict.fromkeys(key.strip() for key in request.keys if key.strip()))
+    added_count = await _insert_prize_keys(db, prize_id, keys, request.key_type, request.key_metadata)
+    
+    # 更新奖品配置; key_count 用 SQL 表达式累加, 并发导入不会丢失
     prize.use_key_pool = True
     prize.delivery_type = "key_pool"
+    prize.key_count = func.coalesce(Prize.key_count, 0) + added_count
     
     await db.commit()
     
@@ -782,34 +952,130 @@ async def add_prize_keys(
     }
 
 
+@router.post("/prize/{prize_id}/keys/import", response_model=dict)
+async def import_prize_keys(
+    prize_id: int,
+    file: UploadFile = File(...),
+    key_type: str = Form("voucher"),
+    key_metadata: Optional[str] = Form(None),  # JSON 字符串
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    从上传文件批量导入密钥
+
+    支持 CSV (取第一列, 可带表头) 或每行一个密钥的文本文件. 文件按块流式读取,
+    在内存中去重后分批插入, 与库中已有密钥重复的由唯一索引跳过. 整个导入在
+    一个事务中完成. 超长的密钥不导入, 行号在 invalid_lines 中返回.
+    """
+    
+    prize_result = await db.execute(
+        select(Prize).where(Prize.id == prize_id)
+    )
+    prize = prize_result.scalar_one_or_none()
+    
+    if not prize:
+        raise HTTPException(status_code=404, detail="Prize not found")
+    
+    _check_key_type(key_type)
+    metadata = None
+    if key_metadata:
+        try:
+            metadata = json.loads(key_metadata)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="key_metadata must be valid JSON")
+    
+    # 每行在插入前校验长度, 超长的行不进入批次, 不会让整批失败
+    max_length = PrizeKey.key_value.type.length
+    seen = set()
+    batch = []
+    invalid_lines = []
+    total = added_count = invalid = 0
+    try:
+        async for line_no, key_value in _iter_upload_keys(file):
+            total += 1
+            if len(key_value) > max_length:
+                invalid += 1
+                if len(invalid_lines) < _MAX_REPORTED_LINES:
+                    invalid_lines.append(line_no)
+                continue
+            if key_value in seen:
+                continue
+            seen.add(key_value)
+            batch.append(key_value)
+            if len(batch) >= _KEY_INSERT_BATCH:
+                added_count += await _insert_prize_keys(db, prize_id, batch, key_type, metadata)
+                batch = []
+    except UnicodeDecodeError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    added_count += await _insert_prize_keys(db, prize_id, batch, key_type, metadata)
+    
+    prize.use_key_pool = True
+    prize.delivery_type = "key_pool"
+    prize.key_count = func.coalesce(Prize.key_count, 0) + added_count
+    
+    await db.commit()
+    
+    return {
+        "message": f"Successfully added {added_count} keys",
+        "total_added": added_count,
+        "skipped": total - added_count - invalid,
+        "invalid": invalid,
+        "invalid_lines": invalid_lines
+    }
+
+
+async def _key_counts(db: AsyncSession, prize_id: int) -> tuple[int, int]:
+    """奖品密钥总数和已使用数 (COUNT ... FILTER, 不加载密钥)"""
+    result = await db.execute(
+        select(
+            func.count(PrizeKey.id),
+            func.count(PrizeKey.id).filter(PrizeKey.is_used == True)
+        ).where(PrizeKey.prize_id == prize_id)
+    )
+    total, used = result.one()
+    return total, used
+
+
 @router.get("/prize/{prize_id}/keys", response_model=PrizeKeyListResponse)
 async def get_prize_keys(
     prize_id: int,
     show_used: bool = True,
+    limit: int = 100,
+    cursor: Optional[int] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取奖品的密钥列表"""
+    """
+    获取奖品的密钥列表
+
+    按创建顺序倒序分页, 传入上一页返回的 next_cursor 获取下一页;
+    total / used / available 始终是整个密钥库的统计.
+    """
+    
+    limit = min(max(limit, 1), 1000)
     
     # 构建查询
     query = select(PrizeKey).where(PrizeKey.prize_id == prize_id)
     
     if not show_used:
         query = query.where(PrizeKey.is_used == False)
+    if cursor is not None:
+        query = query.where(PrizeKey.id < cursor)
     
-    query = query.order_by(PrizeKey.created_at.desc())
-    
-    result = await db.execute(query)
+    # 多取一条判断是否还有下一页
+    result = await db.execute(query.order_by(PrizeKey.id.desc()).limit(limit + 1))
     keys = result.scalars().all()
+    next_cursor = keys[limit - 1].id if len(keys) > limit else None
+    keys = keys[:limit]
     
     # 统计信息
-    total = len(keys)
-    used = sum(1 for k in keys if k.is_used)
-    available = total - used
+    total, used = await _key_counts(db, prize_id)
     
     return PrizeKeyListResponse(
         total=total,
         used=used,
-        available=available,
+        available=total - used,
+        next_cursor=next_cursor,
         keys=[PrizeKeyResponse(
             id=k.id,
             prize_id=k.prize_id,
@@ -843,59 +1109,16 @@ async def delete_prize_key(
         raise HTTPException(status_code=400, detail="Cannot delete used key")
     
     await db.delete(key)
+    await db.execute(
+        update(Prize)
+        .where(Prize.id == key.prize_id)
+        .values(key_count=func.greatest(func.coalesce(Prize.key_count, 0) - 1, 0))
+    )
     await db.commit()
     
     return {"message": "Key deleted successfully"}
 
 
-@router.get("/{org_id}/prizes", response_model=list[PrizeResponse])
-async def get_prizes(
-    org_id: int,
-    db: AsyncSession = Depends(get_db)
-):
-    """获取组织的奖品列表（更新：包含密钥库信息）"""
-    
-    result = await db.execute(
-        select(Prize).where(Prize.org_id == org_id, Prize.is_active == True)
-    )
-    prizes = result.scalars().all()
-    
-    prize_list = []
-    for prize in prizes:
-        # 计算可用库存
-        is_available = True
-        available_keys = 0
-        
-        if prize.use_key_pool:
-            # 统计可用密钥数量
-            keys_result = await db.execute(
-                select(PrizeKey).where(
-                    PrizeKey.prize_id == prize.id,
-                    PrizeKey.is_used == False
-                )
-            )
-            available_keys = len(keys_result.scalars().all())
-            is_available = available_keys > 0
-        elif prize.stock:
-            is_available = prize.claimed_count < prize.stock
-        
-        prize_list.append(PrizeResponse(
-            id=prize.id,
-            name=prize.name,
-            description=prize.description,
-            image_url=prize.image_url,
-            type=prize.type,
-            points_required=prize.points_required,
-            stock=prize.stock,
-            claimed_count=prize.claimed_count,
-            is_available=is_available,
-            use_key_pool=prize.use_key_pool,
-            available_keys=available_keys,
-            delivery_type=prize.delivery_type
-        ))
-    
-    return prize_list
-
 @router.put("/prize/{prize_id}", response_model=PrizeResponse)
 async def update_prize(
     prize_id: int,
@@ -922,28 +1145,10 @@ async def update_prize(
     # 计算可用密钥数
     available_keys = 0
     if db_prize.use_key_pool:
-        keys_result = await db.execute(
-            select(PrizeKey).where(
-                PrizeKey.prize_id == prize_id,
-                PrizeKey.is_used == False
-            )
-        )
-        available_keys = len(keys_result.scalars().all())
+        total, used = await _key_counts(db, prize_id)
+        available_keys = total - used
     
-    return PrizeResponse(
-        id=db_prize.id,
-        name=db_prize.name,
-        description=db_prize.description,
-        image_url=db_prize.image_url,
-        type=db_prize.type,
-        points_required=db_prize.points_required,
-        stock=db_prize.stock,
-        claimed_count=db_prize.claimed_count,
-        is_available=True,
-        use_key_pool=db_prize.use_key_pool or False,
-        available_keys=available_keys,
-        delivery_type=db_prize.delivery_type or 'manual'
-    )
+    return _prize_response(db_prize, available_keys)
 
 
 @router.delete("/prize/{prize_id}")
@@ -966,3 +1171,110 @@ async def delete_prize(
     await db.commit()
     
     return {"message": "Prize deleted successfully"}
+
+
+@router.post("/{org_id}/points/adjust", response_model=PointsLedgerEntryResponse)
+async def adjust_points(
+    org_id: int,
+    request: PointsAdjustRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """管理员调整用户积分 (记一笔 adjust 流水)"""
+    
+    if request.amount == 0:
+        raise HTTPException(status_code=400, detail="Amount must not be zero")
+    
+    entry = await points_ledger.record(
+        db, request.user_id, org_id, ENTRY_ADJUST, request.amount,
+        source_type='admin', note=request.note
+    )
+    await db.commit()
+    
+    return PointsLedgerEntryResponse(
+        id=entry.id,
+        entry_type=entry.entry_type,
+        amount=entry.amount,
+        source_type=entry.source_type,
+        note=entry.note,
+        created_at=entry.created_at
+    )
+
+
+@router.post("/redemption/{redemption_id}/cancel")
+async def cancel_redemption(
+    redemption_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """取消兑换并退回积分 (密钥已发放给用户的兑换不能取消)"""
+    
+    # 条件更新, 并发取消只有一个能成功
+    result = await db.execute(
+        update(PrizeRedemption)
+        .where(
+            PrizeRedemption.id == redemption_id,
+            PrizeRedemption.status != 'cancelled',
+            PrizeRedemption.assigned_key_id.is_(None)
+        )
+        .values(status='cancelled')
+        .returning(PrizeRedemption.user_id, PrizeRedemption.prize_id, PrizeRedemption.points_spent)
+    )
+    redemption = result.one_or_none()
+    
+    if not redemption:
+        existing = await db.get(PrizeRedemption, redemption_id)
+        if existing is not None and existing.assigned_key_id is not None:
+            raise HTTPException(status_code=400, detail="Redemption with a delivered key cannot be cancelled")
+        raise HTTPException(status_code=404, detail="Redemption not found or already cancelled")
+    
+    # 能取消的都是普通奖品的兑换 (密钥库兑换都已分配密钥, 上面已拒绝)
+    prize_result = await db.execute(
+        update(Prize)
+        .where(Prize.id == redemption.prize_id)
+        .values(claimed_count=func.greatest(func.coalesce(Prize.claimed_count, 0) - 1, 0))
+        .returning(Prize.org_id)
+    )
+    org_id = prize_result.scalar_one()
+    
+    await points_ledger.record(
+        db, redemption.user_id, org_id, ENTRY_REFUND, redemption.points_spent,
+        source_type='prize_redemption', source_id=redemption_id
+    )
+    await db.commit()
+    
+    return {"message": "Redemption cancelled", "points_refunded": redemption.points_spent}
+
+
+@router.post("/{org_id}/points/rebuild")
+async def rebuild_points(
+    org_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """由积分流水重算组织内的用户余额"""
+    
+    users = await points_ledger.rebuild_balances(db, org_id)
+    await db.commit()
+    leaderboard_service.invalidate(org_id)
+    
+    return {"message": "Balances rebuilt", "users": users}
+
+
+@router.post("/{org_id}/leaderboard/snapshot")
+async def create_leaderboard_snapshot(
+    org_id: int,
+    scope: str = SCOPE_GLOBAL,
+    campaign_id: Optional[int] = None,
+    week: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """生成排行榜快照 (可定时调用), 之后榜单的 previous_rank 以此为准"""
+    
+    try:
+        key = scope_key(scope, campaign_id, week)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    participants = await leaderboard_service.snapshot(db, org_id, scope, key)
+    await db.commit()
+    leaderboard_service.invalidate(org_id)
+    
+    return {"message": "Snapshot created", "scope": scope, "scope_key": key, "participants": participants}
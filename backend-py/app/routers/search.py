@@ -3,11 +3,12 @@
 from fastapi import APIRouter, HTTPException
 from typing import Optional, List
 from pydantic import BaseModel
-import httpx
 
 from ..models.schemas import SearchRequest, SearchResponse, SearchResult
 from ..services.web_search import web_search_service
 from ..services.llm_service import llm_service
+from ..services.http_clients import http_clients
+from ..services.streaming import sse_response, stream_answer_events
 from ..database import async_session, Organization
 from ..config import get_settings
 from sqlalchemy import select, or_
@@ -15,14 +16,10 @@ from sqlalchemy import select, or_
 router = APIRouter(prefix="/search", tags=["search"])
 
 
-@router.post("/", response_model=SearchResponse)
-async def search(request: SearchRequest):
-    """Search the web and get AI-generated answer."""
-    if not request.query or not isinstance(request.query, str):
-        return SearchResponse(answer="Query is required", results=[])
-
+async def _search_results(query: str) -> tuple[list[SearchResult], str]:
+    """Search results for a query and the context string built from them."""
     # Get web search results
-    web_results = await web_search_service.search(request.query)
+    web_results = await web_search_service.search(query)
 
     # TODO: Add platform search results
     platform_results: list[SearchResult] = []
@@ -33,11 +30,44 @@ async def search(request: SearchRequest):
     context = "\n".join(
         [f"[{r.source.upper()}] {r.title}: {r.snippet}" for r in all_results]
     )
+    return all_results, context
+
+
+@router.post("/", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    """Search the web and get AI-generated answer."""
+    if not request.query or not isinstance(request.query, str):
+        return SearchResponse(answer="Query is required", results=[])
+
+    all_results, context = await _search_results(request.query)
 
     # Get AI answer
-    ai_answer = await llm_service.generate_answer(request.query, context)
+    ai_answer, cache_status = await llm_service.generate_answer(request.query, context)
 
-    return SearchResponse(answer=ai_answer, results=all_results)
+    return SearchResponse(answer=ai_answer, results=all_results, cache_status=cache_status)
+
+
+@router.post("/stream")
+async def search_stream(request: SearchRequest):
+    """
+    Streaming variant of search over Server-Sent Events.
+
+    Emits the search results as a ``sources`` event, then ``token`` events
+    for the AI answer, then ``done``.
+    """
+    if not request.query or not isinstance(request.query, str):
+        raise HTTPException(status_code=400, detail="Query is required")
+
+    all_results, context = await _search_results(request.query)
+
+    tokens, cache_status = await llm_service.stream_answer(request.query, context)
+    return sse_response(stream_answer_events(
+        {
+            "results": [r.model_dump(mode="json") for r in all_results],
+            "cache_status": cache_status,
+        },
+        tokens,
+    ))
 
 
 class MatrixServer(BaseModel):
@@ -129,55 +159,56 @@ async def search_matrix_communities(request: MatrixSearchRequest):
     settings = get_settings()
     try:
         # Search Matrix room directory for public spaces using GET (no auth needed)
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # Use GET method which works without authentication
-            params = {"limit": 50}
-            if request.query:
-                params["filter"] = f'{{"generic_search_term": "{request.query}"}}'
-            
-            response = await client.get(
-                f"{settings.matrix_homeserver_url}/_matrix/client/v3/publicRooms",
-                params=params
-            )
-            
-            print(f"Matrix API response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                rooms = data.get("chunk", [])
-                print(f"Found {len(rooms)} Matrix rooms")
-                
-                for room in rooms:
-                    # Filter by query if provided
-                    room_name = room.get("name", "")
-                    room_topic = room.get("topic", "")
-                    room_alias = room.get("canonical_alias", "")
-                    
-                    # Check if search terms match (case insensitive)
-                    if search_terms:
-                        query_match = (
-                            search_terms.lower() in room_name.lower() or
-                            search_terms.lower() in room_topic.lower() or
-                            search_terms.lower() in room_alias.lower()
-                        )
-                    else:
-                        query_match = True
-                    
-                    if query_match:
-                        all_servers.append(MatrixServer(
-                            id=room["room_id"],
-                            name=room.get("name", "Unnamed Room"),
-                            description=room.get("topic", "Matrix community space") or f"Matrix space: {room.get('canonical_alias', 'No description')}",
-                            homeserver=settings.matrix_server_name,
-                            members_count=room.get("num_joined_members", 0),
-                            rooms_count=1,
-                            category="Matrix Space" if room.get("room_type") == "m.space" else "Matrix Room",
-                            is_public=room.get("world_readable", False) or room.get("join_rule") == "public",
-                            avatar_url=room.get("avatar_url"),
-                            source="matrix",
-                            room_id=room["room_id"],
-                            space_id=room["room_id"] if room.get("room_type") == "m.space" else None
-                        ))
+        client = http_clients.get("synapse")
+        # Use GET method which works without authentication
+        params = {"limit": 50}
+        if request.query:
+            params["filter"] = f'{{"generic_search_term": "{request.query}"}}'
+
+        response = await client.get(
+            f"{settings.matrix_homeserver_url}/_matrix/client/v3/publicRooms",
+            params=params,
+            timeout=5.0,
+        )
+
+        print(f"Matrix API response status: {response.status_code}")
+
+        if response.status_code == 200:
+            data = response.json()
+            rooms = data.get("chunk", [])
+            print(f"Found {len(rooms)} Matrix rooms")
+
+            for room in rooms:
+                # Filter by query if provided
+                room_name = room.get("name", "")
+                room_topic = room.get("topic", "")
+                room_alias = room.get("canonical_alias", "")
+
+                # Check if search terms match (case insensitive)
+                if search_terms:
+                    query_match = (
+                        search_terms.lower() in room_name.lower() or
+                        search_terms.lower() in room_topic.lower() or
+                        search_terms.lower() in room_alias.lower()
+                    )
+                else:
+                    query_match = True
+
+                if query_match:
+                    all_servers.append(MatrixServer(
+                        id=room["room_id"],
+                        name=room.get("name", "Unnamed Room"),
+                        description=room.get("topic", "Matrix community space") or f"Matrix space: {room.get('canonical_alias', 'No description')}",
+                        homeserver=settings.matrix_server_name,
+                        members_count=room.get("num_joined_members", 0),
+                        rooms_count=1,
+                        category="Matrix Space" if room.get("room_type") == "m.space" else "Matrix Room",
+                        is_public=room.get("world_readable", False) or room.get("join_rule") == "public",
+                        avatar_url=room.get("avatar_url"),
+                        source="matrix",
+                        room_id=room["room_id"],
+                        space_id=room["room_id"] if room.get("room_type") == "m.space" else None
+                    ))
     except Exception as e:
         print(f"Matrix public rooms search failed: {e}")
         import traceback
@@ -307,7 +338,7 @@ Provide a helpful, conversational response about these communities in 2-3 senten
 Mention which are real organizations, Matrix spaces, or curated communities."""
     
     try:
-        ai_answer = await llm_service.generate_answer(request.query, full_context)
+        ai_answer, _ = await llm_service.generate_answer(request.query, full_context)
     except Exception as e:
         print(f"AI generation failed: {e}")
         # Fallback answer
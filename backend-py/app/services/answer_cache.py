@@ -0,0 +1,165 @@
+"""In-process cache of LLM answers with an optional semantic-similarity tier."""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Cache status values reported to API clients
+CACHE_HIT = "hit"
+CACHE_SEMANTIC_HIT = "semantic_hit"
+CACHE_MISS = "miss"
+CACHE_DISABLED = "disabled"
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    LLM answer cache keyed by (kind, model, prompt hash, context fingerprint).
+
+    ``kind`` separates the different prompt templates (search answer vs room
+    chat). The prompt hash covers the user's question and conversation history;
+    the context fingerprint covers the retrieved context, so an answer is only
+    reused when it was grounded in exactly the same material.
+
+    The optional semantic tier matches a differently worded question against
+    cached answers for the same context by cosine similarity of the query
+    embeddings, using the embedding RAG already computed for retrieval.
+    Entries expire after ``ttl_seconds`` and the least recently used entries
+    are evicted beyond ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        semantic: bool = False,
+        semantic_threshold: float = 0.95,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        # key -> (answer, monotonic expiry, bucket)
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        # bucket (kind, model, context) -> {key: unit query vector}
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _keys(kind: str, model: str, prompt, context: str) -> Tuple[str, str]:
+        context_fingerprint = _digest(context)
+        bucket = _digest([kind, model, context_fingerprint])
+        return _digest([bucket, _digest(prompt)]), bucket
+
+    @staticmethod
+    def _unit(query_embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        if not query_embedding:
+            return None
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _evict(self, key: str) -> None:
+        _, _, bucket = self._entries.pop(key)
+        vectors = self._vectors.get(bucket)
+        if vectors is not None:
+            vectors.pop(key, None)
+            if not vectors:
+                del self._vectors[bucket]
+
+    def get(
+        self,
+        kind: str,
+        model: str,
+        prompt,
+        context: str,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Tuple[Optional[str], str]:
+        """Look up an answer. Returns (answer or None, cache status)."""
+        now = time.monotonic()
+        key, bucket = self._keys(kind, model, prompt, context)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], CACHE_HIT
+            self._evict(key)
+
+        query = self._unit(query_embedding) if self.semantic else None
+        if query is not None and bucket in self._vectors:
+            best_key, best_score = None, self.semantic_threshold
+            for candidate, vector in list(self._vectors[bucket].items()):
+                if self._entries[candidate][1] <= now:
+                    self._evict(candidate)
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._entries[best_key][0], CACHE_SEMANTIC_HIT
+
+        self.misses += 1
+        return None, CACHE_MISS
+
+    def put(
+        self,
+        kind: str,
+        model: str,
+        prompt,
+        context: str,
+        answer: str,
+        query_embedding: Optional[List[float]] = None,
+    ) -> None:
+        """Cache a freshly generated answer."""
+        key, bucket = self._keys(kind, model, prompt, context)
+        if key in self._entries:
+            self._evict(key)
+
+        self._entries[key] = (answer, time.monotonic() + self.ttl_seconds, bucket)
+        query = self._unit(query_embedding) if self.semantic else None
+        if query is not None:
+            self._vectors.setdefault(bucket, {})[key] = query
+
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        """Hit/miss counters."""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic": self.semantic,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+answer_cache = AnswerCache(
+    max_entries=settings.llm_cache_max_entries,
+    ttl_seconds=settings.llm_cache_ttl_seconds,
+    semantic=settings.llm_semantic_cache_enabled,
+    semantic_threshold=settings.llm_semantic_cache_threshold,
+)
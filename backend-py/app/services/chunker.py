@@ -0,0 +1,69 @@
+"""Text chunking rules for the RAG indexing pipeline."""
+
+import re
+from typing import List, Optional
+
+from ..config import get_settings
+from ..models.schemas import ChatMessageSource
+
+settings = get_settings()
+
+# Row kinds in chat_message_embeddings
+KIND_MESSAGE = "message"  # one Matrix message (first chunk's vector if it was split)
+KIND_CHUNK = "chunk"      # further chunks of a long message, event_id "<event_id>#<n>"
+KIND_THREAD = "thread"    # a thread or reply chain, event_id "thread:<root event_id>[:<segment>]"
+KIND_WINDOW = "window"    # unthreaded messages in a time bucket, event_id "window:<room>:<bucket>[:<segment>]"
+CONVERSATION_KINDS = (KIND_THREAD, KIND_WINDOW)  # transcripts of several messages and senders
+
+_NON_WORD = re.compile(r"\W+")
+
+
+# Acknowledgements that carry no content of their own
+_FILLER = {
+    "thanks", "thank you", "thanks a lot", "thx", "ty", "ok", "okay", "k", "kk", "yes", "no",
+    "yep", "nope", "sure", "lol", "nice", "cool", "great", "done", "got it", "agreed",
+    "谢谢", "多谢", "感谢", "好的", "好", "收到", "嗯", "嗯嗯", "哈哈", "可以", "对", "是的",
+}
+
+
+def is_trivial(text: str) -> bool:
+    """Whether a message is too short to be worth a vector of its own ("+1", "thanks")."""
+    normalised = _NON_WORD.sub(" ", text.lower()).strip()
+    return len(normalised.replace(" ", "")) < settings.rag_chunk_min_chars or normalised in _FILLER
+
+
+def split_text(text: str, max_chars: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+    """
+    Split a long text into overlapping chunks of at most ``max_chars``.
+
+    Chunks end at a line break or space where one is close to the limit, so
+    log lines and words are not cut in half.
+    """
+    max_chars = max_chars or settings.rag_chunk_max_chars
+    overlap = settings.rag_chunk_overlap_chars if overlap is None else overlap
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            floor = start + max_chars // 2
+            cut = text.rfind("\n", floor, end)
+            if cut <= floor:
+                cut = text.rfind(" ", floor, end)
+            if cut > floor:
+                end = cut
+        chunks.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def conversation_text(messages: List[ChatMessageSource], max_chars: Optional[int] = None) -> str:
+    """Transcript of time-ordered messages for a thread or window embedding."""
+    max_chars = max_chars or settings.rag_conversation_max_chars
+    text = "\n".join(f"{msg.sender}: {msg.content}" for msg in messages)
+    return text[:max_chars]
@@ -0,0 +1,186 @@
+"""Token-budgeted packing of retrieved chat messages into an LLM context."""
+
+import re
+from datetime import timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from ..config import get_settings
+from ..models.schemas import ChatMessageSource
+from .chunker import CONVERSATION_KINDS
+
+settings = get_settings()
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(settings.rag_tokenizer_encoding)
+    except Exception as e:
+        # The BPE file is downloaded on first use; estimate if that fails
+        print(f"[Context] Tokenizer unavailable, estimating tokens: {e}")
+        return None
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """Token count of a piece of text, cached per distinct text."""
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+_NON_WORD = re.compile(r"\W+")
+
+
+def _normalise(content: str) -> str:
+    return _NON_WORD.sub(" ", content.lower()).strip()
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(max(len(text) - 2, 1))}
+
+
+def _dedupe(messages: List[ChatMessageSource], threshold: float) -> List[ChatMessageSource]:
+    """Drop messages that are near-identical to a more relevant one."""
+    kept: List[Tuple[str, set, ChatMessageSource]] = []
+    for msg in messages:
+        normalised = _normalise(msg.content)
+        grams = _trigrams(normalised)
+        duplicate = False
+        for other, other_grams, _ in kept:
+            if normalised == other:
+                duplicate = True
+            elif min(len(grams), len(other_grams)) >= threshold * max(len(grams), len(other_grams)):
+                # Only compare messages of similar length
+                duplicate = len(grams & other_grams) / len(grams | other_grams) >= threshold
+            if duplicate:
+                break
+        if not duplicate:
+            kept.append((normalised, grams, msg))
+    return [msg for _, _, msg in kept]
+
+
+def _blocks(messages: List[ChatMessageSource], relevance: dict) -> List[dict]:
+    """
+    Group consecutive messages from the same sender in a room into one block.
+
+    Thread and window transcripts are blocks of their own, labelled with
+    their kind instead of a sender.
+    """
+    gap = timedelta(seconds=settings.rag_context_collapse_gap_seconds)
+    blocks: List[dict] = []
+    for msg in sorted(messages, key=lambda m: (m.room_id, m.timestamp)):
+        last = blocks[-1] if blocks else None
+        if (
+            last
+            and last["room_id"] == msg.room_id
+            and msg.kind not in CONVERSATION_KINDS
+            and last["sender"] == msg.sender
+            and last["messages"][-1].kind not in CONVERSATION_KINDS
+            and msg.timestamp - last["messages"][-1].timestamp <= gap
+        ):
+            last["messages"].append(msg)
+            last["lines"].append(f"  {msg.content}")
+            last["score"] = max(last["score"], relevance[id(msg)])
+        else:
+            label = msg.kind if msg.kind in CONVERSATION_KINDS else msg.sender
+            blocks.append({
+                "room_id": msg.room_id,
+                "sender": msg.sender,
+                "messages": [msg],
+                "lines": [f"[{label}] ({msg.timestamp.strftime('%Y-%m-%d %H:%M')}): {msg.content}"],
+                "score": relevance[id(msg)],
+            })
+
+    for block in blocks:
+        # One extra token per line for the newline joining it to the next
+        block["tokens"] = sum(count_tokens(line) + 1 for line in block["lines"])
+    return blocks
+
+
+def pack_context(
+    messages: List[ChatMessageSource],
+    max_tokens: int,
+    dedupe_threshold: Optional[float] = None,
+) -> Tuple[str, List[ChatMessageSource]]:
+    """
+    Pack the most useful messages into ``max_tokens`` tokens.
+
+    ``messages`` are expected in relevance order. Near-duplicates are removed,
+    consecutive messages from the same sender are collapsed under a single
+    header, and blocks are then chosen greedily by relevance per token; a block
+    that does not fit is skipped rather than ending the packing, so shorter
+    relevant messages further down still get in. Chosen blocks are emitted in
+    relevance order.
+
+    Returns (context_string, included_messages)
+    """
+    if not messages:
+        return "", []
+
+    threshold = settings.rag_context_dedupe_threshold if dedupe_threshold is None else dedupe_threshold
+    messages = _dedupe(messages, threshold)
+
+    # Retrieval scores are not comparable across retrievers, so rank position
+    # is the relevance signal
+    relevance = {id(msg): 1.0 / (rank + 1) for rank, msg in enumerate(messages)}
+    blocks = _blocks(messages, relevance)
+
+    return _select(blocks, max_tokens)
+
+
+def _select(blocks: List[dict], max_tokens: int) -> Tuple[str, List[ChatMessageSource]]:
+    """Greedy relevance-per-token knapsack over blocks, emitted in relevance order."""
+    chosen = []
+    used = 0
+    for block in sorted(blocks, key=lambda b: b["score"] / b["tokens"], reverse=True):
+        if used + block["tokens"] <= max_tokens:
+            chosen.append(block)
+            used += block["tokens"]
+
+    chosen.sort(key=lambda b: b["score"], reverse=True)
+    context = "\n".join(line for block in chosen for line in block["lines"])
+    included = [msg for block in chosen for msg in block["messages"]]
+    return context, included
+
+
+def pack_windows(
+    windows: List[List[ChatMessageSource]], max_tokens: int
+) -> Tuple[str, List[ChatMessageSource]]:
+    """
+    Pack neighbouring-message windows into ``max_tokens`` tokens.
+
+    ``windows`` are expected in relevance order, each a time-ordered run of
+    messages from one room. A window is packed whole (with same-sender
+    messages collapsed) or not at all, and windows are separated by a blank
+    line so the model can tell conversations apart.
+
+    Returns (context_string, included_messages)
+    """
+    items = []
+    for rank, window in enumerate(windows):
+        blocks = _blocks(window, {id(msg): 0.0 for msg in window})
+        items.append({
+            "lines": [line for block in blocks for line in block["lines"]] + [""],
+            "messages": [msg for block in blocks for msg in block["messages"]],
+            "tokens": sum(block["tokens"] for block in blocks) + 1,
+            "score": 1.0 / (rank + 1),
+        })
+
+    context, included = _select(items, max_tokens)
+    return context.rstrip("\n"), included
+
+
+def candidate_limit(max_tokens: int) -> int:
+    """How many messages to retrieve to fill a token budget."""
+    per_message = max(1, settings.rag_context_tokens_per_message)
+    return min(max(max_tokens // per_message, 10), 200)
@@ -0,0 +1,144 @@
+"""Content-addressed embedding cache with an in-process LRU and a Postgres tier."""
+
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from ..config import get_settings
+from ..database import async_session, EmbeddingCacheEntry
+
+settings = get_settings()
+
+
+def content_hash(text: str) -> str:
+    """Hash used as the cache key for a piece of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (model, sha256(text)).
+
+    Vectors are held as float32 arrays in memory (about 6 KB per 1536-d vector)
+    and as raw float32 bytes in the ``embedding_cache`` table.
+    """
+
+    def __init__(self, max_entries: int = 4096, persist: bool = True):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        # Observed cost of the embedding API, used to estimate savings
+        self._api_calls = 0
+        self._api_texts = 0
+        self._api_seconds = 0.0
+
+    def _remember(self, key: Tuple[str, str], vector: array) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, returning None for each miss."""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+
+        for i, text in enumerate(texts):
+            key = (model, content_hash(text))
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                results[i] = vector.tolist()
+            else:
+                pending.setdefault(key[1], []).append(i)
+
+        if pending and self.persist:
+            try:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.embedding)
+                        .where(
+                            EmbeddingCacheEntry.model == model,
+                            EmbeddingCacheEntry.content_hash.in_(list(pending)),
+                        )
+                    )
+                    for row in result:
+                        vector = array("f")
+                        vector.frombytes(row.embedding)
+                        self._remember((model, row.content_hash), vector)
+                        for i in pending.pop(row.content_hash, []):
+                            self.db_hits += 1
+                            results[i] = vector.tolist()
+            except Exception as e:
+                print(f"[EmbeddingCache] Error reading persistent cache: {e}")
+
+        self.misses += sum(len(indexes) for indexes in pending.values())
+        return results
+
+    async def put_many(
+        self, model: str, texts: List[str], embeddings: List[List[float]]
+    ) -> None:
+        """Add freshly computed embeddings to both tiers."""
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            digest = content_hash(text)
+            vector = array("f", embedding)
+            self._remember((model, digest), vector)
+            rows[digest] = {"model": model, "content_hash": digest, "embedding": vector.tobytes()}
+
+        if not rows or not self.persist:
+            return
+
+        try:
+            async with async_session() as session:
+                stmt = insert(EmbeddingCacheEntry).values(list(rows.values())).on_conflict_do_nothing(
+                    index_elements=[EmbeddingCacheEntry.model, EmbeddingCacheEntry.content_hash]
+                )
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            print(f"[EmbeddingCache] Error writing persistent cache: {e}")
+
+    def record_api_call(self, text_count: int, seconds: float) -> None:
+        """Record one embeddings API request so savings can be estimated."""
+        self._api_calls += 1
+        self._api_texts += text_count
+        self._api_seconds += seconds
+
+    def stats(self) -> dict:
+        """Hit/miss counters and estimated savings."""
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        seconds_per_call = self._api_seconds / self._api_calls if self._api_calls else 0.0
+        texts_per_call = self._api_texts / self._api_calls if self._api_calls else 1.0
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "api_calls": self._api_calls,
+            "api_texts": self._api_texts,
+            "avg_api_latency_ms": round(seconds_per_call * 1000, 1),
+            # Texts served from cache would otherwise have been embedded at the
+            # observed batch size and latency
+            "estimated_api_calls_saved": round(hits / max(texts_per_call, 1.0), 1),
+            "estimated_latency_saved_ms": round(hits / max(texts_per_call, 1.0) * seconds_per_call * 1000, 1),
+        }
+
+
+# Singleton instance
+embedding_cache = EmbeddingCache(
+    max_entries=settings.embedding_cache_max_entries,
+    persist=settings.embedding_cache_persist,
+)
@@ -0,0 +1,409 @@
+"""Memory-mapped, segment-based on-disk embedding store."""
+
+import asyncio
+import heapq
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..models.schemas import ChatMessageSource
+from .chunker import CONVERSATION_KINDS, KIND_MESSAGE
+
+
+class SegmentedEmbeddingStore:
+    """
+    Append-only embedding store for large room archives.
+
+    Vectors are written, L2-normalised, into fixed-capacity ``.npy`` segment
+    files that are only ever read through ``numpy.memmap``. A SQLite sidecar
+    maps every row to its (segment, offset) and to the message it came from
+    (room_id, event_id, sender, content, timestamp, kind, thread_id), so a
+    restarted worker can serve queries straight from disk. Searches page
+    vectors in block by block, which keeps resident memory flat regardless of
+    archive size.
+
+    Deleted messages are removed from the sidecar only; their vectors stay in
+    the segment as unreferenced rows, which searches skip while scanning.
+    Once more than ``compact_ratio`` of all rows are unreferenced, the live
+    rows are copied into fresh segments and the old segment files removed.
+    Each search reads the sidecar in a single snapshot and is repeated if a
+    compaction swapped the layout while it ran.
+    """
+
+    # Searches repeated because of concurrent compactions before taking the writer lock
+    SEARCH_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        root: str,
+        dimension: int,
+        dtype: str = "float16",
+        segment_rows: int = 65536,
+        block_rows: int = 8192,
+        compact_ratio: float = 0.25,
+    ):
+        self.root = root
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.segment_rows = segment_rows
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+
+        os.makedirs(os.path.join(root, "segments"), exist_ok=True)
+        self._manifest_path = os.path.join(root, "manifest.sqlite3")
+        # Writer connection, guarded by _lock; searches use per-thread readers
+        self._db = sqlite3.connect(self._manifest_path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                rows INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                row_id INTEGER PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                room_id TEXT NOT NULL,
+                event_id TEXT NOT NULL UNIQUE,
+                sender TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_vectors_room ON vectors (room_id, segment, offset);
+            CREATE INDEX IF NOT EXISTS ix_vectors_position ON vectors (segment, offset);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        # Columns added after the sidecar was first created
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(vectors)")}
+        if "kind" not in columns:
+            self._db.execute(f"ALTER TABLE vectors ADD COLUMN kind TEXT NOT NULL DEFAULT '{KIND_MESSAGE}'")
+        if "thread_id" not in columns:
+            self._db.execute("ALTER TABLE vectors ADD COLUMN thread_id TEXT")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._maps: Dict[int, np.memmap] = {}
+        # Bumped by every compaction, between its sidecar commit and the removal of the old files
+        self._generation = 0
+
+    def _reader(self) -> sqlite3.Connection:
+        reader = getattr(self._local, "db", None)
+        if reader is None:
+            reader = sqlite3.connect(self._manifest_path)
+            self._local.db = reader
+        return reader
+
+    # ----- segment files -----
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.root, "segments", f"segment-{segment_id:05d}.npy")
+
+    def _segment(self, segment_id: int, create: bool = False) -> Optional[np.memmap]:
+        """Map a segment file; None if it is gone (compacted away) unless ``create``."""
+        segment = self._maps.get(segment_id)
+        if segment is None:
+            path = self._segment_path(segment_id)
+            if os.path.exists(path):
+                segment = np.load(path, mmap_mode="r+")
+            elif create:
+                segment = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=self.dtype, shape=(self.segment_rows, self.dimension)
+                )
+            else:
+                return None
+            self._maps[segment_id] = segment
+        return segment
+
+    @staticmethod
+    def _segments(db: sqlite3.Connection) -> List[Tuple[int, int]]:
+        return db.execute("SELECT id, rows FROM segments ORDER BY id").fetchall()
+
+    # ----- writes -----
+
+    def _append(self, rows: List[dict], embeddings: List[List[float]]) -> int:
+        with self._lock:
+            event_ids = [row["event_id"] for row in rows]
+            existing = set()
+            for i in range(0, len(event_ids), 500):
+                chunk = event_ids[i:i + 500]
+                existing.update(
+                    r[0] for r in self._db.execute(
+                        f"SELECT event_id FROM vectors WHERE event_id IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+
+            fresh = [
+                (row, embedding) for row, embedding in zip(rows, embeddings)
+                if row["event_id"] not in existing
+            ]
+            if not fresh:
+                return 0
+
+            vectors = np.asarray([embedding for _, embedding in fresh], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+            segments = self._segments(self._db)
+            segment_id, used = segments[-1] if segments else (0, 0)
+            if not segments:
+                self._db.execute("INSERT INTO segments (id, rows) VALUES (0, 0)")
+
+            positions = self._place(vectors.astype(self.dtype), segment_id, used)
+            sidecar = [
+                (
+                    segment_id, offset, row["room_id"], row["event_id"], row["sender"],
+                    row["content"], row["timestamp"].isoformat(), row.get("kind") or KIND_MESSAGE,
+                    row.get("thread_id"),
+                )
+                for (row, _), (segment_id, offset) in zip(fresh, positions)
+            ]
+
+            # Rows become visible only once the sidecar commits, after the
+            # vectors themselves are on disk
+            self._db.executemany(
+                "INSERT INTO vectors "
+                "(segment, offset, room_id, event_id, sender, content, timestamp, kind, thread_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                sidecar,
+            )
+            self._db.commit()
+            return len(fresh)
+
+    def _place(self, vectors: np.ndarray, segment_id: int, used: int) -> List[Tuple[int, int]]:
+        """
+        Write vectors into segment ``segment_id`` from offset ``used`` on,
+        opening new segments as they fill up; returns each vector's (segment, offset).
+        """
+        positions: List[Tuple[int, int]] = []
+        written = 0
+        while written < len(vectors):
+            if used == self.segment_rows:
+                segment_id, used = segment_id + 1, 0
+                self._db.execute("INSERT INTO segments (id, rows) VALUES (?, 0)", (segment_id,))
+
+            take = min(self.segment_rows - used, len(vectors) - written)
+            segment = self._segment(segment_id, create=True)
+            segment[used:used + take] = vectors[written:written + take]
+            segment.flush()
+
+            positions.extend((segment_id, offset) for offset in range(used, used + take))
+            used += take
+            written += take
+            self._db.execute("UPDATE segments SET rows = ? WHERE id = ?", (used, segment_id))
+        return positions
+
+    def _delete(self, event_ids: List[str]) -> int:
+        with self._lock:
+            deleted = 0
+            for i in range(0, len(event_ids), 500):
+                chunk = event_ids[i:i + 500]
+                cursor = self._db.execute(
+                    f"DELETE FROM vectors WHERE event_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                deleted += cursor.rowcount
+            self._db.commit()
+            if deleted:
+                self._compact()
+            return deleted
+
+    def _compact(self, force: bool = False) -> int:
+        """
+        Copy live rows into fresh segments once enough rows are unreferenced.
+
+        Called with ``_lock`` held. New segments get ids above every existing
+        one, so a search that read the old layout resolves nothing stale.
+        Returns the number of rows dropped.
+        """
+        segments = self._segments(self._db)
+        total = sum(rows for _, rows in segments)
+        live = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        dead = total - live
+        if dead == 0 or (not force and dead < self.compact_ratio * total):
+            return 0
+
+        segment_id, used = segments[-1][0] + 1, 0
+        self._db.execute("INSERT INTO segments (id, rows) VALUES (?, 0)", (segment_id,))
+        for old_id, rows in segments:
+            source = self._segment(old_id)
+            moved = self._db.execute(
+                "SELECT row_id, offset FROM vectors WHERE segment = ? ORDER BY offset", (old_id,)
+            ).fetchall()
+            for start in range(0, len(moved), self.block_rows):
+                block = moved[start:start + self.block_rows]
+                vectors = np.asarray(source[[offset for _, offset in block]])
+                positions = self._place(vectors, segment_id, used)
+                self._db.executemany(
+                    "UPDATE vectors SET segment = ?, offset = ? WHERE row_id = ?",
+                    [(new_segment, offset, row_id) for (row_id, _), (new_segment, offset) in zip(block, positions)],
+                )
+                segment_id, used = positions[-1][0], positions[-1][1] + 1
+            self._db.execute("DELETE FROM segments WHERE id = ?", (old_id,))
+        self._db.commit()
+        self._generation += 1
+
+        for old_id, _ in segments:
+            # Searches still holding the old map keep reading it; the
+            # generation change makes them search again on the new layout
+            self._maps.pop(old_id, None)
+            if os.path.exists(self._segment_path(old_id)):
+                os.remove(self._segment_path(old_id))
+        print(f"[EmbeddingStore] Compacted {live} live rows, dropped {dead} deleted rows")
+        return dead
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+            self._db.commit()
+
+    # ----- search -----
+
+    def _search(
+        self, query: np.ndarray, room_ids: Optional[List[str]], limit: int
+    ) -> List[ChatMessageSource]:
+        db = self._reader()
+        for _ in range(self.SEARCH_ATTEMPTS):
+            generation = self._generation
+            # One read transaction, so the segment list, offsets and rows all
+            # come from the same sidecar snapshot
+            db.execute("BEGIN")
+            try:
+                results = self._scan(db, query, room_ids, limit)
+            finally:
+                db.rollback()
+            if self._generation == generation:
+                return results
+
+        # Compactions kept overlapping; hold them off for this search
+        with self._lock:
+            return self._scan(self._db, query, room_ids, limit)
+
+    def _scan(
+        self, db: sqlite3.Connection, query: np.ndarray, room_ids: Optional[List[str]], limit: int
+    ) -> List[ChatMessageSource]:
+        heap: List[Tuple[float, int, int]] = []
+
+        def push(scores: np.ndarray, segment_id: int, offsets: np.ndarray) -> None:
+            k = min(limit, len(scores))
+            top = np.argpartition(scores, -k)[-k:]
+            for i in top:
+                if scores[i] == -np.inf:
+                    continue
+                item = (float(scores[i]), segment_id, int(offsets[i]))
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item[0] > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+
+        for segment_id, rows in self._segments(db):
+            segment = self._segment(segment_id) if rows else None
+            if segment is None:
+                continue
+
+            # Only rows the sidecar still references are scored, so deleted
+            # and replaced vectors never take a place in the top-k
+            if room_ids:
+                placeholders = ",".join("?" * len(room_ids))
+                offsets = np.fromiter(
+                    (r[0] for r in db.execute(
+                        f"SELECT offset FROM vectors WHERE segment = ? "
+                        f"AND room_id IN ({placeholders}) ORDER BY offset",
+                        (segment_id, *room_ids),
+                    )),
+                    dtype=np.int64,
+                )
+                for start in range(0, len(offsets), self.block_rows):
+                    block_offsets = offsets[start:start + self.block_rows]
+                    block = np.asarray(segment[block_offsets], dtype=np.float32)
+                    push(block @ query, segment_id, block_offsets)
+            else:
+                live = np.fromiter(
+                    (r[0] for r in db.execute("SELECT offset FROM vectors WHERE segment = ?", (segment_id,))),
+                    dtype=np.int64,
+                )
+                alive = np.zeros(rows, dtype=bool)
+                # Rows appended after the segment list was read wait for the next search
+                alive[live[live < rows]] = True
+                for start in range(0, rows, self.block_rows):
+                    stop = min(start + self.block_rows, rows)
+                    if not alive[start:stop].any():
+                        continue
+                    scores = np.asarray(segment[start:stop], dtype=np.float32) @ query
+                    scores[~alive[start:stop]] = -np.inf
+                    push(scores, segment_id, np.arange(start, stop))
+
+        results = []
+        for score, segment_id, offset in sorted(heap, reverse=True):
+            row = db.execute(
+                "SELECT room_id, event_id, sender, content, timestamp, kind, thread_id FROM vectors "
+                "WHERE segment = ? AND offset = ?",
+                (segment_id, offset),
+            ).fetchone()
+            if row is None:
+                continue
+            results.append(ChatMessageSource(
+                room_id=row[0],
+                event_id=row[1],
+                thread_id=row[6],
+                kind=row[5],
+                sender="" if row[5] in CONVERSATION_KINDS else row[2],
+                content=row[3],
+                timestamp=datetime.fromisoformat(row[4]),
+                score=score,
+            ))
+        return results
+
+    # ----- async API -----
+
+    async def append(self, rows: List[dict], embeddings: List[List[float]]) -> int:
+        """Append embedding rows, skipping event IDs already stored."""
+        return await asyncio.to_thread(self._append, rows, embeddings)
+
+    async def delete(self, event_ids: List[str]) -> int:
+        """Remove rows by event ID, compacting the segments once enough rows are dead."""
+        if not event_ids:
+            return 0
+        return await asyncio.to_thread(self._delete, event_ids)
+
+    async def compact(self) -> int:
+        """Drop every unreferenced row now; returns the number of rows dropped."""
+        def run() -> int:
+            with self._lock:
+                return self._compact(force=True)
+        return await asyncio.to_thread(run)
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get_meta, key)
+
+    async def set_meta(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self._set_meta, key, value)
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+    ) -> List[ChatMessageSource]:
+        """Top-k cosine search across the requested rooms (all rooms if None)."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        return await asyncio.to_thread(self._search, query / norm, room_ids, limit)
@@ -0,0 +1,70 @@
+"""Shared, pooled httpx clients for outbound HTTP calls."""
+
+from typing import Dict
+
+import httpx
+
+from ..config import get_settings
+
+settings = get_settings()
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPClientRegistry:
+    """
+    One long-lived httpx.AsyncClient per upstream.
+
+    Each upstream ("synapse", "github", "search") gets its own connection pool
+    so keep-alive connections and TLS sessions are reused across requests, and
+    a slow upstream cannot exhaust the pool of another. Clients are created on
+    first use and closed from the application lifespan.
+    """
+
+    UPSTREAMS = ("synapse", "github", "search")
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        max_connections = settings.http_max_connections
+        if name == "synapse":
+            max_connections = settings.http_synapse_max_connections
+
+        return httpx.AsyncClient(
+            http2=settings.http2_enabled and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(
+                settings.http_timeout_seconds,
+                connect=settings.http_connect_timeout_seconds,
+            ),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry_seconds,
+            ),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the pooled client for an upstream."""
+        if name not in self.UPSTREAMS:
+            raise ValueError(f"Unknown upstream: {name}")
+
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(name)
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close every pooled client."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+# Singleton instance
+http_clients = HTTPClientRegistry()
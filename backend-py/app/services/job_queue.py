@@ -0,0 +1,304 @@
+"""Postgres-backed queue of background indexing jobs."""
+
+import asyncio
+import os
+import socket
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from ..config import get_settings
+from ..database import async_session, IndexingJob
+from .rag_service import rag_service
+from .room_backfill import room_backfill_service
+
+settings = get_settings()
+
+# Job kinds
+KIND_INDEX = "index"        # catch up on a room's newest messages
+KIND_BACKFILL = "backfill"  # resumable full-history backfill
+KIND_REEMBED = "reembed"    # rebuild the embeddings of already indexed messages
+JOB_KINDS = (KIND_INDEX, KIND_BACKFILL, KIND_REEMBED)
+
+# Job statuses
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Payload keys never returned to API clients
+_SECRET_KEYS = {"access_token"}
+
+
+class IndexingJobQueue:
+    """
+    Runs indexing jobs from the ``indexing_jobs`` table on a pool of asyncio workers.
+
+    Endpoints enqueue a job and return its id straight away. Each worker
+    claims the next due job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any
+    number of processes can share the table without handing the same job to
+    two workers. A running job's ``locked_at`` is refreshed as a heartbeat;
+    jobs whose worker died are reclaimed after ``rag_job_lease_seconds``.
+    Failed jobs are retried with exponential backoff up to ``max_attempts``.
+
+    Only one queued or running job exists per (kind, room); enqueueing again
+    returns the active job. A job that is still queued takes the new payload
+    (e.g. a fresh access token); a running one keeps its own.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._handlers = {
+            KIND_INDEX: self._run_index,
+            KIND_BACKFILL: self._run_backfill,
+            KIND_REEMBED: self._run_reembed,
+        }
+
+    def start(self) -> None:
+        """Start the worker pool (``rag_job_workers`` tasks)."""
+        if self._workers or settings.rag_job_workers <= 0:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(f"{self.worker_id}/{n}"))
+            for n in range(settings.rag_job_workers)
+        ]
+        print(f"[Jobs] Started {len(self._workers)} indexing workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; their running jobs go back to the queue."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ----- API -----
+
+    async def enqueue(self, kind: str, room_id: str, payload: dict) -> tuple[IndexingJob, bool]:
+        """
+        Queue a job, or return the room's active job of the same kind.
+
+        Returns the job and whether it runs with ``payload``: False when the
+        room's job of this kind is already running with the payload it was
+        queued with.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        async with async_session() as session:
+            stmt = insert(IndexingJob).values(
+                kind=kind,
+                room_id=room_id,
+                payload=payload,
+                status=STATUS_QUEUED,
+                attempts=0,
+                max_attempts=settings.rag_job_max_attempts,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[IndexingJob.kind, IndexingJob.room_id],
+                # Literal predicate so Postgres can infer the partial index
+                index_where=text("status IN ('queued', 'running')"),
+                set_={"payload": stmt.excluded.payload},
+                # A worker may have claimed the job meanwhile; then it is left alone
+                where=IndexingJob.status == STATUS_QUEUED,
+            ).returning(IndexingJob)
+            job = (await session.execute(stmt)).scalar_one_or_none()
+            await session.commit()
+            applied = job is not None
+
+            if job is None:
+                job = await session.scalar(
+                    select(IndexingJob).where(
+                        IndexingJob.kind == kind,
+                        IndexingJob.room_id == room_id,
+                        IndexingJob.status.in_(ACTIVE_STATUSES),
+                    )
+                )
+
+        self._wakeup.set()
+        return job, applied
+
+    async def get(self, job_id: int) -> Optional[IndexingJob]:
+        async with async_session() as session:
+            return await session.get(IndexingJob, job_id)
+
+    @staticmethod
+    def describe(job: IndexingJob) -> dict:
+        """Status of a job for API clients, without credentials."""
+        return {
+            "job_id": job.id,
+            "kind": job.kind,
+            "room_id": job.room_id,
+            "status": job.status,
+            "payload": {k: v for k, v in (job.payload or {}).items() if k not in _SECRET_KEYS},
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "run_after": job.run_after.isoformat() if job.run_after else None,
+            "last_error": job.last_error,
+            "result": job.result,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+    # ----- workers -----
+
+    async def _worker(self, worker: str) -> None:
+        while True:
+            try:
+                job = await self._claim(worker)
+            except Exception as e:
+                print(f"[Jobs] {worker} could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.rag_job_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._execute(job, worker)
+
+    async def _claim(self, worker: str) -> Optional[IndexingJob]:
+        """Lock the next due job (or one whose lease expired) and mark it running."""
+        lease_expired = func.now() - timedelta(seconds=settings.rag_job_lease_seconds)
+        next_job = (
+            select(IndexingJob.id)
+            .where(
+                ((IndexingJob.status == STATUS_QUEUED) & (IndexingJob.run_after <= func.now()))
+                | ((IndexingJob.status == STATUS_RUNNING) & (IndexingJob.locked_at < lease_expired))
+            )
+            .order_by(IndexingJob.run_after, IndexingJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with async_session() as session:
+            job = await session.scalar(
+                update(IndexingJob)
+                .where(IndexingJob.id == next_job)
+                .values(
+                    status=STATUS_RUNNING,
+                    attempts=IndexingJob.attempts + 1,
+                    locked_by=worker,
+                    locked_at=func.now(),
+                )
+                .returning(IndexingJob)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return job
+
+    async def _finish(self, job: IndexingJob, worker: str, **values) -> None:
+        """Update a job this worker still holds (a reclaimed job belongs to its new worker)."""
+        if values.get("status") in (STATUS_SUCCEEDED, STATUS_FAILED):
+            values["payload"] = {k: v for k, v in job.payload.items() if k not in _SECRET_KEYS}
+            values["finished_at"] = func.now()
+        async with async_session() as session:
+            await session.execute(
+                update(IndexingJob)
+                .where(IndexingJob.id == job.id, IndexingJob.locked_by == worker)
+                .values(**values)
+            )
+            await session.commit()
+
+    async def _heartbeat(self, job_id: int, worker: str) -> None:
+        while True:
+            await asyncio.sleep(max(settings.rag_job_lease_seconds / 3, 1))
+            try:
+                async with async_session() as session:
+                    await session.execute(
+                        update(IndexingJob)
+                        .where(IndexingJob.id == job_id, IndexingJob.locked_by == worker)
+                        .values(locked_at=func.now())
+                    )
+                    await session.commit()
+            except Exception as e:
+                print(f"[Jobs] Heartbeat for job {job_id} failed: {e}")
+
+    async def _execute(self, job: IndexingJob, worker: str) -> None:
+        if job.attempts > job.max_attempts:
+            # Reclaimed after its worker died once too often
+            await self._finish(job, worker, status=STATUS_FAILED, locked_by=None,
+                               last_error=job.last_error or "Lease expired")
+            return
+
+        print(f"[Jobs] {worker} running {job.kind} job {job.id} for {job.room_id} (attempt {job.attempts})")
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, worker))
+        try:
+            result = await self._handlers[job.kind](job)
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back without counting this attempt
+            await self._finish(job, worker, status=STATUS_QUEUED, attempts=IndexingJob.attempts - 1,
+                               locked_by=None, locked_at=None)
+            raise
+        except Exception as e:
+            if job.attempts >= job.max_attempts:
+                print(f"[Jobs] {job.kind} job {job.id} failed permanently: {e}")
+                await self._finish(job, worker, status=STATUS_FAILED, locked_by=None, last_error=str(e))
+            else:
+                delay = min(
+                    settings.rag_job_backoff_seconds * 2 ** (job.attempts - 1),
+                    settings.rag_job_backoff_max_seconds,
+                )
+                print(f"[Jobs] {job.kind} job {job.id} failed, retrying in {delay:.0f}s: {e}")
+                await self._finish(job, worker, status=STATUS_QUEUED, locked_by=None, last_error=str(e),
+                                   run_after=func.now() + timedelta(seconds=delay))
+        else:
+            await self._finish(job, worker, status=STATUS_SUCCEEDED, locked_by=None, result=result)
+        finally:
+            heartbeat.cancel()
+
+    # ----- handlers -----
+
+    async def _save_result(self, job_id: int, result: dict) -> None:
+        async with async_session() as session:
+            await session.execute(update(IndexingJob).where(IndexingJob.id == job_id).values(result=result))
+            await session.commit()
+
+    async def _run_index(self, job: IndexingJob) -> dict:
+        # Progress is checkpointed in the result; a retry carries on from the
+        # page that failed instead of stopping at the pages already stored
+        return await room_backfill_service.catch_up(
+            job.room_id,
+            job.payload["access_token"],
+            max_messages=job.payload.get("max_messages"),
+            resume=(job.result or {}) if job.attempts > 1 else None,
+            checkpoint=lambda progress: self._save_result(job.id, progress),
+        )
+
+    async def _run_backfill(self, job: IndexingJob) -> dict:
+        restart = job.payload.get("restart", False)
+        if restart:
+            # Retries resume from the checkpoint instead of starting over
+            async with async_session() as session:
+                await session.execute(
+                    update(IndexingJob)
+                    .where(IndexingJob.id == job.id)
+                    .values(payload={**job.payload, "restart": False})
+                )
+                await session.commit()
+        return await room_backfill_service.run(
+            job.room_id,
+            job.payload["access_token"],
+            max_messages=job.payload.get("max_messages"),
+            restart=restart,
+        )
+
+    async def _run_reembed(self, job: IndexingJob) -> dict:
+        # Like _run_index: a retry continues after the last page that was re-embedded
+        return await rag_service.reembed_room(
+            job.room_id,
+            resume=(job.result or {}) if job.attempts > 1 else None,
+            checkpoint=lambda progress: self._save_result(job.id, progress),
+        )
+
+
+# Singleton instance
+job_queue = IndexingJobQueue()
@@ -0,0 +1,262 @@
+"""组织排行榜服务 - 内存中按积分有序的榜单, 随积分变动增量更新."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sortedcontainers import SortedKeyList
+from sqlalchemy import event, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..database import async_session
+from ..models.incentive import LeaderboardSnapshot, PointsLedger, UserPoints
+from .points_ledger import PENDING_CHANGES_KEY, TOTAL_ENTRY_TYPES
+
+settings = get_settings()
+
+# 榜单范围
+SCOPE_GLOBAL = "global"      # 组织总积分
+SCOPE_CAMPAIGN = "campaign"  # 某个活动内获得的积分
+SCOPE_WEEKLY = "weekly"      # 某一周 (周一开始) 获得的积分
+SCOPES = (SCOPE_GLOBAL, SCOPE_CAMPAIGN, SCOPE_WEEKLY)
+
+BoardKey = Tuple[int, str, str]  # (org_id, scope, scope_key)
+
+
+def week_start(day: date) -> date:
+    """所在周的周一"""
+    return day - timedelta(days=day.weekday())
+
+
+def scope_key(scope: str, campaign_id: Optional[int] = None, week: Optional[date] = None) -> str:
+    """榜单的 scope_key: global 为空, campaign 为活动 ID, weekly 为周一日期"""
+    if scope == SCOPE_GLOBAL:
+        return ""
+    if scope == SCOPE_CAMPAIGN:
+        if campaign_id is None:
+            raise ValueError("campaign_id is required for the campaign leaderboard")
+        return str(campaign_id)
+    if scope == SCOPE_WEEKLY:
+        return week_start(week or datetime.now().date()).isoformat()
+    raise ValueError(f"scope must be one of: {', '.join(SCOPES)}")
+
+
+def _points_query(org_id: int, scope: str, key: str):
+    """榜单的 (user_id, points) 查询, 只含积分为正的用户"""
+    if scope == SCOPE_GLOBAL:
+        # 走 (org_id, total_points DESC) 索引
+        return select(
+            UserPoints.user_id, func.coalesce(UserPoints.total_points, 0).label("points")
+        ).where(UserPoints.org_id == org_id, UserPoints.total_points > 0)
+
+    points = func.sum(PointsLedger.amount)
+    query = select(PointsLedger.user_id, points.label("points")).where(
+        PointsLedger.org_id == org_id,
+        PointsLedger.entry_type.in_(TOTAL_ENTRY_TYPES),
+    )
+    if scope == SCOPE_CAMPAIGN:
+        query = query.where(PointsLedger.campaign_id == int(key))
+    else:
+        start = datetime.combine(date.fromisoformat(key), datetime.min.time())
+        query = query.where(PointsLedger.created_at >= start, PointsLedger.created_at < start + timedelta(days=7))
+    return query.group_by(PointsLedger.user_id).having(points > 0)
+
+
+class _Board:
+    """一个榜单: 按 (积分倒序, user_id) 排序的 SortedKeyList, 增删和查名次都是 O(log n)"""
+
+    def __init__(self, points: Dict[int, int], previous_ranks: Dict[int, int]):
+        self.points = points
+        self.ranked = SortedKeyList(points.items(), key=lambda entry: (-entry[1], entry[0]))
+        self.previous_ranks = previous_ranks
+        self.loaded_at = time.monotonic()
+
+    def apply(self, user_id: int, delta: int) -> None:
+        old = self.points.pop(user_id, None)
+        if old is not None:
+            self.ranked.remove((user_id, old))
+        new = (old or 0) + delta
+        if new > 0:
+            self.points[user_id] = new
+            self.ranked.add((user_id, new))
+
+    def rank(self, points: int) -> int:
+        """同分同名次: 积分更高的人数 + 1"""
+        return self.ranked.bisect_key_left((-points,)) + 1
+
+    def entry(self, user_id: int, points: int) -> dict:
+        return {
+            "rank": self.rank(points),
+            "user_id": user_id,
+            "points": points,
+            "previous_rank": self.previous_ranks.get(user_id),
+        }
+
+
+class LeaderboardService:
+    """
+    组织排行榜 (总榜 / 活动榜 / 周榜)
+
+    每个榜单第一次访问时从数据库加载到内存, 之后积分流水提交时增量更新,
+    Top-N 和 "我的名次" 都是 O(log n)。其他进程写入的积分在
+    ``leaderboard_refresh_seconds`` 内随榜单重新加载生效。
+
+    快照把某一时刻的名次写入 leaderboard_snapshots, 榜单条目的
+    previous_rank 即最近一次快照中的名次。
+    """
+
+    # 加载期间一直有积分变动时最多重新加载的次数
+    LOAD_ATTEMPTS = 3
+
+    def __init__(self):
+        self._boards: "OrderedDict[BoardKey, _Board]" = OrderedDict()
+        # 每个榜单一把加载锁, 一直保留: 释放后删除会让仍在等待旧锁的协程与新锁并行加载
+        self._loading: Dict[BoardKey, asyncio.Lock] = {}
+        # 正在加载的榜单 -> 加载期间是否有积分变动
+        self._changed_during_load: Dict[BoardKey, bool] = {}
+
+    async def _board(self, key: BoardKey) -> _Board:
+        board = self._boards.get(key)
+        if board is None or time.monotonic() - board.loaded_at > settings.leaderboard_refresh_seconds:
+            lock = self._loading.setdefault(key, asyncio.Lock())
+            async with lock:
+                board = self._boards.get(key)
+                if board is None or time.monotonic() - board.loaded_at > settings.leaderboard_refresh_seconds:
+                    board = await self._load_consistent(key)
+                    self._boards[key] = board
+
+        self._boards.move_to_end(key)
+        while len(self._boards) > settings.leaderboard_max_boards:
+            self._boards.popitem(last=False)
+        return board
+
+    async def _load_consistent(self, key: BoardKey) -> _Board:
+        """
+        加载榜单; 加载期间到达的积分变动不知是否已被查询包含, 有则重新加载
+
+        多次重试后仍有变动时照常返回, 但标记为过期, 下次访问时重新加载。
+        """
+        for _ in range(self.LOAD_ATTEMPTS):
+            self._changed_during_load[key] = False
+            try:
+                board = await self._load(key)
+            finally:
+                changed = self._changed_during_load.pop(key)
+            if not changed:
+                return board
+        board.loaded_at -= settings.leaderboard_refresh_seconds + 1
+        return board
+
+    async def _load(self, key: BoardKey) -> _Board:
+        org_id, scope, board_key = key
+        async with async_session() as session:
+            result = await session.execute(_points_query(org_id, scope, board_key))
+            points = {row.user_id: int(row.points) for row in result}
+
+            latest = (
+                select(func.max(LeaderboardSnapshot.snapshot_at))
+                .where(
+                    LeaderboardSnapshot.org_id == org_id,
+                    LeaderboardSnapshot.scope == scope,
+                    LeaderboardSnapshot.scope_key == board_key,
+                )
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                select(LeaderboardSnapshot.user_id, LeaderboardSnapshot.rank).where(
+                    LeaderboardSnapshot.org_id == org_id,
+                    LeaderboardSnapshot.scope == scope,
+                    LeaderboardSnapshot.scope_key == board_key,
+                    LeaderboardSnapshot.snapshot_at == latest,
+                )
+            )
+            previous_ranks = {row.user_id: row.rank for row in result}
+        return _Board(points, previous_ranks)
+
+    async def leaderboard(
+        self,
+        org_id: int,
+        scope: str = SCOPE_GLOBAL,
+        key: str = "",
+        limit: int = 20,
+        offset: int = 0,
+        user_id: Optional[int] = None,
+    ) -> dict:
+        """榜单的一页, 以及 user_id 的名次 (不在榜上时为 None)"""
+        board = await self._board((org_id, scope, key))
+        entries: List[dict] = [
+            board.entry(uid, points) for uid, points in board.ranked.islice(offset, offset + limit)
+        ]
+
+        me = None
+        if user_id is not None and user_id in board.points:
+            me = board.entry(user_id, board.points[user_id])
+
+        return {
+            "scope": scope,
+            "scope_key": key,
+            "total_participants": len(board.points),
+            "entries": entries,
+            "me": me,
+        }
+
+    def apply_change(
+        self, org_id: int, user_id: int, amount: int, campaign_id: Optional[int], at: Optional[datetime]
+    ) -> None:
+        """把已提交的积分变动应用到已加载的榜单; 未加载的榜单下次加载时自然包含"""
+        keys = [(org_id, SCOPE_GLOBAL, "")]
+        if campaign_id is not None:
+            keys.append((org_id, SCOPE_CAMPAIGN, str(campaign_id)))
+        keys.append((org_id, SCOPE_WEEKLY, week_start((at or datetime.now()).date()).isoformat()))
+
+        for key in keys:
+            if key in self._changed_during_load:
+                self._changed_during_load[key] = True
+            board = self._boards.get(key)
+            if board is not None:
+                board.apply(user_id, amount)
+
+    def invalidate(self, org_id: int) -> None:
+        """丢弃组织的所有榜单 (余额重算或生成快照后)"""
+        for key in [key for key in self._boards if key[0] == org_id]:
+            del self._boards[key]
+
+    async def snapshot(self, db: AsyncSession, org_id: int, scope: str, key: str) -> int:
+        """在数据库中计算榜单名次 (RANK() OVER) 并写入快照, 返回参与人数; 不提交"""
+        ranked = _points_query(org_id, scope, key).subquery()
+        snapshot_at = datetime.now()
+        result = await db.execute(
+            insert(LeaderboardSnapshot).from_select(
+                ["org_id", "scope", "scope_key", "user_id", "points", "rank", "snapshot_at"],
+                select(
+                    literal(org_id),
+                    literal(scope),
+                    literal(key),
+                    ranked.c.user_id,
+                    ranked.c.points,
+                    func.rank().over(order_by=ranked.c.points.desc()),
+                    literal(snapshot_at),
+                ),
+            )
+        )
+        return result.rowcount
+
+
+# Singleton instance
+leaderboard_service = LeaderboardService()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_changes(session: Session) -> None:
+    for change in session.info.pop(PENDING_CHANGES_KEY, []):
+        leaderboard_service.apply_change(*change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_changes(session: Session) -> None:
+    session.info.pop(PENDING_CHANGES_KEY, None)
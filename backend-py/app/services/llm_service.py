@@ -1,9 +1,10 @@
 """LLM service for OpenAI-compatible API calls."""
 
-from typing import Optional
+from typing import AsyncIterator, List, Optional
 from openai import AsyncOpenAI
 
 from ..config import get_settings
+from .answer_cache import answer_cache, CACHE_DISABLED
 
 settings = get_settings()
 
@@ -18,8 +19,8 @@ class LLMService:
         )
         self.model = settings.openai_model
 
-    async def generate_answer(self, query: str, context: str) -> str:
-        """Generate an answer based on query and context."""
+    @staticmethod
+    def _answer_messages(query: str, context: str) -> list:
         prompt = f"""You are a helpful assistant for the Yu Developer Platform.
 User Query: {query}
 
@@ -28,24 +29,15 @@ Context from Search Results:
 
 Please provide a concise answer or summary based on the context above. If the context doesn't answer the query, try to answer from your general knowledge but mention that search results were insufficient."""
 
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=500,
-            )
-            return response.choices[0].message.content or "No response generated."
-        except Exception as e:
-            print(f"[LLM] Error generating answer: {e}")
-            return "Error connecting to AI service. Please check your configuration."
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ]
 
-    async def chat_with_context(
-        self, message: str, chat_context: str, conversation_history: Optional[list] = None
-    ) -> str:
-        """Generate a chat response with Matrix chat room context."""
+    @staticmethod
+    def _chat_messages(
+        message: str, chat_context: str, conversation_history: Optional[list] = None
+    ) -> list:
         system_prompt = """You are an AI assistant that helps users understand and search through chat room conversations.
 You have access to relevant chat messages from Matrix rooms. Use these messages to answer the user's questions.
 When citing information, mention the sender if relevant. Be concise and helpful."""
@@ -62,17 +54,138 @@ Based on the above context, please answer the user's question."""
             messages.extend(conversation_history)
 
         messages.append({"role": "user", "content": f"{context_prompt}\n\nUser question: {message}"})
+        return messages
+
+    def _cache_get(
+        self, kind: str, prompt, context: str, query_embedding: Optional[List[float]] = None
+    ) -> tuple[Optional[str], str]:
+        if not settings.llm_cache_enabled:
+            return None, CACHE_DISABLED
+        return answer_cache.get(kind, self.model, prompt, context, query_embedding)
+
+    def _cache_put(
+        self, kind: str, prompt, context: str, answer: str,
+        query_embedding: Optional[List[float]] = None,
+    ) -> None:
+        if settings.llm_cache_enabled:
+            answer_cache.put(kind, self.model, prompt, context, answer, query_embedding)
+
+    async def generate_answer(self, query: str, context: str) -> tuple[str, str]:
+        """
+        Generate an answer based on query and context.
+
+        Returns (answer, cache_status)
+        """
+        cached, cache_status = self._cache_get("answer", [query], context)
+        if cached is not None:
+            return cached, cache_status
 
         try:
             response = await self.client.chat.completions.create(
                 model=self.model,
-                messages=messages,
+                messages=self._answer_messages(query, context),
+                max_tokens=500,
+            )
+            answer = response.choices[0].message.content or "No response generated."
+        except Exception as e:
+            print(f"[LLM] Error generating answer: {e}")
+            return "Error connecting to AI service. Please check your configuration.", cache_status
+
+        self._cache_put("answer", [query], context, answer)
+        return answer, cache_status
+
+    async def chat_with_context(
+        self,
+        message: str,
+        chat_context: str,
+        conversation_history: Optional[list] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> tuple[str, str]:
+        """
+        Generate a chat response with Matrix chat room context.
+
+        ``query_embedding`` (the RAG embedding of ``message``) enables the
+        semantic tier of the answer cache. Returns (answer, cache_status)
+        """
+        prompt = [message, conversation_history or []]
+        # Answers that depend on earlier turns are only reused verbatim
+        if conversation_history:
+            query_embedding = None
+
+        cached, cache_status = self._cache_get("chat", prompt, chat_context, query_embedding)
+        if cached is not None:
+            return cached, cache_status
+
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self._chat_messages(message, chat_context, conversation_history),
                 max_tokens=1000,
             )
-            return response.choices[0].message.content or "No response generated."
+            answer = response.choices[0].message.content or "No response generated."
         except Exception as e:
             print(f"[LLM] Error in chat: {e}")
-            return f"Error connecting to AI service: {str(e)}"
+            return f"Error connecting to AI service: {str(e)}", cache_status
+
+        self._cache_put("chat", prompt, chat_context, answer, query_embedding)
+        return answer, cache_status
+
+    async def _stream(self, messages: list, max_tokens: int) -> AsyncIterator[str]:
+        """Yield completion text as the API produces it. Errors are raised."""
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def _stream_and_cache(
+        self, kind: str, prompt, context: str, messages: list, max_tokens: int,
+        query_embedding: Optional[List[float]],
+    ) -> AsyncIterator[str]:
+        # Only a stream that ran to completion is cached
+        parts = []
+        async for token in self._stream(messages, max_tokens):
+            parts.append(token)
+            yield token
+        self._cache_put(kind, prompt, context, "".join(parts) or "No response generated.", query_embedding)
+
+    @staticmethod
+    async def _replay(answer: str) -> AsyncIterator[str]:
+        yield answer
+
+    async def stream_answer(self, query: str, context: str) -> tuple[AsyncIterator[str], str]:
+        """Streaming variant of generate_answer. Returns (token stream, cache_status)"""
+        cached, cache_status = self._cache_get("answer", [query], context)
+        if cached is not None:
+            return self._replay(cached), cache_status
+        return self._stream_and_cache(
+            "answer", [query], context, self._answer_messages(query, context), 500, None
+        ), cache_status
+
+    async def stream_chat_with_context(
+        self,
+        message: str,
+        chat_context: str,
+        conversation_history: Optional[list] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> tuple[AsyncIterator[str], str]:
+        """Streaming variant of chat_with_context. Returns (token stream, cache_status)"""
+        prompt = [message, conversation_history or []]
+        if conversation_history:
+            query_embedding = None
+
+        cached, cache_status = self._cache_get("chat", prompt, chat_context, query_embedding)
+        if cached is not None:
+            return self._replay(cached), cache_status
+        return self._stream_and_cache(
+            "chat", prompt, chat_context,
+            self._chat_messages(message, chat_context, conversation_history), 1000,
+            query_embedding,
+        ), cache_status
 
 
 # Singleton instance
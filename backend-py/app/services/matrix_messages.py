@@ -1,20 +1,33 @@
 """Matrix messages service for reading chat room history."""
 
-from typing import List, Optional
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
-import httpx
 
 from ..config import get_settings
 from ..models.schemas import ChatMessageSource
+from .http_clients import http_clients
 
 settings = get_settings()
 
 
+def event_thread_id(content: dict) -> Optional[str]:
+    """Thread root (m.thread) or replied-to event (m.in_reply_to) of a message, if any."""
+    relation = content.get("m.relates_to") or {}
+    if relation.get("rel_type") == "m.thread":
+        return relation.get("event_id")
+    return (relation.get("m.in_reply_to") or {}).get("event_id")
+
+
 class MatrixMessagesService:
     """Service for reading Matrix room messages."""
 
     def __init__(self):
         self.homeserver_url = settings.matrix_homeserver_url
+        # room_id -> (room name, monotonic expiry)
+        self._room_names: Dict[str, Tuple[Optional[str], float]] = {}
 
     async def get_room_messages(
         self,
@@ -28,85 +41,159 @@ class MatrixMessagesService:
         
         Returns tuple of (messages, next_batch_token)
         """
-        messages = []
+        try:
+            return await self.fetch_messages_page(room_id, access_token, limit, from_token)
+        except Exception as e:
+            print(f"[Matrix] Error getting messages: {e}")
+            return [], None
 
-        async with httpx.AsyncClient() as client:
-            try:
-                params = {
-                    "dir": "b",  # backwards from the latest
-                    "limit": limit,
-                }
-                if from_token:
-                    params["from"] = from_token
+    async def fetch_messages_page(
+        self,
+        room_id: str,
+        access_token: str,
+        limit: int = 100,
+        from_token: Optional[str] = None,
+    ) -> tuple[List[ChatMessageSource], Optional[str]]:
+        """
+        Fetch one page of room history, newest first.
 
-                response = await client.get(
-                    f"{self.homeserver_url}/_matrix/client/v3/rooms/{room_id}/messages",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    params=params,
-                )
+        Unlike get_room_messages, HTTP errors are raised so callers can tell a
+        failed request from the start of the room. The returned token is None
+        once there is no older history.
+        """
+        params = {
+            "dir": "b",  # backwards from the latest
+            "limit": limit,
+        }
+        if from_token:
+            params["from"] = from_token
+
+        response = await http_clients.get("synapse").get(
+            f"{self.homeserver_url}/_matrix/client/v3/rooms/{room_id}/messages",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params=params,
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        chunk = data.get("chunk", [])
+        messages = []
+        for event in chunk:
+            if event.get("type") == "m.room.message":
+                content = event.get("content", {})
+                body = content.get("body", "")
+
+                if body:  # Only include non-empty messages
+                    messages.append(
+                        ChatMessageSource(
+                            room_id=room_id,
+                            event_id=event.get("event_id"),
+                            thread_id=event_thread_id(content),
+                            sender=event.get("sender", ""),
+                            content=body,
+                            timestamp=datetime.fromtimestamp(
+                                event.get("origin_server_ts", 0) / 1000
+                            ),
+                        )
+                    )
+
+        # An empty chunk (or no "end") means the start of the room was reached
+        next_token = data.get("end") if chunk else None
+        return messages, next_token
+
+    async def get_room_start_time(self, room_id: str, access_token: str) -> Optional[datetime]:
+        """Timestamp of the first event in a room, if the homeserver supports timestamp_to_event."""
+        try:
+            response = await http_clients.get("synapse").get(
+                f"{self.homeserver_url}/_matrix/client/v1/rooms/{room_id}/timestamp_to_event",
+                headers={"Authorization": f"Bearer {access_token}"},
+                params={"ts": 0, "dir": "f"},
+            )
+            if response.status_code != 200:
+                return None
+            return datetime.fromtimestamp(response.json()["origin_server_ts"] / 1000)
+        except Exception:
+            return None
 
-                if response.status_code != 200:
-                    print(f"[Matrix] Failed to get messages: {response.status_code}")
-                    return [], None
+    async def get_room_name(self, room_id: str, access_token: str) -> Optional[str]:
+        """Get room display name."""
+        names = await self.get_room_names([room_id], access_token)
+        return names.get(room_id)
 
-                data = response.json()
-                next_token = data.get("end")
+    async def get_room_names(
+        self, room_ids: List[str], access_token: str
+    ) -> Dict[str, Optional[str]]:
+        """
+        Get display names for several rooms.
 
-                for event in data.get("chunk", []):
-                    if event.get("type") == "m.room.message":
-                        content = event.get("content", {})
-                        body = content.get("body", "")
-
-                        if body:  # Only include non-empty messages
-                            messages.append(
-                                ChatMessageSource(
-                                    room_id=room_id,
-                                    sender=event.get("sender", ""),
-                                    content=body,
-                                    timestamp=datetime.fromtimestamp(
-                                        event.get("origin_server_ts", 0) / 1000
-                                    ),
-                                )
-                            )
+        Each unique room is looked up at most once, uncached rooms are fetched
+        concurrently, and results are cached per room for
+        ``matrix_room_name_ttl_seconds``.
+        """
+        now = time.monotonic()
+        names: Dict[str, Optional[str]] = {}
+        missing = []
+
+        for room_id in dict.fromkeys(room_ids):
+            cached = self._room_names.get(room_id)
+            if cached and cached[1] > now:
+                names[room_id] = cached[0]
+            else:
+                missing.append(room_id)
+
+        if missing:
+            results = await asyncio.gather(
+                *(self._fetch_room_name(room_id, access_token) for room_id in missing)
+            )
+            expires_at = time.monotonic() + settings.matrix_room_name_ttl_seconds
+            for room_id, (resolved, name) in zip(missing, results):
+                names[room_id] = name
+                # Only cache definite answers, not auth or network failures
+                if resolved:
+                    self._room_names[room_id] = (name, expires_at)
+
+            if len(self._room_names) > settings.matrix_room_name_cache_size:
+                self._room_names = {
+                    room_id: entry for room_id, entry in self._room_names.items()
+                    if entry[1] > now
+                }
 
-                return messages, next_token
+        return names
 
-            except Exception as e:
-                print(f"[Matrix] Error getting messages: {e}")
-                return [], None
+    async def _fetch_room_name(
+        self, room_id: str, access_token: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Fetch a room name. Returns (resolved, name); 404 means the room has no name."""
+        client = http_clients.get("synapse")
+        try:
+            response = await client.get(
+                f"{self.homeserver_url}/_matrix/client/v3/rooms/{room_id}/state/m.room.name",
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
 
-    async def get_room_name(self, room_id: str, access_token: str) -> Optional[str]:
-        """Get room display name."""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.homeserver_url}/_matrix/client/v3/rooms/{room_id}/state/m.room.name",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                )
-
-                if response.status_code == 200:
-                    return response.json().get("name")
-                return None
+            if response.status_code == 200:
+                return True, response.json().get("name")
+            return response.status_code == 404, None
 
-            except Exception:
-                return None
+        except Exception:
+            return False, None
 
     async def get_user_joined_rooms(self, access_token: str) -> List[str]:
         """Get list of rooms the user has joined."""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.homeserver_url}/_matrix/client/v3/joined_rooms",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                )
+        client = http_clients.get("synapse")
+        try:
+            response = await client.get(
+                f"{self.homeserver_url}/_matrix/client/v3/joined_rooms",
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
 
-                if response.status_code == 200:
-                    return response.json().get("joined_rooms", [])
-                return []
+            if response.status_code == 200:
+                return response.json().get("joined_rooms", [])
+            return []
 
-            except Exception as e:
-                print(f"[Matrix] Error getting joined rooms: {e}")
-                return []
+        except Exception as e:
+            print(f"[Matrix] Error getting joined rooms: {e}")
+            return []
 
     async def search_messages(
         self,
@@ -121,57 +208,58 @@ class MatrixMessagesService:
         Note: This requires the homeserver to have search enabled.
         Falls back to manual search if search API is not available.
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                search_body = {
-                    "search_categories": {
-                        "room_events": {
-                            "search_term": query,
-                            "keys": ["content.body"],
-                            "order_by": "recent",
-                        }
+        client = http_clients.get("synapse")
+        try:
+            search_body = {
+                "search_categories": {
+                    "room_events": {
+                        "search_term": query,
+                        "keys": ["content.body"],
+                        "order_by": "recent",
                     }
                 }
+            }
 
-                if room_ids:
-                    search_body["search_categories"]["room_events"]["filter"] = {
-                        "rooms": room_ids
-                    }
+            if room_ids:
+                search_body["search_categories"]["room_events"]["filter"] = {
+                    "rooms": room_ids
+                }
 
-                response = await client.post(
-                    f"{self.homeserver_url}/_matrix/client/v3/search",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    json=search_body,
-                )
+            response = await client.post(
+                f"{self.homeserver_url}/_matrix/client/v3/search",
+                headers={"Authorization": f"Bearer {access_token}"},
+                json=search_body,
+            )
 
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get("search_categories", {}).get("room_events", {}).get("results", [])
-
-                    messages = []
-                    for result in results[:limit]:
-                        event = result.get("result", {})
-                        if event.get("type") == "m.room.message":
-                            content = event.get("content", {})
-                            messages.append(
-                                ChatMessageSource(
-                                    room_id=event.get("room_id", ""),
-                                    sender=event.get("sender", ""),
-                                    content=content.get("body", ""),
-                                    timestamp=datetime.fromtimestamp(
-                                        event.get("origin_server_ts", 0) / 1000
-                                    ),
-                                )
+            if response.status_code == 200:
+                data = response.json()
+                results = data.get("search_categories", {}).get("room_events", {}).get("results", [])
+
+                messages = []
+                for result in results[:limit]:
+                    event = result.get("result", {})
+                    if event.get("type") == "m.room.message":
+                        content = event.get("content", {})
+                        messages.append(
+                            ChatMessageSource(
+                                room_id=event.get("room_id", ""),
+                                event_id=event.get("event_id"),
+                                sender=event.get("sender", ""),
+                                content=content.get("body", ""),
+                                timestamp=datetime.fromtimestamp(
+                                    event.get("origin_server_ts", 0) / 1000
+                                ),
                             )
-                    return messages
+                        )
+                return messages
 
-                # If search API fails, fall back to getting recent messages
-                print(f"[Matrix] Search API not available, using fallback")
-                return await self._fallback_search(query, access_token, room_ids, limit)
+            # If search API fails, fall back to getting recent messages
+            print(f"[Matrix] Search API not available, using fallback")
+            return await self._fallback_search(query, access_token, room_ids, limit)
 
-            except Exception as e:
-                print(f"[Matrix] Search error: {e}")
-                return await self._fallback_search(query, access_token, room_ids, limit)
+        except Exception as e:
+            print(f"[Matrix] Search error: {e}")
+            return await self._fallback_search(query, access_token, room_ids, limit)
 
     async def _fallback_search(
         self,
@@ -180,23 +268,62 @@ class MatrixMessagesService:
         room_ids: Optional[List[str]] = None,
         limit: int = 10,
     ) -> List[ChatMessageSource]:
-        """Fallback search by fetching recent messages and filtering."""
-        if not room_ids:
-            room_ids = await self.get_user_joined_rooms(access_token)
-
-        matching_messages = []
-        query_lower = query.lower()
+        """
+        Fallback search by fetching recent messages and filtering.
 
-        for room_id in room_ids[:5]:  # Limit to 5 rooms for performance
-            messages, _ = await self.get_room_messages(room_id, access_token, limit=50)
-            for msg in messages:
-                if query_lower in msg.content.lower():
-                    matching_messages.append(msg)
-                    if len(matching_messages) >= limit:
-                        return matching_messages
+        All requested (or joined) rooms are fetched concurrently. Matches are
+        collected as rooms complete; outstanding fetches are cancelled once
+        ``limit`` matches are found or the overall deadline passes.
+        """
+        matching_messages: List[ChatMessageSource] = []
+
+        try:
+            async with asyncio.timeout(settings.matrix_fallback_deadline_seconds):
+                if not room_ids:
+                    room_ids = await self.get_user_joined_rooms(access_token)
+
+                async with aclosing(
+                    self._iter_fallback_matches(query, access_token, room_ids)
+                ) as matches:
+                    async for msg in matches:
+                        matching_messages.append(msg)
+                        if len(matching_messages) >= limit:
+                            break
+
+        except TimeoutError:
+            print(
+                f"[Matrix] Fallback search hit {settings.matrix_fallback_deadline_seconds}s "
+                f"deadline with {len(matching_messages)} matches"
+            )
 
         return matching_messages
 
+    async def _iter_fallback_matches(
+        self,
+        query: str,
+        access_token: str,
+        room_ids: List[str],
+    ) -> AsyncIterator[ChatMessageSource]:
+        """Yield matching messages room by room, in order of fetch completion."""
+        query_lower = query.lower()
+        semaphore = asyncio.Semaphore(max(1, settings.matrix_fallback_concurrency))
+
+        async def fetch_matches(room_id: str) -> List[ChatMessageSource]:
+            async with semaphore:
+                messages, _ = await self.get_room_messages(
+                    room_id, access_token, limit=settings.matrix_fallback_messages_per_room
+                )
+            return [msg for msg in messages if query_lower in msg.content.lower()]
+
+        tasks = [asyncio.create_task(fetch_matches(room_id)) for room_id in room_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for msg in await next_done:
+                    yield msg
+        finally:
+            for task in tasks:
+                task.cancel()
+
 
 # Singleton instance
 matrix_messages_service = MatrixMessagesService()
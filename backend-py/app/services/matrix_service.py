@@ -2,11 +2,11 @@
 
 import hashlib
 import hmac
-import httpx
 from typing import Optional
 
 from ..config import get_settings
 from ..models.schemas import MatrixCredentials
+from .http_clients import http_clients
 
 settings = get_settings()
 
@@ -35,83 +35,83 @@ async def register_with_shared_secret(
         print("[Matrix] No shared secret configured, skipping admin registration")
         return {"success": False}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            # Step 1: Get nonce
-            nonce_response = await client.get(
-                f"{homeserver_url}/_synapse/admin/v1/register"
-            )
-            nonce = nonce_response.json()["nonce"]
-
-            # Step 2: Generate MAC and register
-            mac = generate_admin_mac(shared_secret, nonce, username, password, is_admin)
-
-            register_response = await client.post(
-                f"{homeserver_url}/_synapse/admin/v1/register",
-                json={
-                    "nonce": nonce,
-                    "username": username,
-                    "password": password,
-                    "displayname": display_name or username,
-                    "admin": is_admin,
-                    "mac": mac,
-                },
-            )
-
-            if register_response.status_code == 200:
-                print(f"[Matrix] Shared secret registration successful for {username}")
-                return {
-                    "success": True,
-                    "user_id": register_response.json().get("user_id"),
-                }
-
-            error_data = register_response.json()
-            if error_data.get("errcode") == "M_USER_IN_USE":
-                print(f"[Matrix] User {username} already exists")
-                return {
-                    "success": True,
-                    "user_id": f"@{username}:{settings.matrix_server_name}",
-                }
+    client = http_clients.get("synapse")
+    try:
+        # Step 1: Get nonce
+        nonce_response = await client.get(
+            f"{homeserver_url}/_synapse/admin/v1/register"
+        )
+        nonce = nonce_response.json()["nonce"]
+
+        # Step 2: Generate MAC and register
+        mac = generate_admin_mac(shared_secret, nonce, username, password, is_admin)
+
+        register_response = await client.post(
+            f"{homeserver_url}/_synapse/admin/v1/register",
+            json={
+                "nonce": nonce,
+                "username": username,
+                "password": password,
+                "displayname": display_name or username,
+                "admin": is_admin,
+                "mac": mac,
+            },
+        )
 
-            print(f"[Matrix] Registration failed: {error_data}")
-            return {"success": False}
+        if register_response.status_code == 200:
+            print(f"[Matrix] Shared secret registration successful for {username}")
+            return {
+                "success": True,
+                "user_id": register_response.json().get("user_id"),
+            }
+
+        error_data = register_response.json()
+        if error_data.get("errcode") == "M_USER_IN_USE":
+            print(f"[Matrix] User {username} already exists")
+            return {
+                "success": True,
+                "user_id": f"@{username}:{settings.matrix_server_name}",
+            }
+
+        print(f"[Matrix] Registration failed: {error_data}")
+        return {"success": False}
 
-        except Exception as e:
-            print(f"[Matrix] Shared secret registration failed: {e}")
-            return {"success": False}
+    except Exception as e:
+        print(f"[Matrix] Shared secret registration failed: {e}")
+        return {"success": False}
 
 
 async def login_matrix_user(username: str, password: str) -> Optional[dict]:
     """Login to Matrix and return credentials."""
     homeserver_url = settings.matrix_homeserver_url
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{homeserver_url}/_matrix/client/v3/login",
-                json={
-                    "type": "m.login.password",
-                    "user": username,
-                    "password": password,
-                },
-            )
+    client = http_clients.get("synapse")
+    try:
+        response = await client.post(
+            f"{homeserver_url}/_matrix/client/v3/login",
+            json={
+                "type": "m.login.password",
+                "user": username,
+                "password": password,
+            },
+        )
 
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "access_token": data["access_token"],
-                    "user_id": data["user_id"],
-                    "device_id": data["device_id"],
-                }
-
-            # Print detailed error for non-200 responses
-            error_data = response.json()
-            print(f"[Matrix] Login failed with status {response.status_code}: {error_data}")
-            return None
-
-        except Exception as e:
-            print(f"[Matrix] Login exception: {e}")
-            return None
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                "access_token": data["access_token"],
+                "user_id": data["user_id"],
+                "device_id": data["device_id"],
+            }
+
+        # Print detailed error for non-200 responses
+        error_data = response.json()
+        print(f"[Matrix] Login failed with status {response.status_code}: {error_data}")
+        return None
+
+    except Exception as e:
+        print(f"[Matrix] Login exception: {e}")
+        return None
 
 
 async def create_matrix_account(
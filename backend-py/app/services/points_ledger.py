@@ -0,0 +1,191 @@
+"""积分流水服务 - 只追加的 points_ledger 与物化余额 user_points."""
+
+from typing import List, Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.incentive import PointsLedger, UserPoints
+
+# 流水类型
+ENTRY_EARN = "earn"      # 完成任务获得
+ENTRY_SPEND = "spend"    # 兑换奖品消耗
+ENTRY_ADJUST = "adjust"  # 管理员调整 (可正可负)
+ENTRY_REFUND = "refund"  # 兑换取消退回
+ENTRY_TYPES = (ENTRY_EARN, ENTRY_SPEND, ENTRY_ADJUST, ENTRY_REFUND)
+
+# 计入 total_points 的流水; spend / refund 计入 spent_points
+TOTAL_ENTRY_TYPES = (ENTRY_EARN, ENTRY_ADJUST)
+
+# session.info 中待提交的 total_points 变动, 提交后由排行榜应用
+PENDING_CHANGES_KEY = "points_total_changes"
+
+
+class PointsLedgerService:
+    """
+    积分记账
+
+    每次积分变动都是 points_ledger 里的一条 INSERT, amount 为对可用积分的
+    变动 (spend 为负数)。user_points 是按 (user_id, org_id) 物化的余额, 在同一
+    事务里用一条 upsert 原子累加, 读余额仍是单行查询。来源事件 (source_type,
+    source_id) 唯一, 重复记账会被忽略。
+
+    方法只在调用方的事务里写入, 不提交。
+    """
+
+    async def record(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        org_id: int,
+        entry_type: str,
+        amount: int,
+        source_type: Optional[str] = None,
+        source_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+        note: Optional[str] = None,
+    ) -> Optional[PointsLedger]:
+        """记一笔流水并更新余额; 同一来源已记过账时返回 None"""
+        if entry_type not in ENTRY_TYPES:
+            raise ValueError(f"Unknown ledger entry type: {entry_type}")
+
+        result = await db.execute(
+            insert(PointsLedger)
+            .values(
+                user_id=user_id,
+                org_id=org_id,
+                campaign_id=campaign_id,
+                entry_type=entry_type,
+                amount=amount,
+                source_type=source_type,
+                source_id=source_id,
+                note=note,
+            )
+            .on_conflict_do_nothing(
+                index_elements=[PointsLedger.entry_type, PointsLedger.source_type, PointsLedger.source_id],
+                index_where=PointsLedger.source_id.isnot(None),
+            )
+            .returning(PointsLedger)
+        )
+        entry = result.scalar_one_or_none()
+        if entry is None:
+            return None
+
+        if entry_type in TOTAL_ENTRY_TYPES:
+            total, spent = amount, 0
+            db.info.setdefault(PENDING_CHANGES_KEY, []).append(
+                (org_id, user_id, amount, campaign_id, entry.created_at)
+            )
+        else:
+            total, spent = 0, -amount
+        stmt = insert(UserPoints).values(user_id=user_id, org_id=org_id, total_points=total, spent_points=spent)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[UserPoints.user_id, UserPoints.org_id],
+            set_={
+                "total_points": func.coalesce(UserPoints.total_points, 0) + stmt.excluded.total_points,
+                "spent_points": func.coalesce(UserPoints.spent_points, 0) + stmt.excluded.spent_points,
+                "updated_at": func.now(),
+            },
+        ))
+        return entry
+
+    async def spend(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        org_id: int,
+        amount: int,
+        source_type: Optional[str] = None,
+        source_id: Optional[int] = None,
+        note: Optional[str] = None,
+    ) -> Optional[PointsLedger]:
+        """
+        扣减积分; 可用积分不足时不写入并返回 None
+
+        余额检查和扣减是同一条条件 UPDATE, 并发兑换不会透支。
+        """
+        result = await db.execute(
+            update(UserPoints)
+            .where(
+                UserPoints.user_id == user_id,
+                UserPoints.org_id == org_id,
+                func.coalesce(UserPoints.total_points, 0) - func.coalesce(UserPoints.spent_points, 0) >= amount,
+            )
+            .values(
+                spent_points=func.coalesce(UserPoints.spent_points, 0) + amount,
+                updated_at=func.now(),
+            )
+            .returning(UserPoints.id)
+        )
+        if result.scalar_one_or_none() is None:
+            return None
+
+        entry = PointsLedger(
+            user_id=user_id,
+            org_id=org_id,
+            entry_type=ENTRY_SPEND,
+            amount=-amount,
+            source_type=source_type,
+            source_id=source_id,
+            note=note,
+        )
+        db.add(entry)
+        await db.flush()
+        return entry
+
+    async def history(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        org_id: int,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+    ) -> List[PointsLedger]:
+        """用户在组织中的积分流水, 按时间倒序, 用 before_id 翻页"""
+        query = select(PointsLedger).where(PointsLedger.user_id == user_id, PointsLedger.org_id == org_id)
+        if before_id is not None:
+            query = query.where(PointsLedger.id < before_id)
+        result = await db.execute(query.order_by(PointsLedger.id.desc()).limit(limit))
+        return list(result.scalars().all())
+
+    async def rebuild_balances(self, db: AsyncSession, org_id: int) -> int:
+        """
+        由流水重放组织内所有用户的余额, 返回用户数 (用于核对或修复 user_points)
+
+        流水之前的余额由启动时写入的期初流水 (opening_balance) 覆盖, 见 database._seed_opening_balances。
+        """
+        totals = (
+            select(
+                PointsLedger.user_id,
+                PointsLedger.org_id,
+                func.sum(case((PointsLedger.entry_type.in_(TOTAL_ENTRY_TYPES), PointsLedger.amount), else_=0))
+                .label("total_points"),
+                func.sum(case((PointsLedger.entry_type.in_(TOTAL_ENTRY_TYPES), 0), else_=-PointsLedger.amount))
+                .label("spent_points"),
+            )
+            .where(PointsLedger.org_id == org_id)
+            .group_by(PointsLedger.user_id, PointsLedger.org_id)
+        )
+        await db.execute(
+            update(UserPoints)
+            .where(
+                UserPoints.org_id == org_id,
+                UserPoints.user_id.notin_(select(PointsLedger.user_id).where(PointsLedger.org_id == org_id)),
+            )
+            .values(total_points=0, spent_points=0, updated_at=func.now())
+        )
+        stmt = insert(UserPoints).from_select(["user_id", "org_id", "total_points", "spent_points"], totals)
+        result = await db.execute(stmt.on_conflict_do_update(
+            index_elements=[UserPoints.user_id, UserPoints.org_id],
+            set_={
+                "total_points": stmt.excluded.total_points,
+                "spent_points": stmt.excluded.spent_points,
+                "updated_at": func.now(),
+            },
+        ))
+        return result.rowcount
+
+
+# Singleton instance
+points_ledger = PointsLedgerService()
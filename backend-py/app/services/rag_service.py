@@ -1,17 +1,36 @@
 """RAG service for semantic search using pgvector."""
 
-from typing import List, Optional
-from datetime import datetime
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, List, Optional
+from datetime import datetime, timedelta
 from openai import AsyncOpenAI
-from sqlalchemy import select, text
+from sqlalchemy import and_, bindparam, delete, func, or_, select, text
 from sqlalchemy.dialects.postgresql import insert
+from pgvector.sqlalchemy import Vector
 
+from .. import database
 from ..config import get_settings
-from ..database import async_session, ChatMessageEmbedding
+from ..database import async_session, ChatMessageEmbedding, chat_message_vectors
 from ..models.schemas import ChatMessageSource
+from .embedding_cache import embedding_cache
+from .reranker import reranker
+from .context_packer import candidate_limit, pack_context, pack_windows
+from .chunker import (
+    conversation_text, is_trivial, split_text,
+    CONVERSATION_KINDS, KIND_CHUNK, KIND_MESSAGE, KIND_THREAD, KIND_WINDOW
+)
+from .vector_index import InMemoryVectorIndex
+from .embedding_store import SegmentedEmbeddingStore
 
 settings = get_settings()
 
+# Embedding store metadata key: last chat_message_embeddings id copied into the store
+STORE_SYNCED_ID = "synced_through_id"
+STORE_SYNC_PAGE_SIZE = 1000
+
 
 class RAGService:
     """
@@ -24,21 +43,302 @@ class RAGService:
             base_url=settings.openai_api_base,
         )
         self.embedding_model = "text-embedding-3-small"  # OpenAI embedding model
-        self.embedding_dimension = 1536
+        self.embedding_dimension = database.EMBEDDING_DIMENSION
+        # Search engines used when pgvector is unavailable: the memory-mapped
+        # store if configured, otherwise an in-memory index over embedding_json
+        self.fallback_index = InMemoryVectorIndex(self.embedding_dimension)
+        self.embedding_store: Optional[SegmentedEmbeddingStore] = None
+        if settings.rag_embedding_store_dir:
+            self.embedding_store = SegmentedEmbeddingStore(
+                settings.rag_embedding_store_dir,
+                self.embedding_dimension,
+                dtype=settings.rag_embedding_store_dtype,
+                segment_rows=settings.rag_embedding_store_segment_rows,
+                compact_ratio=settings.rag_embedding_store_compact_ratio,
+            )
+        self._store_sync: Optional[asyncio.Task] = None
+        # ("thread" | "root" | "window", room_id, anchor) waiting to be rebuilt
+        self._pending_conversations: set = set()
+        self._conversation_flush: Optional[asyncio.Task] = None
+        self._conversation_lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """Copy embeddings already in the database into the on-disk store, in the background."""
+        if self.embedding_store and self._store_sync is None:
+            self._store_sync = asyncio.create_task(self._sync_embedding_store())
+
+    async def stop(self) -> None:
+        if self._store_sync is not None:
+            self._store_sync.cancel()
+            await asyncio.gather(self._store_sync, return_exceptions=True)
+            self._store_sync = None
+        if self._conversation_flush is not None:
+            self._conversation_flush.cancel()
+            await asyncio.gather(self._conversation_flush, return_exceptions=True)
+            self._conversation_flush = None
+        try:
+            await self.flush_conversations()
+        except Exception as e:
+            print(f"[RAG] Error refreshing conversation embeddings: {e}")
+
+    async def _sync_embedding_store(self) -> None:
+        """
+        Bring the on-disk store up to date with the embeddings in the database.
+
+        Covers rows stored before the store was enabled or while it was
+        switched off. The last database id copied is kept in the store's
+        metadata, so a restart only reads rows added since; rows the store
+        already holds are skipped.
+        """
+        if database.PGVECTOR_AVAILABLE:
+            table, vector = chat_message_vectors, chat_message_vectors.c.embedding
+        else:
+            table, vector = ChatMessageEmbedding.__table__, ChatMessageEmbedding.__table__.c.embedding_json
+
+        try:
+            after_id = int(await self.embedding_store.get_meta(STORE_SYNCED_ID) or 0)
+            copied = 0
+            while True:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(
+                            table.c.id, table.c.room_id, table.c.event_id, table.c.sender, table.c.content,
+                            table.c.timestamp, table.c.kind, table.c.thread_id, vector.label("vector"),
+                        )
+                        .where(table.c.id > after_id, vector.isnot(None))
+                        .order_by(table.c.id)
+                        .limit(STORE_SYNC_PAGE_SIZE)
+                    )
+                    rows = result.fetchall()
+                if not rows:
+                    break
+
+                copied += await self.embedding_store.append(
+                    [
+                        {
+                            "room_id": row.room_id, "event_id": row.event_id, "sender": row.sender,
+                            "content": row.content, "timestamp": row.timestamp, "kind": row.kind,
+                            "thread_id": row.thread_id,
+                        }
+                        for row in rows
+                    ],
+                    [json.loads(row.vector) if isinstance(row.vector, str) else list(row.vector) for row in rows],
+                )
+                after_id = rows[-1].id
+                await self.embedding_store.set_meta(STORE_SYNCED_ID, str(after_id))
+
+            if copied:
+                print(f"[RAG] Copied {copied} embeddings from the database into the embedding store")
+        except Exception as e:
+            print(f"[RAG] Error filling the embedding store: {e}")
 
     async def get_embedding(self, text: str) -> List[float]:
-        """Get embedding vector for text."""
+        """Get embedding vector for text, served from the embedding cache when possible."""
+        cached = await embedding_cache.get_many(self.embedding_model, [text])
+        if cached[0] is not None:
+            return cached[0]
+
         try:
+            started = time.perf_counter()
             response = await self.client.embeddings.create(
                 model=self.embedding_model,
                 input=text,
             )
-            return response.data[0].embedding
+            embedding_cache.record_api_call(1, time.perf_counter() - started)
+            embedding = response.data[0].embedding
+            await embedding_cache.put_many(self.embedding_model, [text], [embedding])
+            return embedding
         except Exception as e:
             print(f"[RAG] Error getting embedding: {e}")
             # Return zero vector on error
             return [0.0] * self.embedding_dimension
 
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embedding vectors for several texts with one API request.
+
+        Cached texts and duplicates within the batch are not sent to the API.
+        Unlike get_embedding, errors are raised so callers can skip the batch
+        instead of storing zero vectors.
+        """
+        if not texts:
+            return []
+
+        embeddings = await embedding_cache.get_many(self.embedding_model, texts)
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+
+        if missing:
+            started = time.perf_counter()
+            response = await self.client.embeddings.create(
+                model=self.embedding_model,
+                input=missing,
+            )
+            embedding_cache.record_api_call(len(missing), time.perf_counter() - started)
+            # The API tags each item with its input position
+            data = sorted(response.data, key=lambda item: item.index)
+            computed = {t: item.embedding for t, item in zip(missing, data)}
+            await embedding_cache.put_many(self.embedding_model, missing, [computed[t] for t in missing])
+            embeddings = [e if e is not None else computed[t] for t, e in zip(texts, embeddings)]
+
+        return embeddings
+
+    async def _insert_embedding_rows(
+        self, rows: List[dict], embeddings: List[Optional[List[float]]], replace: bool = False
+    ) -> int:
+        """
+        Write embedding rows with one multi-row INSERT, returning message rows written.
+
+        With ``replace`` existing rows (matched by event_id) get the new content
+        and embedding, which is how edited messages are re-indexed. Rows whose
+        embedding is None (trivial messages) are stored for context only.
+        """
+        if not rows:
+            return 0
+
+        # Only the vector view knows the pgvector column
+        table = chat_message_vectors if database.PGVECTOR_AVAILABLE else ChatMessageEmbedding.__table__
+
+        async with async_session() as session:
+            stmt = insert(table).values(rows)
+            if replace:
+                # Edits do not move a message in time or between threads
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.event_id],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in rows[0]
+                        if column not in ("room_id", "event_id", "timestamp", "thread_id")
+                    },
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.event_id])
+            result = await session.execute(stmt.returning(table.c.kind))
+            written = sum(1 for row in result.fetchall() if row.kind == KIND_MESSAGE)
+            await session.commit()
+
+        if replace:
+            await self._forget_local([row["event_id"] for row in rows])
+        vectors = [(row, e) for row, e in zip(rows, embeddings) if e is not None]
+        if vectors and self.embedding_store:
+            await self.embedding_store.append([r for r, _ in vectors], [e for _, e in vectors])
+        elif vectors and not database.PGVECTOR_AVAILABLE:
+            self.fallback_index.add([r for r, _ in vectors], [e for _, e in vectors])
+        return written
+
+    async def _forget_local(self, event_ids: List[str]) -> None:
+        """Drop rows from the on-disk store and in-memory index."""
+        if self.embedding_store:
+            await self.embedding_store.delete(event_ids)
+        self.fallback_index.remove(event_ids)
+
+    async def _delete_rows(self, condition) -> list:
+        """Delete matching rows everywhere, returning (event_id, room_id, thread_id, timestamp, kind)."""
+        async with async_session() as session:
+            result = await session.execute(
+                delete(ChatMessageEmbedding).where(condition).returning(
+                    ChatMessageEmbedding.event_id,
+                    ChatMessageEmbedding.room_id,
+                    ChatMessageEmbedding.thread_id,
+                    ChatMessageEmbedding.timestamp,
+                    ChatMessageEmbedding.kind,
+                )
+            )
+            deleted = result.fetchall()
+            await session.commit()
+
+        if deleted:
+            await self._forget_local([row.event_id for row in deleted])
+        return deleted
+
+    @staticmethod
+    def _with_chunks(event_ids: List[str]):
+        """Rows of the given messages together with their extra chunks."""
+        return or_(
+            ChatMessageEmbedding.event_id.in_(event_ids),
+            *(ChatMessageEmbedding.event_id.startswith(f"{event_id}#", autoescape=True) for event_id in event_ids),
+        )
+
+    async def delete_message_embeddings(self, event_ids: List[str]) -> int:
+        """Delete embeddings for messages, e.g. after a redaction."""
+        if not event_ids:
+            return 0
+
+        deleted = await self._delete_rows(self._with_chunks(event_ids))
+        messages = [
+            ChatMessageSource(
+                room_id=row.room_id, event_id=row.event_id, thread_id=row.thread_id,
+                sender="", content="", timestamp=row.timestamp,
+            )
+            for row in deleted if row.kind == KIND_MESSAGE
+        ]
+        # Threads and windows quoting the message are rebuilt without it
+        await self._refresh_conversations(messages)
+        return len(messages)
+
+    @staticmethod
+    def _embedding_row(
+        room_id: str,
+        event_id: str,
+        sender: str,
+        content: str,
+        timestamp: datetime,
+        embedding: Optional[List[float]],
+        kind: str = KIND_MESSAGE,
+        thread_id: Optional[str] = None,
+    ) -> dict:
+        row = {
+            "room_id": room_id,
+            "event_id": event_id,
+            "sender": sender,
+            "content": content,
+            "timestamp": timestamp,
+            "kind": kind,
+            "thread_id": thread_id,
+        }
+        if database.PGVECTOR_AVAILABLE:
+            row["embedding"] = embedding
+        else:
+            row["embedding_json"] = json.dumps(embedding) if embedding is not None else None
+        return row
+
+    async def _embed_and_insert(
+        self, plan: List[tuple], replace: bool = False
+    ) -> tuple[int, int]:
+        """
+        Embed and store planned rows; returns (message rows written, requests).
+
+        ``plan`` holds (row without embedding, text to embed or None) pairs. Rows
+        are embedded in chunks of ``rag_embedding_batch_size`` with at most
+        ``rag_embedding_concurrency`` chunks in flight, and each chunk is
+        written with a single INSERT ... ON CONFLICT.
+
+        If a chunk fails to embed or insert, the error is raised once every
+        chunk has finished, so callers do not mistake the batch for stored.
+        Chunks that did get written are skipped as existing event IDs when the
+        batch is stored again.
+        """
+        batch_size = max(1, settings.rag_embedding_batch_size)
+        chunks = [plan[i:i + batch_size] for i in range(0, len(plan), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, settings.rag_embedding_concurrency))
+
+        async def process_chunk(chunk: list) -> int:
+            async with semaphore:
+                texts = [text for _, text in chunk if text is not None]
+                computed = iter(await self.get_embeddings(texts))
+                embeddings = [next(computed) if text is not None else None for _, text in chunk]
+                rows = [
+                    self._embedding_row(**row, embedding=embedding)
+                    for (row, _), embedding in zip(chunk, embeddings)
+                ]
+                return await self._insert_embedding_rows(rows, embeddings, replace)
+
+        results = await asyncio.gather(*(process_chunk(c) for c in chunks), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            print(f"[RAG] Error storing {len(errors)} of {len(chunks)} embedding batches: {errors[0]}")
+            raise errors[0]
+        return sum(results), len(chunks)
+
     async def store_message_embedding(
         self,
         room_id: str,
@@ -48,42 +348,318 @@ class RAGService:
         timestamp: datetime,
     ) -> bool:
         """Store a message with its embedding in the database."""
-        try:
-            embedding = await self.get_embedding(content)
+        message = ChatMessageSource(
+            room_id=room_id, event_id=event_id, sender=sender, content=content, timestamp=timestamp
+        )
+        stored, _ = await self.store_messages_batch([message], [event_id])
+        return stored > 0
+
+    async def _resolve_thread_roots(self, messages: List[ChatMessageSource]) -> dict:
+        """
+        Map event_id -> thread root for messages that are part of a thread or reply chain.
+
+        A reply's parent may itself be a reply, so the parent's own root is used
+        when the parent is known (earlier in the batch or already indexed).
+        """
+        parents = {msg.thread_id for msg in messages if msg.thread_id}
+        if not parents:
+            return {}
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(ChatMessageEmbedding.event_id, ChatMessageEmbedding.thread_id)
+                .where(ChatMessageEmbedding.event_id.in_(parents))
+            )
+            roots = {row.event_id: row.thread_id for row in result if row.thread_id}
+
+        for msg in sorted(messages, key=lambda m: m.timestamp):
+            if msg.thread_id and msg.event_id:
+                roots[msg.event_id] = roots.get(msg.thread_id, msg.thread_id)
+        return roots
+
+    async def store_messages_batch(
+        self,
+        messages: List[ChatMessageSource],
+        event_ids: List[str],
+        replace: bool = False,
+    ) -> tuple[int, float]:
+        """
+        Store multiple messages with embeddings.
+
+        Messages go through the chunker first: trivial messages ("+1",
+        "thanks") are stored without a vector of their own, long bodies are
+        split into overlapping chunks (extra rows ``<event_id>#<n>``), and the
+        threads and time windows the messages belong to are marked for a
+        conversation-level re-embed (see ``_refresh_conversations``). Existing event IDs are skipped or, with ``replace``,
+        overwritten. Embedding and database errors are raised.
+
+        Returns (stored_count, messages_per_second)
+        """
+        if not messages:
+            return 0, 0.0
+
+        started = time.perf_counter()
+        messages = [msg.model_copy(update={"event_id": event_id}) for msg, event_id in zip(messages, event_ids)]
+        roots = await self._resolve_thread_roots(messages)
+        messages = [msg.model_copy(update={"thread_id": roots.get(msg.event_id)}) for msg in messages]
+
+        if replace:
+            # An edit can change how many chunks a message has
+            await self._delete_rows(and_(
+                self._with_chunks(event_ids), ChatMessageEmbedding.kind == KIND_CHUNK
+            ))
 
+        plan = []
+        for msg in messages:
+            row = {
+                "room_id": msg.room_id, "event_id": msg.event_id, "sender": msg.sender,
+                "content": msg.content, "timestamp": msg.timestamp, "thread_id": msg.thread_id,
+            }
+            if is_trivial(msg.content):
+                plan.append((row, None))
+                continue
+            parts = split_text(msg.content)
+            plan.append((row, parts[0]))
+            for n, part in enumerate(parts[1:], start=1):
+                plan.append((
+                    {**row, "event_id": f"{msg.event_id}#{n}", "content": part, "kind": KIND_CHUNK},
+                    part,
+                ))
+
+        stored_count, requests = await self._embed_and_insert(plan, replace)
+        await self._refresh_conversations(messages)
+
+        elapsed = time.perf_counter() - started
+        rate = len(messages) / elapsed if elapsed > 0 else float(len(messages))
+        print(
+            f"[RAG] Indexed {stored_count}/{len(messages)} messages ({len(plan)} rows) in {elapsed:.2f}s "
+            f"({rate:.1f} msg/s, {requests} batches)"
+        )
+        return stored_count, rate
+
+    async def reembed_room(
+        self,
+        room_id: str,
+        resume: Optional[dict] = None,
+        checkpoint: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ) -> dict:
+        """
+        Re-embed every stored message of a room, e.g. after changing the chunking rules.
+
+        Message rows are read back in id order, ``rag_backfill_page_size`` at a
+        time, and rewritten through ``store_messages_batch(replace=True)`` so
+        chunks, threads and windows are rebuilt as well. ``checkpoint`` is
+        awaited with the progress after each page; passing it (or the returned
+        progress) back as ``resume`` continues after the last stored page.
+        """
+        after_id = (resume or {}).get("last_id", 0)
+        reembedded = (resume or {}).get("messages_reembedded", 0)
+        while True:
             async with async_session() as session:
-                stmt = insert(ChatMessageEmbedding).values(
-                    room_id=room_id,
-                    event_id=event_id,
-                    sender=sender,
-                    content=content,
-                    timestamp=timestamp,
-                    embedding=embedding,
-                ).on_conflict_do_nothing(index_elements=[ChatMessageEmbedding.event_id])
+                result = await session.execute(
+                    select(ChatMessageEmbedding)
+                    .where(
+                        ChatMessageEmbedding.room_id == room_id,
+                        ChatMessageEmbedding.kind == KIND_MESSAGE,
+                        ChatMessageEmbedding.id > after_id,
+                    )
+                    .order_by(ChatMessageEmbedding.id)
+                    .limit(settings.rag_backfill_page_size)
+                )
+                rows = result.scalars().all()
+            if not rows:
+                return {"room_id": room_id, "messages_reembedded": reembedded, "last_id": after_id}
+
+            messages = [
+                ChatMessageSource(
+                    room_id=row.room_id, event_id=row.event_id, thread_id=row.thread_id,
+                    sender=row.sender, content=row.content, timestamp=row.timestamp,
+                )
+                for row in rows
+            ]
+            stored, _ = await self.store_messages_batch(messages, [row.event_id for row in rows], replace=True)
+            reembedded += stored
+            after_id = rows[-1].id
+            if checkpoint is not None:
+                await checkpoint({"room_id": room_id, "messages_reembedded": reembedded, "last_id": after_id})
 
-                await session.execute(stmt)
-                await session.commit()
-                return True
+    async def _refresh_conversations(self, messages: List[ChatMessageSource]) -> None:
+        """
+        Mark the thread and window embeddings that ``messages`` belong to as stale.
+
+        Threaded messages feed the ``thread:<root>`` rows, unthreaded ones the
+        ``window:<room>:<bucket>`` rows covering ``rag_conversation_window_seconds``.
+        Marked conversations are rebuilt together after
+        ``rag_conversation_refresh_seconds``, or right away once
+        ``rag_conversation_refresh_max_pending`` are waiting, so a thread that
+        receives replies one at a time is embedded once per interval rather
+        than once per reply.
+        """
+        if not settings.rag_conversation_embeddings or not messages:
+            return
 
+        span = max(1, settings.rag_conversation_window_seconds)
+        pending = self._pending_conversations
+        for msg in messages:
+            if msg.thread_id:
+                pending.add(("thread", msg.room_id, msg.thread_id))
+            else:
+                # Thread roots are unthreaded messages but may already have replies
+                pending.add(("root", msg.room_id, msg.event_id))
+                pending.add(("window", msg.room_id, int(msg.timestamp.timestamp()) // span * span))
+
+        if (
+            settings.rag_conversation_refresh_seconds <= 0
+            or len(pending) >= settings.rag_conversation_refresh_max_pending
+        ):
+            await self.flush_conversations()
+        elif self._conversation_flush is None:
+            self._conversation_flush = asyncio.create_task(self._flush_conversations_later())
+
+    async def _flush_conversations_later(self) -> None:
+        await asyncio.sleep(settings.rag_conversation_refresh_seconds)
+        # Conversations marked from here on get a timer of their own
+        self._conversation_flush = None
+        try:
+            await self.flush_conversations()
         except Exception as e:
-            print(f"[RAG] Error storing embedding: {e}")
-            return False
+            print(f"[RAG] Error refreshing conversation embeddings: {e}")
+            # Still marked; try again after another interval
+            if self._conversation_flush is None:
+                self._conversation_flush = asyncio.create_task(self._flush_conversations_later())
 
-    async def store_messages_batch(
-        self, messages: List[ChatMessageSource], event_ids: List[str]
-    ) -> int:
-        """Store multiple messages with embeddings."""
-        stored_count = 0
-        for msg, event_id in zip(messages, event_ids):
-            if await self.store_message_embedding(
-                room_id=msg.room_id,
-                event_id=event_id,
-                sender=msg.sender,
-                content=msg.content,
-                timestamp=msg.timestamp,
-            ):
-                stored_count += 1
-        return stored_count
+    async def flush_conversations(self) -> None:
+        """Rebuild every conversation marked stale; on failure they stay marked and errors are raised."""
+        async with self._conversation_lock:
+            pending, self._pending_conversations = self._pending_conversations, set()
+            if not pending:
+                return
+            try:
+                await self._rebuild_conversations(pending)
+            except Exception:
+                self._pending_conversations |= pending
+                raise
+
+    async def _rebuild_conversations(self, pending: set) -> None:
+        """
+        Rebuild the given conversations from the stored messages.
+
+        A conversation is embedded in segments of
+        ``rag_conversation_segment_messages`` messages (``thread:<root>``,
+        ``thread:<root>:1``, ...), so a reply only changes the last segment and
+        a long thread never becomes one ever-growing transcript. Segments with
+        fewer than ``rag_conversation_min_messages`` messages get no row, and
+        segments whose text has not changed are not embedded again.
+        """
+        span = max(1, settings.rag_conversation_window_seconds)
+        threads = {(room_id, anchor) for kind, room_id, anchor in pending if kind == "thread"}
+        roots = [anchor for kind, _, anchor in pending if kind == "root"]
+        buckets = {(room_id, anchor) for kind, room_id, anchor in pending if kind == "window"}
+
+        columns = (
+            ChatMessageEmbedding.room_id,
+            ChatMessageEmbedding.event_id,
+            ChatMessageEmbedding.thread_id,
+            ChatMessageEmbedding.sender,
+            ChatMessageEmbedding.content,
+            ChatMessageEmbedding.timestamp,
+        )
+        groups: dict = {}
+        async with async_session() as session:
+            if threads or roots:
+                thread_ids = [root for _, root in threads] + roots
+                result = await session.execute(
+                    select(*columns)
+                    .where(
+                        ChatMessageEmbedding.kind == KIND_MESSAGE,
+                        or_(
+                            ChatMessageEmbedding.thread_id.in_(thread_ids),
+                            ChatMessageEmbedding.event_id.in_(thread_ids),
+                        ),
+                    )
+                    .order_by(ChatMessageEmbedding.timestamp)
+                )
+                for row in result:
+                    root = row.thread_id or row.event_id
+                    groups.setdefault(("thread", row.room_id, root), []).append(row)
+                threads |= {
+                    (room_id, root) for (_, room_id, root), rows in groups.items() if len(rows) > 1
+                }
+
+            if buckets:
+                result = await session.execute(
+                    select(*columns)
+                    .where(
+                        ChatMessageEmbedding.kind == KIND_MESSAGE,
+                        ChatMessageEmbedding.thread_id.is_(None),
+                        or_(*(
+                            and_(
+                                ChatMessageEmbedding.room_id == room_id,
+                                ChatMessageEmbedding.timestamp >= datetime.fromtimestamp(start),
+                                ChatMessageEmbedding.timestamp < datetime.fromtimestamp(start + span),
+                            )
+                            for room_id, start in buckets
+                        )),
+                    )
+                    .order_by(ChatMessageEmbedding.timestamp)
+                )
+                for row in result:
+                    start = int(row.timestamp.timestamp()) // span * span
+                    groups.setdefault(("window", row.room_id, start), []).append(row)
+
+        size = max(1, settings.rag_conversation_segment_messages)
+        min_messages = max(2, settings.rag_conversation_min_messages)
+        plan = []
+        stale = []
+        keys = [("thread", room_id, root) for room_id, root in threads]
+        keys += [("window", room_id, start) for room_id, start in buckets]
+        for key in keys:
+            kind, room_id, anchor = key
+            base = f"thread:{anchor}" if kind == "thread" else f"window:{room_id}:{anchor}"
+            rows = groups.get(key, [])
+            keep = []
+            for n in range(0, len(rows), size):
+                segment = rows[n:n + size]
+                if len(segment) < min_messages:
+                    continue
+                event_id = base if n == 0 else f"{base}:{n // size}"
+                keep.append(event_id)
+                text = conversation_text(segment)
+                plan.append(({
+                    "room_id": room_id,
+                    "event_id": event_id,
+                    "sender": "",  # a transcript has no single sender
+                    "content": text,
+                    "timestamp": segment[0].timestamp,
+                    "kind": KIND_THREAD if kind == "thread" else KIND_WINDOW,
+                    "thread_id": anchor if kind == "thread" else None,
+                }, text))
+            # Segments that no longer exist (deleted messages, fewer messages than before)
+            stale.append(and_(
+                or_(
+                    ChatMessageEmbedding.event_id == base,
+                    ChatMessageEmbedding.event_id.startswith(f"{base}:", autoescape=True),
+                ),
+                ChatMessageEmbedding.event_id.notin_(keep),
+            ))
+
+        if stale:
+            await self._delete_rows(and_(ChatMessageEmbedding.kind.in_(CONVERSATION_KINDS), or_(*stale)))
+        if plan:
+            # Unchanged segments (everything but the tail of a growing thread)
+            # keep their embedding instead of costing an API call
+            async with async_session() as session:
+                result = await session.execute(
+                    select(ChatMessageEmbedding.event_id, func.md5(ChatMessageEmbedding.content))
+                    .where(ChatMessageEmbedding.event_id.in_([row["event_id"] for row, _ in plan]))
+                )
+                stored = dict(result.all())
+            plan = [
+                (row, text) for row, text in plan
+                if stored.get(row["event_id"]) != hashlib.md5(text.encode("utf-8")).hexdigest()
+            ]
+        if plan:
+            await self._embed_and_insert(plan, replace=True)
 
     async def semantic_search(
         self,
@@ -92,93 +668,367 @@ class RAGService:
         limit: int = 10,
     ) -> List[ChatMessageSource]:
         """
-        Search for semantically similar messages using pgvector.
+        Search for semantically similar messages.
+
+        Uses pgvector when available, otherwise the memory-mapped embedding
+        store or the in-process NumPy index over the JSON embeddings.
         """
         try:
             query_embedding = await self.get_embedding(query)
 
-            async with async_session() as session:
-                # Build query with cosine distance
-                if room_ids:
-                    # Filter by room IDs
-                    sql = text("""
-                        SELECT room_id, sender, content, timestamp,
-                               1 - (embedding <=> :embedding) as similarity
-                        FROM chat_message_embeddings
-                        WHERE room_id = ANY(:room_ids)
-                        ORDER BY embedding <=> :embedding
-                        LIMIT :limit
-                    """)
-                    result = await session.execute(
-                        sql,
-                        {
-                            "embedding": str(query_embedding),
-                            "room_ids": room_ids,
-                            "limit": limit,
-                        },
-                    )
-                else:
-                    # Search all rooms
-                    sql = text("""
-                        SELECT room_id, sender, content, timestamp,
-                               1 - (embedding <=> :embedding) as similarity
+            if database.PGVECTOR_AVAILABLE:
+                return await self._pgvector_search(query_embedding, room_ids, limit)
+            if self.embedding_store:
+                return await self.embedding_store.search(query_embedding, room_ids, limit)
+            return await self.fallback_index.search(query_embedding, room_ids, limit)
+
+        except Exception as e:
+            print(f"[RAG] Error in semantic search: {e}")
+            return []
+
+    async def _pgvector_search(
+        self,
+        query_embedding: List[float],
+        room_ids: Optional[List[str]],
+        limit: int,
+    ) -> List[ChatMessageSource]:
+        """
+        Top-k cosine search served by the HNSW/IVFFlat index.
+
+        The ANN index only yields ``ef_search`` (or ``probes`` lists worth of)
+        neighbours, and the room filter is applied to those, so a small room in
+        a large table can come back short. Room-filtered queries therefore use
+        iterative index scans where pgvector supports them, and fall back to an
+        exact scan of the rooms' rows when the index still returns fewer than
+        ``limit`` rows.
+
+        Chunk, thread and window rows are returned with their ``kind``, so
+        callers can tell them from single messages.
+        """
+        iterative = bool(room_ids) and database.PGVECTOR_ITERATIVE_SCAN
+        async with async_session() as session:
+            # Per-transaction ANN tuning; both settings are ignored by the other index type
+            await session.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef_search, true), "
+                     "set_config('ivfflat.probes', :probes, true)"),
+                {
+                    "ef_search": str(max(settings.rag_hnsw_ef_search, limit)),
+                    "probes": str(settings.rag_ivfflat_probes),
+                },
+            )
+            if iterative:
+                # relaxed_order may return neighbours slightly out of order; re-sorted below
+                await session.execute(text(
+                    "SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true), "
+                    "set_config('ivfflat.iterative_scan', 'relaxed_order', true)"
+                ))
+
+            room_filter = "AND room_id = ANY(:room_ids)" if room_ids else ""
+            sql = text(f"""
+                WITH hits AS MATERIALIZED (
+                    SELECT room_id, event_id, thread_id, kind, sender, content, timestamp,
+                           embedding <=> :embedding AS distance
+                    FROM chat_message_embeddings
+                    WHERE embedding IS NOT NULL {room_filter}
+                    ORDER BY embedding <=> :embedding
+                    LIMIT :limit
+                )
+                SELECT *, 1 - distance AS similarity FROM hits ORDER BY distance
+            """).bindparams(bindparam("embedding", type_=Vector(self.embedding_dimension)))
+
+            params = {"embedding": query_embedding, "limit": limit}
+            if room_ids:
+                params["room_ids"] = room_ids
+            rows = (await session.execute(sql, params)).fetchall()
+
+            if room_ids and len(rows) < limit:
+                # Exact scan: the materialized CTE keeps the planner off the ANN
+                # index and reads the rooms' rows through the room_id index
+                exact = text("""
+                    WITH room_rows AS MATERIALIZED (
+                        SELECT room_id, event_id, thread_id, kind, sender, content, timestamp,
+                               embedding <=> :embedding AS distance
                         FROM chat_message_embeddings
-                        ORDER BY embedding <=> :embedding
-                        LIMIT :limit
-                    """)
-                    result = await session.execute(
-                        sql,
-                        {"embedding": str(query_embedding), "limit": limit},
+                        WHERE embedding IS NOT NULL AND room_id = ANY(:room_ids)
                     )
+                    SELECT *, 1 - distance AS similarity FROM room_rows ORDER BY distance LIMIT :limit
+                """).bindparams(bindparam("embedding", type_=Vector(self.embedding_dimension)))
+                rows = (await session.execute(exact, params)).fetchall()
 
-                rows = result.fetchall()
+            return [
+                ChatMessageSource(
+                    room_id=row.room_id,
+                    event_id=row.event_id,
+                    thread_id=row.thread_id,
+                    kind=row.kind,
+                    sender="" if row.kind in CONVERSATION_KINDS else row.sender,
+                    content=row.content,
+                    timestamp=row.timestamp,
+                    score=row.similarity,
+                )
+                for row in rows
+            ]
+
+    async def lexical_search(
+        self,
+        query: str,
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+    ) -> List[ChatMessageSource]:
+        """
+        Full-text search over the GIN-indexed ``content_tsv`` column.
+
+        Query terms are OR-ed and ranked with ts_rank_cd, so messages that
+        contain more of the terms (error codes, package names, ...) rank first.
+        """
+        if not database.FULLTEXT_AVAILABLE:
+            return []
+
+        try:
+            room_filter = "AND room_id = ANY(:room_ids)" if room_ids else ""
+            sql = text(f"""
+                SELECT room_id, event_id, sender, content, timestamp,
+                       ts_rank_cd(content_tsv, query) AS rank
+                FROM chat_message_embeddings,
+                     CAST(replace(CAST(plainto_tsquery(CAST(:config AS regconfig), :query) AS text),
+                                  '&', '|') AS tsquery) AS query
+                WHERE content_tsv @@ query AND kind = 'message' {room_filter}
+                ORDER BY rank DESC
+                LIMIT :limit
+            """)
+            params = {"config": settings.rag_fulltext_config, "query": query, "limit": limit}
+            if room_ids:
+                params["room_ids"] = room_ids
 
+            async with async_session() as session:
+                result = await session.execute(sql, params)
                 return [
                     ChatMessageSource(
                         room_id=row.room_id,
+                        event_id=row.event_id,
                         sender=row.sender,
                         content=row.content,
                         timestamp=row.timestamp,
+                        score=row.rank,
                     )
-                    for row in rows
+                    for row in result.fetchall()
                 ]
 
         except Exception as e:
-            print(f"[RAG] Error in semantic search: {e}")
+            print(f"[RAG] Error in lexical search: {e}")
             return []
 
+    async def hybrid_search(
+        self,
+        query: str,
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+    ) -> List[ChatMessageSource]:
+        """
+        Vector and full-text search run concurrently, merged with reciprocal rank fusion.
+
+        Each result scores sum(1 / (k + rank)) over the lists it appears in, so
+        messages found by both retrievers rise to the top while keyword-only
+        hits (which embeddings handle poorly) still make it into the results.
+        """
+        candidates = max(limit, settings.rag_hybrid_candidates)
+        vector_hits, lexical_hits = await asyncio.gather(
+            self.semantic_search(query, room_ids, candidates),
+            self.lexical_search(query, room_ids, candidates),
+        )
+
+        k = settings.rag_rrf_k
+        fused: dict = {}
+        for hits in (vector_hits, lexical_hits):
+            for rank, msg in enumerate(hits, start=1):
+                key = msg.event_id or (msg.room_id, msg.sender, msg.timestamp, msg.content)
+                score, first = fused.get(key, (0.0, msg))
+                fused[key] = (score + 1.0 / (k + rank), first)
+
+        ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:limit]
+        return [msg.model_copy(update={"score": score}) for score, msg in ranked]
+
+    async def retrieve_with_timings(
+        self,
+        query: str,
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+        rerank: Optional[bool] = None,
+        rerank_budget_ms: Optional[float] = None,
+    ) -> tuple[List[ChatMessageSource], dict]:
+        """
+        Retrieve messages for a query, reporting how long each stage took.
+
+        The first stage is hybrid retrieval when enabled, otherwise vector
+        search alone. With reranking (default ``rag_rerank_enabled``) it
+        over-fetches ``rag_rerank_candidates`` and the reranker picks the top
+        ``limit`` within ``rerank_budget_ms``, keeping first-stage order if
+        the budget runs out.
+
+        Returns (messages, timings)
+        """
+        if rerank is None:
+            rerank = settings.rag_rerank_enabled
+        fetch = max(limit, settings.rag_rerank_candidates) if rerank else limit
+
+        started = time.perf_counter()
+        if settings.rag_hybrid_enabled:
+            candidates = await self.hybrid_search(query, room_ids, fetch)
+        else:
+            candidates = await self.semantic_search(query, room_ids, fetch)
+        timings = {
+            "retrieve_ms": round((time.perf_counter() - started) * 1000, 1),
+            "candidates": len(candidates),
+        }
+
+        if not rerank:
+            return candidates, timings
+        results, rerank_timings = await reranker.rerank(query, candidates, limit, rerank_budget_ms)
+        return results, {**timings, **rerank_timings}
+
+    async def retrieve(
+        self,
+        query: str,
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+        rerank_budget_ms: Optional[float] = None,
+    ) -> List[ChatMessageSource]:
+        """Messages for a query through the configured retrieval stages."""
+        results, _ = await self.retrieve_with_timings(
+            query, room_ids, limit, rerank_budget_ms=rerank_budget_ms
+        )
+        return results
+
+    async def expand_windows(
+        self,
+        hits: List[ChatMessageSource],
+        neighbours: Optional[int] = None,
+        window_seconds: Optional[int] = None,
+    ) -> List[List[ChatMessageSource]]:
+        """
+        Expand hits into time-ordered windows of the surrounding messages.
+
+        Each hit takes up to ``neighbours`` messages on either side from the
+        same room, no more than ``window_seconds`` away. Every room is read
+        with a single range query on (room_id, timestamp) covering all of its
+        hits, and windows that overlap or touch are merged, so a busy thread is
+        only included once. Thread and window hits already hold their
+        conversation's transcript and stay windows of their own. Windows are
+        returned in order of their best hit.
+        """
+        neighbours = settings.rag_context_window_messages if neighbours is None else neighbours
+        span = timedelta(
+            seconds=settings.rag_context_window_seconds if window_seconds is None else window_seconds
+        )
+        rank = {id(hit): i for i, hit in enumerate(hits)}
+        conversations = [(rank[id(hit)], [hit]) for hit in hits if hit.kind in CONVERSATION_KINDS]
+        by_room: dict = {}
+        for hit in hits:
+            if hit.kind not in CONVERSATION_KINDS:
+                by_room.setdefault(hit.room_id, []).append(hit)
+
+        async def room_windows(room_id: str, room_hits: List[ChatMessageSource]) -> list:
+            # Merge the hits' time ranges so the OR-ed BETWEENs do not overlap
+            intervals = []
+            for hit in sorted(room_hits, key=lambda h: h.timestamp):
+                start, end = hit.timestamp - span, hit.timestamp + span
+                if intervals and start <= intervals[-1][1]:
+                    intervals[-1][1] = max(intervals[-1][1], end)
+                else:
+                    intervals.append([start, end])
+
+            async with async_session() as session:
+                result = await session.execute(
+                    select(
+                        ChatMessageEmbedding.event_id,
+                        ChatMessageEmbedding.sender,
+                        ChatMessageEmbedding.content,
+                        ChatMessageEmbedding.timestamp,
+                    )
+                    .where(
+                        ChatMessageEmbedding.room_id == room_id,
+                        ChatMessageEmbedding.kind == KIND_MESSAGE,
+                        or_(*(ChatMessageEmbedding.timestamp.between(a, b) for a, b in intervals)),
+                    )
+                    .order_by(ChatMessageEmbedding.timestamp, ChatMessageEmbedding.id)
+                )
+                rows = result.fetchall()
+
+            timeline = [
+                ChatMessageSource(
+                    room_id=room_id,
+                    event_id=row.event_id,
+                    sender=row.sender,
+                    content=row.content,
+                    timestamp=row.timestamp,
+                )
+                for row in rows
+            ]
+            position = {msg.event_id: i for i, msg in enumerate(timeline)}
+
+            # (first, last, best rank) index ranges into the timeline
+            ranges = []
+            windows = []
+            for hit in room_hits:
+                i = position.get(hit.event_id)
+                if i is None:
+                    # Not in the index (e.g. a Matrix search result): window of one
+                    windows.append((rank[id(hit)], [hit]))
+                    continue
+                timeline[i] = hit  # keep the hit's score
+                ranges.append((max(0, i - neighbours), min(len(timeline) - 1, i + neighbours), rank[id(hit)]))
+
+            merged = []
+            for first, last, best in sorted(ranges):
+                if merged and first <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], last), min(merged[-1][2], best))
+                else:
+                    merged.append((first, last, best))
+            windows.extend((best, timeline[first:last + 1]) for first, last, best in merged)
+            return windows
+
+        try:
+            results = await asyncio.gather(
+                *(room_windows(room_id, room_hits) for room_id, room_hits in by_room.items())
+            )
+        except Exception as e:
+            print(f"[RAG] Error expanding context windows: {e}")
+            return [[hit] for hit in hits]
+
+        windows = conversations + [window for room in results for window in room]
+        return [window for _, window in sorted(windows, key=lambda w: w[0])]
+
     async def get_relevant_context(
         self,
         query: str,
         room_ids: Optional[List[str]] = None,
         max_tokens: int = 2000,
+        expand: Optional[bool] = None,
+        rerank_budget_ms: Optional[float] = None,
     ) -> tuple[str, List[ChatMessageSource]]:
         """
         Get relevant context for a query, formatted for LLM consumption.
+
+        With ``expand`` (default ``rag_context_expand_windows``) each hit is
+        widened into a window of its neighbouring messages.
         
         Returns (context_string, source_messages)
         """
-        messages = await self.semantic_search(query, room_ids, limit=20)
+        if expand is None:
+            expand = settings.rag_context_expand_windows
 
-        if not messages:
-            return "", []
-
-        # Build context string, respecting token limit (roughly 4 chars per token)
-        context_parts = []
-        total_chars = 0
-        max_chars = max_tokens * 4
-        included_messages = []
+        if not expand:
+            messages = await self.retrieve(
+                query, room_ids, limit=candidate_limit(max_tokens), rerank_budget_ms=rerank_budget_ms
+            )
+            return pack_context(messages, max_tokens)
 
-        for msg in messages:
-            msg_text = f"[{msg.sender}] ({msg.timestamp.strftime('%Y-%m-%d %H:%M')}): {msg.content}"
-            if total_chars + len(msg_text) > max_chars:
-                break
-            context_parts.append(msg_text)
-            total_chars += len(msg_text)
-            included_messages.append(msg)
-
-        context = "\n".join(context_parts)
-        return context, included_messages
+        # Each hit brings its neighbours along, so fewer hits fill the budget
+        limit = max(candidate_limit(max_tokens) // (2 * settings.rag_context_window_messages + 1), 5)
+        hits = await self.retrieve(query, room_ids, limit=limit, rerank_budget_ms=rerank_budget_ms)
+        if not hits:
+            return "", []
+        return pack_windows(await self.expand_windows(hits), max_tokens)
 
 
 # Singleton instance
@@ -0,0 +1,157 @@
+"""Second-stage reranking of retrieval candidates under a latency budget."""
+
+import asyncio
+import math
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from ..config import get_settings
+from ..models.schemas import ChatMessageSource
+
+settings = get_settings()
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+# Latin words/numbers as tokens, CJK characters one by one
+_TOKEN = re.compile(r"[a-z0-9_.\-]+|[\u3400-\u9fff]")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class Reranker:
+    """
+    Rescores over-fetched candidates with a local model.
+
+    Uses a sentence-transformers cross-encoder when ``rag_rerank_model`` is set
+    and the package is installed; otherwise BM25 over the candidate set, which
+    rewards exact term overlap (error codes, identifiers) that embedding order
+    tends to blur. The model score is blended with the first-stage rank so
+    reranking refines the retrieval order rather than replacing it.
+
+    Scoring runs on a small thread pool. If it does not finish within the
+    latency budget the candidates are returned in first-stage order; the
+    worker thread is left to finish in the background. While every worker is
+    still busy (e.g. with scoring that overran its budget) new requests are
+    not queued behind it but skipped straight away.
+
+    The cross-encoder is loaded in the background at startup; BM25 is used
+    until it is ready.
+    """
+
+    def __init__(self):
+        self._workers = max(1, settings.rag_rerank_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="rerank")
+        self._in_flight = 0
+        self._model = None
+        self._loading: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start loading the cross-encoder, if one is configured."""
+        if self._loading is None and CrossEncoder and settings.rag_rerank_model:
+            self._loading = asyncio.create_task(asyncio.to_thread(self._load_model))
+
+    def _load_model(self) -> None:
+        try:
+            self._model = CrossEncoder(settings.rag_rerank_model)
+            print(f"[Rerank] Loaded {settings.rag_rerank_model}")
+        except Exception as e:
+            print(f"[Rerank] Could not load {settings.rag_rerank_model}, using BM25: {e}")
+
+    @staticmethod
+    def _bm25(query: str, documents: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+        terms = set(_tokens(query))
+        docs = [Counter(_tokens(doc)) for doc in documents]
+        if not terms or not docs:
+            return [0.0] * len(documents)
+
+        avg_length = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+        idf = {}
+        for term in terms:
+            df = sum(1 for doc in docs if term in doc)
+            idf[term] = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+
+        scores = []
+        for doc in docs:
+            length = sum(doc.values())
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+            scores.append(score)
+        return scores
+
+    def _score(self, query: str, candidates: List[ChatMessageSource]) -> List[float]:
+        documents = [msg.content for msg in candidates]
+        model = self._model
+        if model is not None:
+            raw = [float(s) for s in model.predict([(query, doc) for doc in documents])]
+        else:
+            raw = self._bm25(query, documents)
+
+        # Min-max normalise, then blend with the first-stage reciprocal rank
+        low, high = min(raw), max(raw)
+        spread = (high - low) or 1.0
+        weight = settings.rag_rerank_weight
+        return [
+            weight * (score - low) / spread + (1 - weight) / (rank + 1)
+            for rank, score in enumerate(raw)
+        ]
+
+    async def rerank(
+        self,
+        query: str,
+        candidates: List[ChatMessageSource],
+        limit: int,
+        budget_ms: Optional[float] = None,
+    ) -> Tuple[List[ChatMessageSource], dict]:
+        """
+        Rerank ``candidates`` (in first-stage order) and keep the top ``limit``.
+
+        Returns (results, timings) where timings has ``rerank_ms`` and
+        ``rerank_status`` (applied / timeout / error / busy / skipped).
+        """
+        if len(candidates) <= 1:
+            return candidates[:limit], {"rerank_ms": 0.0, "rerank_status": "skipped"}
+        if self._in_flight >= self._workers:
+            return candidates[:limit], {"rerank_ms": 0.0, "rerank_status": "busy"}
+
+        budget_ms = settings.rag_rerank_budget_ms if budget_ms is None else budget_ms
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._score, query, candidates)
+        # Counted until the thread finishes, even if the request stops waiting
+        self._in_flight += 1
+        future.add_done_callback(self._finished)
+        try:
+            # shield: a timeout must not cancel the future before the thread is done
+            scores = await asyncio.wait_for(asyncio.shield(future), timeout=budget_ms / 1000)
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+            results = [candidates[i].model_copy(update={"score": scores[i]}) for i in order[:limit]]
+            status = "applied"
+        except asyncio.TimeoutError:
+            results, status = candidates[:limit], "timeout"
+        except Exception as e:
+            print(f"[Rerank] Error reranking: {e}")
+            results, status = candidates[:limit], "error"
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return results, {"rerank_ms": round(elapsed_ms, 1), "rerank_status": status}
+
+    def _finished(self, future: asyncio.Future) -> None:
+        self._in_flight -= 1
+        # Mark the error of scoring nobody waited for as retrieved, so asyncio does not log it
+        if not future.cancelled():
+            future.exception()
+
+
+# Singleton instance
+reranker = Reranker()
@@ -0,0 +1,264 @@
+"""Resumable full-history backfill of room messages into the RAG index."""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select, update
+
+from ..config import get_settings
+from ..database import async_session, RoomBackfillJob
+from .matrix_messages import matrix_messages_service
+from .rag_service import rag_service
+
+settings = get_settings()
+
+
+class RoomBackfillService:
+    """
+    Pages backwards through a room's history and indexes every message.
+
+    Pages of ``rag_backfill_page_size`` events are fetched with ``/messages``
+    ``from`` tokens. Fetching runs one page ahead of embedding, so the next
+    request to Synapse is in flight while the current page is embedded and
+    inserted. After each page is stored its continuation token is written to
+    ``room_backfill_jobs``; an interrupted or failed job resumes from the first
+    page that was not fully stored when it is run again.
+
+    Backfills are scheduled through the indexing job queue, which runs them
+    on its workers and retries failures.
+    """
+
+    async def run(
+        self,
+        room_id: str,
+        access_token: str,
+        max_messages: Optional[int] = None,
+        restart: bool = False,
+    ) -> dict:
+        """
+        Run or resume the backfill of a room and return its final progress. Errors are raised.
+
+        Once the history has been backfilled, running it again only catches up
+        on messages sent since.
+        """
+        completed = None
+        async with async_session() as session:
+            job = await session.scalar(select(RoomBackfillJob).where(RoomBackfillJob.room_id == room_id))
+
+            if job is None:
+                job = RoomBackfillJob(room_id=room_id)
+                session.add(job)
+            elif job.status == "completed" and not restart:
+                completed = job
+            elif restart:
+                job.from_token = None
+                job.pages_done = 0
+                job.messages_fetched = 0
+                job.messages_indexed = 0
+                job.newest_ts = None
+                job.oldest_ts = None
+                job.elapsed_seconds = 0.0
+
+            if completed is None:
+                job.status = "running"
+                job.max_messages = max_messages
+                job.error = None
+                await session.commit()
+                await session.refresh(job)
+
+        if completed is not None:
+            started = time.perf_counter()
+            caught_up = await self.catch_up(room_id, access_token, max_messages)
+            await self._checkpoint(
+                completed.id,
+                messages_fetched=RoomBackfillJob.messages_fetched + caught_up["messages_fetched"],
+                messages_indexed=RoomBackfillJob.messages_indexed + caught_up["messages_indexed"],
+                elapsed_seconds=RoomBackfillJob.elapsed_seconds + time.perf_counter() - started,
+            )
+        else:
+            await self._run(job, access_token)
+        return await self.progress(room_id)
+
+    async def catch_up(
+        self,
+        room_id: str,
+        access_token: str,
+        max_messages: Optional[int] = None,
+        resume: Optional[dict] = None,
+        checkpoint: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ) -> dict:
+        """
+        Index the newest messages of a room until already-indexed history is reached.
+
+        Pages backwards from the latest message and stops at the first page
+        that adds nothing new, which fills gaps (e.g. a limited /sync
+        timeline) without re-reading the whole room. Storage errors are raised.
+
+        ``checkpoint`` is awaited with the progress after each stored page.
+        Passing the last checkpoint back as ``resume`` retries from the page
+        that failed; that page does not count as already indexed even if the
+        failed attempt managed to store all of its messages.
+        """
+        progress = {"room_id": room_id, "pages": 0, "messages_fetched": 0, "messages_indexed": 0, "from_token": None}
+        progress.update(resume or {})
+        retrying = resume is not None
+        while True:
+            messages, token = await matrix_messages_service.fetch_messages_page(
+                room_id, access_token, settings.rag_backfill_page_size, progress["from_token"]
+            )
+            if max_messages is not None:
+                messages = messages[:max(max_messages - progress["messages_fetched"], 0)]
+            messages = [msg for msg in messages if msg.event_id]
+            stored, _ = await rag_service.store_messages_batch(messages, [msg.event_id for msg in messages])
+
+            progress["pages"] += 1
+            progress["messages_fetched"] += len(messages)
+            progress["messages_indexed"] += stored
+            progress["from_token"] = token
+            reached_indexed = bool(messages) and not stored and not retrying
+            retrying = False
+            if (
+                token is None
+                or reached_indexed
+                or (max_messages is not None and progress["messages_fetched"] >= max_messages)
+            ):
+                progress.pop("from_token")
+                return progress
+            if checkpoint is not None:
+                await checkpoint(progress)
+
+    async def progress(self, room_id: str) -> Optional[dict]:
+        """Progress of the room's backfill, or None if it was never started."""
+        async with async_session() as session:
+            job = await session.scalar(select(RoomBackfillJob).where(RoomBackfillJob.room_id == room_id))
+        return self._progress(job) if job else None
+
+    # ----- job execution -----
+
+    async def _checkpoint(self, job_id: int, **values) -> None:
+        async with async_session() as session:
+            await session.execute(update(RoomBackfillJob).where(RoomBackfillJob.id == job_id).values(**values))
+            await session.commit()
+
+    async def _run(self, job: RoomBackfillJob, access_token: str) -> None:
+        started = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def fetch_pages() -> None:
+            token = job.from_token
+            fetched = job.messages_fetched
+            try:
+                while True:
+                    messages, token = await matrix_messages_service.fetch_messages_page(
+                        job.room_id, access_token, settings.rag_backfill_page_size, token
+                    )
+                    if job.max_messages is not None:
+                        messages = messages[:max(job.max_messages - fetched, 0)]
+                    fetched += len(messages)
+                    done = token is None or (job.max_messages is not None and fetched >= job.max_messages)
+                    await queue.put((messages, token, done))
+                    if done:
+                        return
+            except Exception as e:
+                await queue.put(e)
+
+        fetcher = asyncio.create_task(fetch_pages())
+        try:
+            if job.room_start_ts is None:
+                job.room_start_ts = await matrix_messages_service.get_room_start_time(job.room_id, access_token)
+                await self._checkpoint(job.id, room_start_ts=job.room_start_ts)
+
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                messages, token, done = item
+
+                messages = [msg for msg in messages if msg.event_id]
+                # Raises if the page was not fully stored, so from_token stays on it
+                indexed, _ = await rag_service.store_messages_batch(
+                    messages, [msg.event_id for msg in messages]
+                )
+
+                job.pages_done += 1
+                job.messages_fetched += len(messages)
+                job.messages_indexed += indexed
+                if messages:
+                    job.newest_ts = job.newest_ts or messages[0].timestamp
+                    job.oldest_ts = messages[-1].timestamp
+                await self._checkpoint(
+                    job.id,
+                    status="completed" if done else "running",
+                    from_token=token,
+                    pages_done=job.pages_done,
+                    messages_fetched=job.messages_fetched,
+                    messages_indexed=job.messages_indexed,
+                    newest_ts=job.newest_ts,
+                    oldest_ts=job.oldest_ts,
+                    elapsed_seconds=job.elapsed_seconds + time.perf_counter() - started,
+                )
+                if done:
+                    print(
+                        f"[Backfill] {job.room_id}: indexed {job.messages_indexed} of "
+                        f"{job.messages_fetched} messages in {job.pages_done} pages"
+                    )
+                    return
+
+        except asyncio.CancelledError:
+            await self._checkpoint(job.id, status="paused")
+            raise
+        except Exception as e:
+            print(f"[Backfill] {job.room_id} failed: {e}")
+            await self._checkpoint(job.id, status="failed", error=str(e))
+            raise
+        finally:
+            fetcher.cancel()
+
+    # ----- progress -----
+
+    @staticmethod
+    def _progress(job: RoomBackfillJob) -> dict:
+        """
+        Progress and ETA of a job.
+
+        Matrix does not report how many events a room has, so without a
+        message cap the fraction done is estimated from how far back in time
+        the backfill has reached relative to the room's first event.
+        """
+        fraction: Optional[float] = None
+        if job.status == "completed":
+            fraction = 1.0
+        elif job.max_messages:
+            fraction = job.messages_fetched / job.max_messages
+        elif job.newest_ts and job.oldest_ts and job.room_start_ts:
+            span = (job.newest_ts - job.room_start_ts).total_seconds()
+            if span > 0:
+                fraction = (job.newest_ts - job.oldest_ts).total_seconds() / span
+        if fraction is not None:
+            fraction = min(max(fraction, 0.0), 1.0)
+
+        elapsed = job.elapsed_seconds or 0.0
+        eta: Optional[float] = None
+        if fraction == 1.0:
+            eta = 0.0
+        elif fraction and elapsed:
+            eta = elapsed * (1 - fraction) / fraction
+
+        return {
+            "room_id": job.room_id,
+            "status": job.status,
+            "pages_done": job.pages_done,
+            "messages_fetched": job.messages_fetched,
+            "messages_indexed": job.messages_indexed,
+            "oldest_indexed": job.oldest_ts.isoformat() if job.oldest_ts else None,
+            "progress": round(fraction, 4) if fraction is not None else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "messages_per_second": round(job.messages_fetched / elapsed, 1) if elapsed else 0.0,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "error": job.error,
+        }
+
+
+# Singleton instance
+room_backfill_service = RoomBackfillService()
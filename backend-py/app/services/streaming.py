@@ -0,0 +1,46 @@
+"""Server-Sent Events helpers for streaming LLM answers."""
+
+import json
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+# Proxies (nginx) must not buffer the stream, or the client sees it all at once
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data) -> str:
+    """Encode one SSE event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_answer_events(sources: dict, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Event sequence shared by the streaming endpoints.
+
+    ``sources`` goes out first so clients can render retrieval results before
+    the answer, then one ``token`` event per completion delta and finally
+    ``done`` with the full answer (or ``error`` if the LLM call failed).
+    """
+    yield sse_event("sources", sources)
+
+    parts = []
+    try:
+        async for token in tokens:
+            parts.append(token)
+            yield sse_event("token", {"text": token})
+    except Exception as e:
+        print(f"[LLM] Error while streaming: {e}")
+        yield sse_event("error", {"detail": f"Error connecting to AI service: {e}"})
+        return
+
+    answer = "".join(parts) or "No response generated."
+    yield sse_event("done", {"answer": answer})
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap an event generator in a text/event-stream response."""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
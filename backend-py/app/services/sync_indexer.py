@@ -0,0 +1,243 @@
+"""Background indexer that keeps chat_message_embeddings in step with Matrix /sync."""
+
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from ..config import get_settings
+from ..database import async_session, engine, ChatMessageEmbedding, MatrixSyncState
+from ..models.schemas import ChatMessageSource
+from .http_clients import http_clients
+from .chunker import KIND_MESSAGE
+from .matrix_messages import event_thread_id
+from .rag_service import rag_service
+
+settings = get_settings()
+
+
+class MatrixSyncIndexer:
+    """
+    Follows ``/sync`` as the bot account and indexes room messages as they arrive.
+
+    The ``next_batch`` token is persisted in ``matrix_sync_state`` only after
+    each batch has been indexed, so a restart resumes where it stopped instead
+    of re-scanning rooms, and a batch that fails to store (e.g. the embeddings
+    API erroring) is synced again from the same token after a backoff. New ``m.room.message`` events are stored under their
+    real event IDs, edits (``m.replace``) overwrite the original message's row
+    (keeping its thread and timestamp) and redactions delete it. A Postgres advisory lock keeps a single indexer
+    running per account when several workers are started.
+    """
+
+    RETRY_MAX_SECONDS = 60.0
+
+    def __init__(self):
+        self.homeserver_url = settings.matrix_homeserver_url
+        self.account = settings.matrix_bot_user_id
+        self.access_token = settings.matrix_bot_access_token
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.rag_sync_indexer_enabled and bool(self.account and self.access_token)
+
+    def start(self) -> None:
+        """Start the indexer task if it is configured."""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        print(f"[SyncIndexer] Following /sync as {self.account}")
+
+    async def stop(self) -> None:
+        """Cancel the indexer task and wait for it to finish."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # ----- sync loop -----
+
+    async def _run(self) -> None:
+        # The advisory lock lives as long as this connection
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            while not await conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"),
+                {"key": f"matrix_sync:{self.account}"},
+            ):
+                await asyncio.sleep(self.RETRY_MAX_SECONDS)
+
+            since = await self._load_since()
+            delay = 1.0
+            while True:
+                try:
+                    data = await self._sync(since)
+                    # Storage errors propagate, leaving since on this batch for the retry
+                    await self._index_batch(data)
+                    since = data["next_batch"]
+                    await self._save_since(since)
+                    delay = 1.0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[SyncIndexer] Sync failed, retrying in {delay:.0f}s: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.RETRY_MAX_SECONDS)
+
+    async def _sync(self, since: Optional[str]) -> dict:
+        # Only message timelines are needed; skip state, presence and account data
+        sync_filter = {
+            "presence": {"types": []},
+            "account_data": {"types": []},
+            "room": {
+                "state": {"types": []},
+                "ephemeral": {"types": []},
+                "account_data": {"types": []},
+                "timeline": {
+                    "types": ["m.room.message", "m.room.redaction"],
+                    "limit": settings.rag_sync_timeline_limit,
+                },
+            },
+        }
+        params = {"filter": json.dumps(sync_filter), "timeout": settings.rag_sync_timeout_ms}
+        if since:
+            params["since"] = since
+
+        response = await http_clients.get("synapse").get(
+            f"{self.homeserver_url}/_matrix/client/v3/sync",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            params=params,
+            # The read timeout has to outlast the long-poll
+            timeout=httpx.Timeout(
+                settings.http_timeout_seconds + settings.rag_sync_timeout_ms / 1000,
+                connect=settings.http_connect_timeout_seconds,
+            ),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _load_since(self) -> Optional[str]:
+        async with async_session() as session:
+            return await session.scalar(
+                select(MatrixSyncState.since_token).where(MatrixSyncState.account == self.account)
+            )
+
+    async def _save_since(self, since: str) -> None:
+        async with async_session() as session:
+            stmt = insert(MatrixSyncState).values(account=self.account, since_token=since)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[MatrixSyncState.account],
+                set_={"since_token": stmt.excluded.since_token, "updated_at": func.now()},
+            ))
+            await session.commit()
+
+    # ----- event handling -----
+
+    async def _index_batch(self, data: dict) -> None:
+        new: Dict[str, ChatMessageSource] = {}
+        edits: Dict[str, ChatMessageSource] = {}
+        redacted: List[str] = []
+
+        for room_id, room in data.get("rooms", {}).get("join", {}).items():
+            timeline = room.get("timeline", {})
+            if timeline.get("limited"):
+                print(f"[SyncIndexer] Timeline gap in {room_id}; queue an index job (/ai/jobs?kind=index) to fill it")
+
+            for event in timeline.get("events", []):
+                event_type = event.get("type")
+                content = event.get("content", {})
+
+                if event_type == "m.room.redaction":
+                    target = event.get("redacts") or content.get("redacts")
+                    if target:
+                        new.pop(target, None)
+                        edits.pop(target, None)
+                        redacted.append(target)
+                    continue
+                if event_type != "m.room.message":
+                    continue
+
+                relation = content.get("m.relates_to") or {}
+                if relation.get("rel_type") == "m.replace":
+                    target = relation.get("event_id")
+                    body = (content.get("m.new_content") or {}).get("body", "")
+                    if not target or not body:
+                        continue
+                    if target in new:
+                        new[target] = new[target].model_copy(update={"content": body})
+                    else:
+                        edits[target] = self._source(room_id, target, event, body)
+                    continue
+
+                body = content.get("body", "")
+                if body and event.get("event_id"):
+                    new[event["event_id"]] = self._source(
+                        room_id, event["event_id"], event, body, event_thread_id(content)
+                    )
+
+        if new:
+            await rag_service.store_messages_batch(list(new.values()), list(new))
+        if edits:
+            edits = await self._with_original_rows(edits)
+            await rag_service.store_messages_batch(list(edits.values()), list(edits), replace=True)
+        if redacted:
+            await rag_service.delete_message_embeddings(redacted)
+
+        if new or edits or redacted:
+            print(
+                f"[SyncIndexer] {len(new)} new, {len(edits)} edited, "
+                f"{len(redacted)} redacted messages"
+            )
+
+    @staticmethod
+    async def _with_original_rows(edits: Dict[str, ChatMessageSource]) -> Dict[str, ChatMessageSource]:
+        """
+        Give edits the thread and timestamp of the message they replace.
+
+        An edit event carries neither, so without this an edited thread reply
+        would be re-indexed as unthreaded at the edit time, refreshing the
+        wrong window and leaving its thread stale.
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                select(
+                    ChatMessageEmbedding.event_id, ChatMessageEmbedding.thread_id, ChatMessageEmbedding.timestamp
+                ).where(
+                    ChatMessageEmbedding.event_id.in_(list(edits)),
+                    ChatMessageEmbedding.kind == KIND_MESSAGE,
+                )
+            )
+            originals = {row.event_id: row for row in result}
+
+        return {
+            event_id: source.model_copy(update={
+                "thread_id": originals[event_id].thread_id,
+                "timestamp": originals[event_id].timestamp,
+            }) if event_id in originals else source
+            for event_id, source in edits.items()
+        }
+
+    @staticmethod
+    def _source(
+        room_id: str, event_id: str, event: dict, body: str, thread_id: Optional[str] = None
+    ) -> ChatMessageSource:
+        return ChatMessageSource(
+            room_id=room_id,
+            event_id=event_id,
+            thread_id=thread_id,
+            sender=event.get("sender", ""),
+            content=body,
+            timestamp=datetime.fromtimestamp(event.get("origin_server_ts", 0) / 1000),
+        )
+
+
+# Singleton instance
+sync_indexer = MatrixSyncIndexer()
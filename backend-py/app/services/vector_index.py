@@ -0,0 +1,211 @@
+"""In-process NumPy vector search used when pgvector is not available."""
+
+import asyncio
+import heapq
+import json
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from ..database import async_session, ChatMessageEmbedding
+from ..models.schemas import ChatMessageSource
+from .chunker import CONVERSATION_KINDS, KIND_MESSAGE
+
+
+def _source(row: Mapping) -> ChatMessageSource:
+    """Search result for a stored row (a row dict or a database row's mapping)."""
+    kind = row.get("kind") or KIND_MESSAGE
+    return ChatMessageSource(
+        room_id=row["room_id"],
+        event_id=row["event_id"],
+        thread_id=row.get("thread_id"),
+        kind=kind,
+        sender="" if kind in CONVERSATION_KINDS else row["sender"],
+        content=row["content"],
+        timestamp=row["timestamp"],
+    )
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows in place; zero vectors stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class RoomVectorIndex:
+    """Contiguous float32 matrix of one room's unit-length embeddings."""
+
+    def __init__(self, dimension: int, capacity: int = 256):
+        self._matrix = np.empty((capacity, dimension), dtype=np.float32)
+        self._alive = np.ones(capacity, dtype=bool)
+        self._removed = 0
+        self._size = 0
+        self._sources: List[ChatMessageSource] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, event_ids: List[str], sources: List[ChatMessageSource], vectors: np.ndarray) -> None:
+        """Append rows, skipping event IDs that are already indexed."""
+        keep = [i for i, event_id in enumerate(event_ids) if event_id not in self._positions]
+        if not keep:
+            return
+
+        needed = self._size + len(keep)
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, self._matrix.shape[0] * 2)
+            grown = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+            alive = np.ones(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+
+        self._matrix[self._size:needed] = _normalise(vectors[keep].astype(np.float32, copy=True))
+        for i in keep:
+            self._positions[event_ids[i]] = len(self._sources)
+            self._sources.append(sources[i])
+        self._size = needed
+
+    def remove(self, event_ids: List[str]) -> None:
+        """Drop rows from search results; their slots are not reused."""
+        for event_id in event_ids:
+            position = self._positions.pop(event_id, None)
+            if position is not None:
+                self._alive[position] = False
+                self._removed += 1
+
+    def search(self, query: np.ndarray, limit: int) -> List[Tuple[float, ChatMessageSource]]:
+        """Top-k by cosine similarity for a unit-length query vector."""
+        if self._size - self._removed <= 0:
+            return []
+
+        scores = self._matrix[:self._size] @ query
+        if self._removed:
+            scores[~self._alive[:self._size]] = -np.inf
+        k = min(limit, self._size - self._removed)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self._sources[i]) for i in top]
+
+
+class InMemoryVectorIndex:
+    """
+    Per-room NumPy indexes over the ``embedding_json`` rows.
+
+    Rooms are loaded from the database on first query and then kept up to date
+    as new rows are stored, so each search is a single matrix-vector product
+    per room.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._rooms: Dict[str, RoomVectorIndex] = {}
+        self._all_loaded = False
+        self._lock = asyncio.Lock()
+
+    async def _ensure_loaded(self, room_ids: Optional[List[str]]) -> None:
+        if self._all_loaded:
+            return
+        if room_ids is not None and all(r in self._rooms for r in room_ids):
+            return
+
+        async with self._lock:
+            stmt = select(
+                ChatMessageEmbedding.room_id,
+                ChatMessageEmbedding.event_id,
+                ChatMessageEmbedding.sender,
+                ChatMessageEmbedding.content,
+                ChatMessageEmbedding.timestamp,
+                ChatMessageEmbedding.kind,
+                ChatMessageEmbedding.thread_id,
+                ChatMessageEmbedding.embedding_json,
+            ).where(ChatMessageEmbedding.embedding_json.isnot(None))
+
+            if room_ids is None:
+                missing = None
+                if self._rooms:
+                    stmt = stmt.where(ChatMessageEmbedding.room_id.notin_(list(self._rooms)))
+            else:
+                missing = [r for r in room_ids if r not in self._rooms]
+                if not missing:
+                    return
+                stmt = stmt.where(ChatMessageEmbedding.room_id.in_(missing))
+
+            async with async_session() as session:
+                result = await session.execute(stmt)
+                rows = result.fetchall()
+
+            by_room: Dict[str, list] = {}
+            for row in rows:
+                by_room.setdefault(row.room_id, []).append(row)
+
+            for room_id in (missing or []):
+                self._rooms.setdefault(room_id, RoomVectorIndex(self.dimension))
+            for room_id, room_rows in by_room.items():
+                index = self._rooms.setdefault(room_id, RoomVectorIndex(self.dimension, len(room_rows)))
+                index.add(
+                    [r.event_id for r in room_rows],
+                    [_source(r._mapping) for r in room_rows],
+                    np.array([json.loads(r.embedding_json) for r in room_rows], dtype=np.float32),
+                )
+
+            if room_ids is None:
+                self._all_loaded = True
+            print(f"[VectorIndex] Loaded {len(rows)} embeddings for {len(by_room)} rooms")
+
+    def add(self, rows: List[dict], embeddings: List[List[float]]) -> None:
+        """
+        Add freshly stored rows to rooms that are already loaded.
+
+        Rooms that have not been queried yet pick the rows up from the
+        database when they are first loaded. Once every room has been loaded,
+        rooms are no longer read from the database, so rows of a new room
+        start its index here.
+        """
+        by_room: Dict[str, list] = {}
+        for row, embedding in zip(rows, embeddings):
+            if self._all_loaded or row["room_id"] in self._rooms:
+                by_room.setdefault(row["room_id"], []).append((row, embedding))
+
+        for room_id, items in by_room.items():
+            self._rooms.setdefault(room_id, RoomVectorIndex(self.dimension)).add(
+                [row["event_id"] for row, _ in items],
+                [_source(row) for row, _ in items],
+                np.array([embedding for _, embedding in items], dtype=np.float32),
+            )
+
+    def remove(self, event_ids: List[str]) -> None:
+        """Remove rows (deleted or about to be replaced) from every loaded room."""
+        for index in self._rooms.values():
+            index.remove(event_ids)
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        room_ids: Optional[List[str]] = None,
+        limit: int = 10,
+    ) -> List[ChatMessageSource]:
+        """Top-k cosine search across the requested rooms (all rooms if None)."""
+        await self._ensure_loaded(room_ids)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        rooms = room_ids if room_ids is not None else list(self._rooms)
+        candidates = []
+        for room_id in rooms:
+            index = self._rooms.get(room_id)
+            if index is not None:
+                candidates.extend(index.search(query, limit))
+
+        return [
+            source.model_copy(update={"score": score})
+            for score, source in heapq.nlargest(limit, candidates, key=lambda c: c[0])
+        ]
@@ -1,10 +1,10 @@
 """Web search service supporting Google Custom Search and Serper."""
 
 from typing import List
-import httpx
 
 from ..config import get_settings
 from ..models.schemas import SearchResult
+from .http_clients import http_clients
 
 settings = get_settings()
 
@@ -35,61 +35,61 @@ class WebSearchService:
             print("[WebSearch] Google API Key detected but WEB_SEARCH_CX is missing")
             return self._get_mock_results(query, "[Config Error] Missing WEB_SEARCH_CX")
 
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"[WebSearch] Searching via Google Custom Search for: {query}")
-                response = await client.get(
-                    "https://www.googleapis.com/customsearch/v1",
-                    params={"key": api_key, "cx": cx, "q": query, "num": 10},
+        client = http_clients.get("search")
+        try:
+            print(f"[WebSearch] Searching via Google Custom Search for: {query}")
+            response = await client.get(
+                "https://www.googleapis.com/customsearch/v1",
+                params={"key": api_key, "cx": cx, "q": query, "num": 10},
+            )
+
+            if response.status_code != 200:
+                error_msg = response.json().get("error", {}).get("message", "Unknown error")
+                return self._get_mock_results(query, f"[Google API Error] {error_msg}")
+
+            items = response.json().get("items", [])
+            return [
+                SearchResult(
+                    source="web",
+                    title=item["title"],
+                    url=item["link"],
+                    snippet=item.get("snippet", ""),
                 )
+                for item in items
+            ]
 
-                if response.status_code != 200:
-                    error_msg = response.json().get("error", {}).get("message", "Unknown error")
-                    return self._get_mock_results(query, f"[Google API Error] {error_msg}")
-
-                items = response.json().get("items", [])
-                return [
-                    SearchResult(
-                        source="web",
-                        title=item["title"],
-                        url=item["link"],
-                        snippet=item.get("snippet", ""),
-                    )
-                    for item in items
-                ]
-
-            except Exception as e:
-                print(f"[WebSearch] Google API Error: {e}")
-                return self._get_mock_results(query, f"[Error] {str(e)}")
+        except Exception as e:
+            print(f"[WebSearch] Google API Error: {e}")
+            return self._get_mock_results(query, f"[Error] {str(e)}")
 
     async def _search_serper(self, query: str, api_key: str) -> List[SearchResult]:
         """Search using Serper API."""
-        async with httpx.AsyncClient() as client:
-            try:
-                print(f"[WebSearch] Searching via Serper for: {query}")
-                response = await client.post(
-                    "https://google.serper.dev/search",
-                    json={"q": query, "num": 5},
-                    headers={"X-API-KEY": api_key, "Content-Type": "application/json"},
+        client = http_clients.get("search")
+        try:
+            print(f"[WebSearch] Searching via Serper for: {query}")
+            response = await client.post(
+                "https://google.serper.dev/search",
+                json={"q": query, "num": 5},
+                headers={"X-API-KEY": api_key, "Content-Type": "application/json"},
+            )
+
+            if response.status_code != 200:
+                return self._get_mock_results(query, "[Serper API Error]")
+
+            organic = response.json().get("organic", [])
+            return [
+                SearchResult(
+                    source="web",
+                    title=item["title"],
+                    url=item["link"],
+                    snippet=item.get("snippet", ""),
                 )
+                for item in organic
+            ]
 
-                if response.status_code != 200:
-                    return self._get_mock_results(query, "[Serper API Error]")
-
-                organic = response.json().get("organic", [])
-                return [
-                    SearchResult(
-                        source="web",
-                        title=item["title"],
-                        url=item["link"],
-                        snippet=item.get("snippet", ""),
-                    )
-                    for item in organic
-                ]
-
-            except Exception as e:
-                print(f"[WebSearch] Serper API Error: {e}")
-                return self._get_mock_results(query)
+        except Exception as e:
+            print(f"[WebSearch] Serper API Error: {e}")
+            return self._get_mock_results(query)
 
     def _get_mock_results(self, query: str, error_msg: str = None) -> List[SearchResult]:
         """Return mock results when API is unavailable."""
@@ -0,0 +1,24 @@
+-- chat_message_embeddings 分块与会话级向量 - 数据库迁移脚本
+-- 说明: 索引流程会跳过过短消息的向量、把长消息拆成重叠分块,
+--       并为线程 / 回复链和时间窗口生成会话级向量
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 行类型与线程根事件
+-- ===================================================
+-- kind: message (单条消息) / chunk (长消息的后续分块, event_id 为 "<event_id>#<n>")
+--       thread (线程或回复链, event_id 为 "thread:<根事件>")
+--       window (时间窗口内的非线程消息, event_id 为 "window:<房间>:<起始秒>")
+ALTER TABLE chat_message_embeddings
+ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'message',
+ADD COLUMN IF NOT EXISTS thread_id VARCHAR(255);
+
+CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_thread_id
+ON chat_message_embeddings (thread_id);
+
+
+-- ===================================================
+-- 2. 可选: 重新索引
+-- ===================================================
+-- 已有的行都按 message 处理; 如需生成分块和会话级向量,
+-- 对相关房间调用 POST /api/ai/index-room?restart=true
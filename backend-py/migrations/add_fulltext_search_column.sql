@@ -0,0 +1,18 @@
+-- chat_message_embeddings 全文检索列与 GIN 索引 - 数据库迁移脚本
+-- 说明: 混合检索 (全文 + 向量, RRF 融合) 使用的 tsvector 生成列
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+-- 文本检索配置需与 RAG_FULLTEXT_CONFIG 保持一致 (默认 simple, 不做词干化, 适合错误码/包名)
+
+-- ===================================================
+-- 1. 生成列 (写入 content 时自动维护, 已有行会在 ALTER 时回填)
+-- ===================================================
+ALTER TABLE chat_message_embeddings
+ADD COLUMN IF NOT EXISTS content_tsv tsvector
+GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+
+
+-- ===================================================
+-- 2. GIN 索引
+-- ===================================================
+CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_content_tsv
+ON chat_message_embeddings USING gin (content_tsv);
@@ -0,0 +1,44 @@
+-- 索引任务队列 (indexing_jobs) - 数据库迁移脚本
+-- 说明: /ai/index-room 和 /ai/jobs 只负责入队并立即返回 job_id,
+--       由后台 worker 通过 SELECT ... FOR UPDATE SKIP LOCKED 领取执行,
+--       多个进程可以共享同一张表
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 任务表
+-- ===================================================
+-- kind: index (补齐最新消息) / backfill (完整历史回填) / reembed (重新生成向量)
+-- status: queued / running / succeeded / failed
+CREATE TABLE IF NOT EXISTS indexing_jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    room_id VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,   -- 任务参数 (含 Matrix access token, 结束后清除)
+    result JSONB,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),  -- 失败重试的退避时间
+    locked_by VARCHAR(100),                      -- 执行中的 worker
+    locked_at TIMESTAMP,                         -- worker 心跳, 超过租期会被重新领取
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+
+-- ===================================================
+-- 2. 索引
+-- ===================================================
+-- 领取任务时按 status / run_after 查找
+CREATE INDEX IF NOT EXISTS ix_indexing_jobs_status_run_after
+ON indexing_jobs (status, run_after);
+
+CREATE INDEX IF NOT EXISTS ix_indexing_jobs_room_id
+ON indexing_jobs (room_id);
+
+-- 同一房间同一类型最多一个进行中的任务
+CREATE UNIQUE INDEX IF NOT EXISTS uq_indexing_jobs_active
+ON indexing_jobs (kind, room_id)
+WHERE status IN ('queued', 'running');
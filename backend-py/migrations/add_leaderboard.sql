@@ -0,0 +1,30 @@
+-- 组织排行榜 - 数据库迁移脚本
+-- 说明: 排行榜 (总榜 / 活动榜 / 周榜) 在内存中维护有序榜单并随积分流水增量更新,
+--       这里是它依赖的索引和名次快照表
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 总榜按组织读取总积分倒序
+-- ===================================================
+CREATE INDEX IF NOT EXISTS ix_user_points_org_total
+ON user_points (org_id, total_points DESC);
+
+
+-- ===================================================
+-- 2. 名次快照
+-- ===================================================
+-- scope: global / campaign / weekly
+-- scope_key: global 为空, campaign 为活动 ID, weekly 为该周周一日期 (如 2026-10-12)
+CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    org_id INTEGER NOT NULL,
+    scope VARCHAR(20) NOT NULL,
+    scope_key VARCHAR(50) NOT NULL DEFAULT '',
+    user_id INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    snapshot_at TIMESTAMP NOT NULL     -- 同一次快照的行时间相同
+);
+
+CREATE INDEX IF NOT EXISTS ix_leaderboard_snapshots_board
+ON leaderboard_snapshots (org_id, scope, scope_key, snapshot_at, rank);
@@ -0,0 +1,44 @@
+-- chat_message_embeddings 向量列与 ANN 索引 - 数据库迁移脚本
+-- 说明: 为已有数据库添加 pgvector 列, 并把历史 embedding_json 数据迁移过来
+-- 后端启动时 (init_database) 检测到 pgvector 会自动执行第 1、3 步
+
+-- ===================================================
+-- 1. 添加向量列
+-- ===================================================
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE chat_message_embeddings
+ADD COLUMN IF NOT EXISTS embedding vector(1536);
+
+
+-- ===================================================
+-- 2. 迁移已有的 JSON 向量 (JSON 数组文本与 pgvector 文本格式兼容)
+-- ===================================================
+UPDATE chat_message_embeddings
+SET embedding = embedding_json::vector
+WHERE embedding IS NULL AND embedding_json IS NOT NULL;
+
+-- 可选: 迁移完成后释放 JSON 占用的空间
+-- UPDATE chat_message_embeddings SET embedding_json = NULL WHERE embedding IS NOT NULL;
+
+
+-- ===================================================
+-- 3. ANN 索引 (二选一, 与 RAG_VECTOR_INDEX 配置保持一致)
+-- ===================================================
+-- HNSW: 召回率高, 查询快, 可以在写入过程中增量维护
+CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_embedding_hnsw
+ON chat_message_embeddings USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- IVFFlat: 构建更快, 内存更小; 需要在数据导入后再建索引
+-- lists 建议: 100 万行以内取 行数/1000, 以上取 sqrt(行数)
+-- CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_embedding_ivfflat
+-- ON chat_message_embeddings USING ivfflat (embedding vector_cosine_ops)
+-- WITH (lists = 1000);
+
+
+-- ===================================================
+-- 4. 查询参数 (后端每次查询通过 set_config 设置, 这里仅供手动调试)
+-- ===================================================
+-- SET hnsw.ef_search = 40;   -- RAG_HNSW_EF_SEARCH
+-- SET ivfflat.probes = 10;   -- RAG_IVFFLAT_PROBES
@@ -0,0 +1,87 @@
+-- 积分流水 (points_ledger) - 数据库迁移脚本
+-- 说明: 积分变动改为只追加的流水记录 (earn / spend / adjust / refund),
+--       user_points 作为按 (user_id, org_id) 物化的余额, 与流水在同一事务里原子更新
+-- 后端启动时会自动建表、唯一索引和期初流水 (第 1、3、4 步), 第 2 步需手动执行一次
+
+-- ===================================================
+-- 1. 流水表
+-- ===================================================
+CREATE TABLE IF NOT EXISTS points_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    org_id INTEGER NOT NULL,
+    campaign_id INTEGER,                -- 积分来自哪个活动 (任务奖励时有值)
+    entry_type VARCHAR(20) NOT NULL,    -- earn / spend / adjust / refund
+    amount INTEGER NOT NULL,            -- 对可用积分的变动, spend 为负数
+    source_type VARCHAR(30),            -- task_claim / prize_redemption / admin / opening_balance
+    source_id INTEGER,
+    note TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_points_ledger_user_org ON points_ledger (user_id, org_id, id);
+CREATE INDEX IF NOT EXISTS ix_points_ledger_campaign_id ON points_ledger (campaign_id);
+CREATE INDEX IF NOT EXISTS ix_points_ledger_created_at ON points_ledger (created_at);
+
+-- 同一来源事件只记一次账
+CREATE UNIQUE INDEX IF NOT EXISTS uq_points_ledger_source
+ON points_ledger (entry_type, source_type, source_id)
+WHERE source_id IS NOT NULL;
+
+
+-- ===================================================
+-- 2. 合并并发竞争留下的重复积分账户
+-- ===================================================
+-- 先检查:
+-- SELECT user_id, org_id, COUNT(*) FROM user_points GROUP BY user_id, org_id HAVING COUNT(*) > 1;
+
+UPDATE user_points p
+SET total_points = d.total_points, spent_points = d.spent_points
+FROM (
+    SELECT MIN(id) AS keep_id, SUM(COALESCE(total_points, 0)) AS total_points,
+           SUM(COALESCE(spent_points, 0)) AS spent_points
+    FROM user_points GROUP BY user_id, org_id HAVING COUNT(*) > 1
+) d
+WHERE p.id = d.keep_id;
+
+DELETE FROM user_points p
+USING user_points k
+WHERE p.user_id = k.user_id AND p.org_id = k.org_id AND p.id > k.id;
+
+
+-- ===================================================
+-- 3. 每个用户在每个组织只有一个余额
+-- ===================================================
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_points_user_org ON user_points (user_id, org_id);
+
+
+-- ===================================================
+-- 4. 用现有余额生成期初流水 (可重复执行)
+-- ===================================================
+-- 让流水的合计与 user_points 一致, 之后才能用 POST /{org_id}/points/rebuild 重放余额。
+-- 只补 user_points 与流水合计的差额, 每个余额行最多一条 (由唯一索引保证)
+INSERT INTO points_ledger (user_id, org_id, entry_type, amount, source_type, source_id, note)
+SELECT p.user_id, p.org_id, 'adjust', COALESCE(p.total_points, 0) - COALESCE(l.total_points, 0),
+       'opening_balance', p.id, '期初积分'
+FROM user_points p
+LEFT JOIN (
+    SELECT user_id, org_id,
+           SUM(amount) FILTER (WHERE entry_type IN ('earn', 'adjust')) AS total_points,
+           -SUM(amount) FILTER (WHERE entry_type NOT IN ('earn', 'adjust')) AS spent_points
+    FROM points_ledger GROUP BY user_id, org_id
+) l ON l.user_id = p.user_id AND l.org_id = p.org_id
+WHERE COALESCE(p.total_points, 0) <> COALESCE(l.total_points, 0)
+ON CONFLICT (entry_type, source_type, source_id) WHERE source_id IS NOT NULL DO NOTHING;
+
+INSERT INTO points_ledger (user_id, org_id, entry_type, amount, source_type, source_id, note)
+SELECT p.user_id, p.org_id, 'spend', -(COALESCE(p.spent_points, 0) - COALESCE(l.spent_points, 0)),
+       'opening_balance', p.id, '期初已消耗积分'
+FROM user_points p
+LEFT JOIN (
+    SELECT user_id, org_id,
+           SUM(amount) FILTER (WHERE entry_type IN ('earn', 'adjust')) AS total_points,
+           -SUM(amount) FILTER (WHERE entry_type NOT IN ('earn', 'adjust')) AS spent_points
+    FROM points_ledger GROUP BY user_id, org_id
+) l ON l.user_id = p.user_id AND l.org_id = p.org_id
+WHERE COALESCE(p.spent_points, 0) <> COALESCE(l.spent_points, 0)
+ON CONFLICT (entry_type, source_type, source_id) WHERE source_id IS NOT NULL DO NOTHING;
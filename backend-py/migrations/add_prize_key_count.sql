@@ -0,0 +1,19 @@
+-- 密钥库奖品的密钥总数 - 数据库迁移脚本
+-- 说明: 密钥库兑换不再更新奖品行 (并发兑换只锁各自领取的密钥),
+--       奖品列表的领取数由 key_count 减未使用密钥数得到, 不扫描已使用的密钥.
+--       key_count 只在添加/导入/删除密钥时更新
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 添加列
+-- ===================================================
+ALTER TABLE prizes ADD COLUMN IF NOT EXISTS key_count INTEGER;
+
+
+-- ===================================================
+-- 2. 回填已有奖品的密钥数 (可重复执行)
+-- ===================================================
+UPDATE prizes SET key_count = (
+    SELECT COUNT(*) FROM prize_keys WHERE prize_keys.prize_id = prizes.id
+)
+WHERE key_count IS NULL;
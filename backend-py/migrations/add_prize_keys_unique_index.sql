@@ -0,0 +1,30 @@
+-- 密钥库批量导入 - 数据库迁移脚本
+-- 说明: 密钥批量导入改为分批 INSERT ... ON CONFLICT (prize_id, key_value) DO NOTHING,
+--       依赖 (prize_id, key_value) 唯一索引去重
+-- 用 create_prize_keys_table.sql 建表的库已有同名约束 unique_prize_key, 无需执行;
+-- 由后端 create_all 建表的库在启动时 (init_database) 会自动执行第 2 步
+
+-- ===================================================
+-- 1. 清理重复密钥 (保留最早的一条, 已使用的优先保留)
+-- ===================================================
+-- 先检查:
+-- SELECT prize_id, key_value, COUNT(*) FROM prize_keys
+-- GROUP BY prize_id, key_value HAVING COUNT(*) > 1;
+
+DELETE FROM prize_keys
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY prize_id, key_value ORDER BY is_used DESC, id
+        ) AS rn
+        FROM prize_keys
+    ) d
+    WHERE d.rn > 1
+)
+AND id NOT IN (SELECT assigned_key_id FROM prize_redemptions WHERE assigned_key_id IS NOT NULL);
+
+
+-- ===================================================
+-- 2. 唯一索引
+-- ===================================================
+CREATE UNIQUE INDEX IF NOT EXISTS unique_prize_key ON prize_keys (prize_id, key_value);
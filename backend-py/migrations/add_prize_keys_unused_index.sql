@@ -0,0 +1,21 @@
+-- 密钥库并发领取 - 数据库迁移脚本
+-- 说明: redeem_prize 用 UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP LOCKED LIMIT 1) RETURNING
+--       原子领取密钥, 并发兑换各拿到不同的密钥
+-- 后端启动时 (init_database) 会自动执行, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 未使用密钥的部分索引
+-- ===================================================
+-- 只包含 is_used = false 的行, 随密钥被领取而变小
+CREATE INDEX IF NOT EXISTS ix_prize_keys_unused
+ON prize_keys (prize_id, id)
+WHERE is_used = false;
+
+
+-- ===================================================
+-- 2. 可选: 检查并发竞争留下的重复分配
+-- ===================================================
+-- 同一密钥被多个兑换记录引用:
+-- SELECT assigned_key_id, COUNT(*) FROM prize_redemptions
+-- WHERE assigned_key_id IS NOT NULL
+-- GROUP BY assigned_key_id HAVING COUNT(*) > 1;
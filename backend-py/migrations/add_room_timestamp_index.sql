@@ -0,0 +1,6 @@
+-- chat_message_embeddings (room_id, timestamp) 索引 - 数据库迁移脚本
+-- 说明: 检索命中后按时间窗口扩展上下文, 每个房间一次范围查询
+-- 后端启动时 (init_database) 会自动创建, 这里仅供手动迁移
+
+CREATE INDEX IF NOT EXISTS ix_chat_message_embeddings_room_timestamp
+ON chat_message_embeddings (room_id, timestamp);
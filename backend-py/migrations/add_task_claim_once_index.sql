@@ -0,0 +1,43 @@
+-- 任务领取并发安全 - 数据库迁移脚本
+-- 说明: claim_task 不再 "先查询再插入", once 类型任务的重复领取改由部分唯一索引拦截,
+--       名额由条件 UPDATE ... RETURNING 原子扣减
+-- 后端启动时 (init_database) 会自动执行 1、3 两步, 这里仅供手动迁移
+
+-- ===================================================
+-- 1. 领取时任务 recurrence 的快照
+-- ===================================================
+ALTER TABLE task_claims ADD COLUMN IF NOT EXISTS recurrence VARCHAR(20);
+
+UPDATE task_claims c
+SET recurrence = COALESCE(t.recurrence, 'once')
+FROM tasks t
+WHERE c.task_id = t.id AND c.recurrence IS NULL;
+
+
+-- ===================================================
+-- 2. 清理已有的重复领取 (并发竞争留下的)
+-- ===================================================
+-- 先检查:
+-- SELECT user_id, task_id, COUNT(*) FROM task_claims
+-- WHERE status = 'approved' AND recurrence = 'once'
+-- GROUP BY user_id, task_id HAVING COUNT(*) > 1;
+
+-- 保留最早的一条, 其余标记为 rejected (多发的积分需另行核对)
+UPDATE task_claims
+SET status = 'rejected', review_note = 'duplicate claim'
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, task_id ORDER BY id) AS rn
+        FROM task_claims
+        WHERE status = 'approved' AND recurrence = 'once'
+    ) d
+    WHERE d.rn > 1
+);
+
+
+-- ===================================================
+-- 3. once 类型任务每个用户只能有一条 approved 记录
+-- ===================================================
+CREATE UNIQUE INDEX IF NOT EXISTS uq_task_claims_once_approved
+ON task_claims (user_id, task_id)
+WHERE status = 'approved' AND recurrence = 'once';
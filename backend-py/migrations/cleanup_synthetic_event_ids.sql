@@ -0,0 +1,21 @@
+-- 清理旧版 /ai/index-room 写入的伪造 event_id - 数据库迁移脚本
+-- 说明: 旧版本用 "{room_id}:{序号}" 作为 event_id, 重新索引时序号会错位并产生重复行
+-- 现在索引器使用 Matrix 真实 event_id (以 "$" 开头), 旧数据需要删除后重新索引
+
+-- ===================================================
+-- 1. 删除伪造 event_id 的行
+-- ===================================================
+DELETE FROM chat_message_embeddings
+WHERE event_id NOT LIKE '$%';
+
+
+-- ===================================================
+-- 2. 同步索引器的 since token 表 (后端启动时 create_all 会自动创建)
+-- ===================================================
+CREATE TABLE IF NOT EXISTS matrix_sync_state (
+    account VARCHAR(255) PRIMARY KEY,
+    since_token TEXT,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- 如果配置了 RAG_EMBEDDING_STORE_DIR, 需要同时删除该目录, 重启后重新索引
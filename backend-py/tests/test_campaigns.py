@@ -0,0 +1,86 @@
+"""The campaign tree is fetched with a fixed number of statements, whatever its size.
+
+Needs a Postgres database: set TEST_DATABASE_URL (postgresql+asyncpg://...).
+Everything runs in one transaction that is rolled back, so the database is
+left unchanged.
+"""
+
+import os
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.database import Base
+from app.models.incentive import Activity, Campaign, Task, TaskClaim
+from app.routers.incentive import get_campaigns
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+ORG_ID = 4242
+USER_ID = 7
+
+
+@pytest.fixture
+async def db():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=[t.__table__ for t in (Campaign, Activity, Task, TaskClaim)]
+            )
+        )
+        session = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            yield session
+        finally:
+            await session.close()
+            await transaction.rollback()
+    await engine.dispose()
+
+
+async def _seed_tree(db: AsyncSession, campaigns: int, activities: int, tasks: int) -> None:
+    """campaigns x activities x tasks, with the user having claimed every other task."""
+    for c in range(campaigns):
+        campaign = Campaign(org_id=ORG_ID, name=f"Campaign {c}", type="limited" if c % 2 else "permanent")
+        db.add(campaign)
+        await db.flush()
+        for a in range(activities):
+            activity = Activity(campaign_id=campaign.id, name=f"Activity {c}.{a}", order_index=a)
+            db.add(activity)
+            await db.flush()
+            for t in range(tasks):
+                task = Task(activity_id=activity.id, title=f"Task {c}.{a}.{t}", points=10, order_index=t)
+                db.add(task)
+                await db.flush()
+                if t % 2 == 0:
+                    db.add(TaskClaim(user_id=USER_ID, task_id=task.id, status="approved"))
+    await db.flush()
+
+
+@pytest.mark.parametrize("campaigns, activities, tasks", [(1, 1, 1), (3, 4, 5), (10, 10, 10)])
+async def test_get_campaigns_statement_count_is_constant(db, campaigns, activities, tasks):
+    await _seed_tree(db, campaigns, activities, tasks)
+    db.expunge_all()
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sync_engine = db.bind.engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", count)
+    try:
+        response = await get_campaigns(ORG_ID, USER_ID, db)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", count)
+
+    assert len(statements) <= 4, statements
+    returned = response.permanent + response.limited
+    assert len(returned) == campaigns
+    all_tasks = [task for campaign in returned for activity in campaign.activities for task in activity.tasks]
+    assert len(all_tasks) == campaigns * activities * tasks
+    assert sum(task.user_claimed for task in all_tasks) == campaigns * activities * ((tasks + 1) // 2)
@@ -0,0 +1,58 @@
+"""Thread and window embeddings are rebuilt in batches, not once per stored message."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.schemas import ChatMessageSource
+from app.services import rag_service as rag_module
+from app.services.rag_service import rag_service
+
+
+def _reply(n: int) -> ChatMessageSource:
+    return ChatMessageSource(
+        room_id="!room:example.org",
+        event_id=f"$reply{n}",
+        thread_id="$root",
+        sender="@alice:example.org",
+        content=f"reply number {n}",
+        timestamp=datetime(2025, 1, 1, 12, 0) + timedelta(seconds=n),
+    )
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Conversation sets passed to _rebuild_conversations, instead of embedding them."""
+    calls = []
+
+    async def fake_rebuild(pending):
+        calls.append(set(pending))
+
+    monkeypatch.setattr(rag_service, "_rebuild_conversations", fake_rebuild)
+    monkeypatch.setattr(rag_module.settings, "rag_conversation_embeddings", True)
+    yield calls
+    rag_service._pending_conversations.clear()
+
+
+async def test_replies_to_a_thread_are_rebuilt_once_per_interval(monkeypatch, rebuilds):
+    monkeypatch.setattr(rag_module.settings, "rag_conversation_refresh_seconds", 3600)
+    monkeypatch.setattr(rag_module.settings, "rag_conversation_refresh_max_pending", 100)
+
+    for n in range(10):
+        await rag_service._refresh_conversations([_reply(n)])
+    assert rebuilds == []
+
+    await rag_service.stop()  # flushes what is still marked
+
+    assert rebuilds == [{("thread", "!room:example.org", "$root")}]
+
+
+async def test_rebuild_runs_right_away_once_enough_conversations_are_waiting(monkeypatch, rebuilds):
+    monkeypatch.setattr(rag_module.settings, "rag_conversation_refresh_seconds", 3600)
+    monkeypatch.setattr(rag_module.settings, "rag_conversation_refresh_max_pending", 3)
+
+    for n in range(3):
+        await rag_service._refresh_conversations([_reply(n).model_copy(update={"thread_id": f"$root{n}"})])
+
+    assert len(rebuilds) == 1 and len(rebuilds[0]) == 3
+    await rag_service.stop()
@@ -0,0 +1,47 @@
+"""Searches running while the store compacts its segments still return the right rows."""
+
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app.services.embedding_store import SegmentedEmbeddingStore
+
+
+async def test_search_during_compaction_returns_consistent_results(tmp_path):
+    store = SegmentedEmbeddingStore(str(tmp_path), 8, segment_rows=50, block_rows=16, compact_ratio=0.2)
+    vectors = np.random.default_rng(0).normal(size=(200, 8))
+    await store.append(
+        [
+            {"room_id": "!room:example.org", "event_id": f"$e{i}", "sender": "@alice:example.org",
+             "content": f"message {i}", "timestamp": datetime(2025, 1, 1)}
+            for i in range(200)
+        ],
+        vectors.tolist(),
+    )
+    query = (vectors[151] / np.linalg.norm(vectors[151])).astype(np.float32)
+
+    wrong = []
+    done = threading.Event()
+
+    def search() -> None:
+        while not done.is_set():
+            hits = store._search(query, None, 5)
+            if len(hits) != 5 or hits[0].event_id != "$e151":
+                wrong.append([hit.event_id for hit in hits])
+
+    searchers = [threading.Thread(target=search) for _ in range(3)]
+    for thread in searchers:
+        thread.start()
+    try:
+        # Deleting every other early row crosses compact_ratio repeatedly
+        for i in range(0, 140, 2):
+            await store.delete([f"$e{i}"])
+        await store.compact()
+    finally:
+        done.set()
+        for thread in searchers:
+            thread.join()
+
+    assert store._generation >= 2
+    assert wrong == []
@@ -0,0 +1,176 @@
+"""Retry behaviour of indexing jobs whose embeddings fail to store."""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.database import IndexingJob
+from app.models.schemas import ChatMessageSource
+from app.services.embedding_cache import embedding_cache
+from app.services import rag_service as rag_module
+from app.services.job_queue import job_queue, KIND_INDEX, KIND_REEMBED, STATUS_FAILED, STATUS_QUEUED, STATUS_SUCCEEDED
+from app.services.matrix_messages import matrix_messages_service
+from app.services.rag_service import rag_service
+
+
+def _message(event_id: str) -> ChatMessageSource:
+    return ChatMessageSource(
+        room_id="!room:example.org",
+        event_id=event_id,
+        sender="@alice:example.org",
+        content=f"How do I configure the deploy pipeline? ({event_id})",
+        timestamp=datetime(2025, 1, 1, 12, 0),
+    )
+
+
+def _index_job(attempts: int = 1, max_attempts: int = 3, result=None) -> IndexingJob:
+    return IndexingJob(
+        id=1,
+        kind=KIND_INDEX,
+        room_id="!room:example.org",
+        payload={"access_token": "token", "max_messages": None},
+        attempts=attempts,
+        max_attempts=max_attempts,
+        result=result,
+    )
+
+
+@pytest.fixture
+def finished(monkeypatch):
+    """Values the job would be finished with, instead of writing them to the database."""
+    calls = []
+
+    async def fake_finish(job, worker, **values):
+        calls.append(values)
+
+    monkeypatch.setattr(job_queue, "_finish", fake_finish)
+    return calls
+
+
+@pytest.fixture
+def failing_embeddings(monkeypatch):
+    async def create(**kwargs):
+        raise RuntimeError("embeddings API unavailable")
+
+    monkeypatch.setattr(rag_service, "client", SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+    monkeypatch.setattr(embedding_cache, "persist", False)
+
+
+async def test_failing_embedding_call_retries_job(monkeypatch, finished, failing_embeddings):
+    async def fetch_messages_page(room_id, access_token, limit, from_token):
+        return [_message("$a"), _message("$b")], "next"
+
+    monkeypatch.setattr(matrix_messages_service, "fetch_messages_page", fetch_messages_page)
+
+    await job_queue._execute(_index_job(attempts=1), "test-worker")
+
+    assert len(finished) == 1
+    values = finished[0]
+    assert values["status"] == STATUS_QUEUED
+    assert "embeddings API unavailable" in values["last_error"]
+    assert "run_after" in values
+
+
+async def test_failing_embedding_call_fails_job_after_last_attempt(monkeypatch, finished, failing_embeddings):
+    async def fetch_messages_page(room_id, access_token, limit, from_token):
+        return [_message("$a")], None
+
+    monkeypatch.setattr(matrix_messages_service, "fetch_messages_page", fetch_messages_page)
+
+    await job_queue._execute(_index_job(attempts=3, max_attempts=3), "test-worker")
+
+    assert finished[0]["status"] == STATUS_FAILED
+    assert "embeddings API unavailable" in finished[0]["last_error"]
+
+
+async def test_retried_index_job_resumes_at_failed_page(monkeypatch, finished):
+    pages = {
+        None: ([_message("$new")], "t1"),
+        "t1": ([_message("$old")], "t2"),
+        "t2": ([_message("$older")], None),
+    }
+    requested = []
+    checkpoints = []
+    # The first attempt stores page one and fails on page two after writing its rows
+    stored_counts = iter([1, RuntimeError("embeddings API unavailable"), 0, 1])
+
+    async def fetch_messages_page(room_id, access_token, limit, from_token):
+        requested.append(from_token)
+        return pages[from_token]
+
+    async def store_messages_batch(messages, event_ids, replace=False):
+        outcome = next(stored_counts)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, 1.0
+
+    async def save_result(job_id, result):
+        checkpoints.append(dict(result))
+
+    monkeypatch.setattr(matrix_messages_service, "fetch_messages_page", fetch_messages_page)
+    monkeypatch.setattr(rag_service, "store_messages_batch", store_messages_batch)
+    monkeypatch.setattr(job_queue, "_save_result", save_result)
+
+    await job_queue._execute(_index_job(attempts=1), "test-worker")
+    assert finished[-1]["status"] == STATUS_QUEUED
+    assert checkpoints[-1]["from_token"] == "t1"
+
+    # Page "t1" stores nothing new on the retry, which must not end the job early
+    await job_queue._execute(_index_job(attempts=2, result=checkpoints[-1]), "test-worker")
+    assert requested == [None, "t1", "t1", "t2"]
+    assert finished[-1]["status"] == STATUS_SUCCEEDED
+    assert finished[-1]["result"]["messages_indexed"] == 2
+
+
+async def test_retried_reembed_job_resumes_after_last_page(monkeypatch, finished):
+    rows = [
+        SimpleNamespace(
+            id=n, room_id="!room:example.org", event_id=f"$m{n}", thread_id=None,
+            sender="@alice:example.org", content=f"message {n}", timestamp=datetime(2025, 1, 1, 12, n),
+        )
+        for n in range(1, 6)
+    ]
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, statement):
+            after_id = next(v for k, v in statement.compile().params.items() if k.startswith("id_"))
+            page = [row for row in rows if row.id > after_id][:2]
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: page))
+
+    reembedded = []
+    checkpoints = []
+    # The first attempt re-embeds the first page and fails on the second
+    outcomes = iter([None, RuntimeError("embeddings API unavailable"), None, None])
+
+    async def store_messages_batch(messages, event_ids, replace=False):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        reembedded.extend(event_ids)
+        return len(messages), 1.0
+
+    async def save_result(job_id, result):
+        checkpoints.append(dict(result))
+
+    monkeypatch.setattr(rag_module, "async_session", Session)
+    monkeypatch.setattr(rag_service, "store_messages_batch", store_messages_batch)
+    monkeypatch.setattr(job_queue, "_save_result", save_result)
+
+    job = _index_job(attempts=1)
+    job.kind = KIND_REEMBED
+    await job_queue._execute(job, "test-worker")
+    assert finished[-1]["status"] == STATUS_QUEUED
+    assert checkpoints[-1]["last_id"] == 2
+
+    job.attempts, job.result = 2, checkpoints[-1]
+    await job_queue._execute(job, "test-worker")
+    assert reembedded == ["$m1", "$m2", "$m3", "$m4", "$m5"]
+    assert finished[-1]["status"] == STATUS_SUCCEEDED
+    assert finished[-1]["result"] == {"room_id": "!room:example.org", "messages_reembedded": 5, "last_id": 5}
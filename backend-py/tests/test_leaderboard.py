@@ -0,0 +1,52 @@
+"""Leaderboard loads neither run twice in parallel nor lose changes that land meanwhile."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services.leaderboard import _Board, LeaderboardService, SCOPE_GLOBAL
+
+KEY = (1, SCOPE_GLOBAL, "")
+
+
+@pytest.fixture
+def service():
+    return LeaderboardService()
+
+
+async def test_concurrent_callers_share_one_load(monkeypatch, service):
+    loads = []
+
+    async def load(key):
+        loads.append(key)
+        await asyncio.sleep(0.01)
+        return _Board({7: 10}, {})
+
+    monkeypatch.setattr(service, "_load", load)
+
+    boards = await asyncio.gather(*(service._board(KEY) for _ in range(5)))
+
+    assert loads == [KEY]
+    assert all(board is boards[0] for board in boards)
+
+
+async def test_change_during_load_triggers_a_reload(monkeypatch, service):
+    # Points in the database: the first query misses the change made while it runs
+    stored = {7: 10}
+    loads = []
+
+    async def load(key):
+        loads.append(key)
+        snapshot = dict(stored)
+        if len(loads) == 1:
+            stored[7] = 15
+            service.apply_change(1, 7, 5, None, datetime.now())
+        return _Board(snapshot, {})
+
+    monkeypatch.setattr(service, "_load", load)
+
+    board = await service._board(KEY)
+
+    assert len(loads) == 2
+    assert board.points == {7: 15}
@@ -0,0 +1,86 @@
+"""Prize catalogue queries and key imports."""
+
+import io
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.dialects import postgresql
+
+from app.routers import incentive
+from app.routers.incentive import get_prizes, import_prize_keys
+
+
+class _RecordingSession:
+    """Stands in for the AsyncSession and keeps the statements it is given."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(all=lambda: [])
+
+
+async def test_get_prizes_counts_keys_through_the_unused_keys_join():
+    db = _RecordingSession()
+
+    assert await get_prizes(1, db) == []
+
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    join = sql[sql.index("LEFT OUTER JOIN"):sql.index("WHERE")]
+    # Matches the ix_prize_keys_unused partial index; used keys are never joined
+    assert "prize_keys.is_used = false" in join
+    assert "FILTER" not in sql
+
+
+class _PrizeSession:
+    """Session that finds the prize and records nothing else."""
+
+    def __init__(self):
+        self.committed = False
+
+    async def execute(self, statement):
+        prize = SimpleNamespace(id=1, use_key_pool=False, delivery_type="manual", key_count=0)
+        return SimpleNamespace(scalar_one_or_none=lambda: prize)
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        pass
+
+
+def _upload(text: str) -> UploadFile:
+    return UploadFile(io.BytesIO(text.encode("utf-8")), filename="keys.txt")
+
+
+async def test_import_rejects_oversized_key_type_before_inserting(monkeypatch):
+    async def insert_keys(*args):
+        raise AssertionError("nothing may be inserted")
+
+    monkeypatch.setattr(incentive, "_insert_prize_keys", insert_keys)
+
+    with pytest.raises(HTTPException) as error:
+        await import_prize_keys(1, _upload("KEY-1\n"), "x" * 51, None, _PrizeSession())
+
+    assert error.value.status_code == 400
+    assert "key_type" in error.value.detail
+
+
+async def test_import_reports_lines_of_oversized_keys(monkeypatch):
+    inserted = []
+
+    async def insert_keys(db, prize_id, keys, key_type, key_metadata):
+        inserted.extend(keys)
+        return len(keys)
+
+    monkeypatch.setattr(incentive, "_insert_prize_keys", insert_keys)
+    db = _PrizeSession()
+
+    result = await import_prize_keys(1, _upload("KEY-1\n" + "x" * 501 + "\nKEY-2\n"), "voucher", None, db)
+
+    assert inserted == ["KEY-1", "KEY-2"]
+    assert result["invalid"] == 1 and result["invalid_lines"] == [2]
+    assert db.committed
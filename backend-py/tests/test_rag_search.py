@@ -0,0 +1,108 @@
+"""Room-filtered searches fill their limit even for a small room in a large table.
+
+Needs a Postgres database with the pgvector extension: set TEST_DATABASE_URL
+(postgresql+asyncpg://...). Everything runs in one transaction that is rolled
+back, so the database is left unchanged.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
+
+from app import database
+from app.database import ChatMessageEmbedding, chat_message_vectors, EMBEDDING_DIMENSION
+from app.services import rag_service as rag_module
+from app.services.rag_service import rag_service
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+SMALL_ROOM = "!small:example.org"
+OTHER_ROOMS = [f"!busy{i}:example.org" for i in range(20)]
+OTHER_ROWS = 3000
+SMALL_ROWS = 15
+LIMIT = 10
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+async def seeded(monkeypatch):
+    """Many rows near the query in other rooms, a few far from it in SMALL_ROOM; returns the query."""
+    rng = np.random.default_rng(0)
+    query = _unit(rng.normal(size=(1, EMBEDDING_DIMENSION)))[0]
+    crowd = _unit(query + 0.05 * rng.normal(size=(OTHER_ROWS, EMBEDDING_DIMENSION)))
+    small = _unit(rng.normal(size=(SMALL_ROWS, EMBEDDING_DIMENSION)))
+
+    start = datetime(2025, 1, 1)
+    rows = [
+        {
+            "room_id": OTHER_ROOMS[i % len(OTHER_ROOMS)],
+            "event_id": f"$busy{i}",
+            "sender": "@bob:example.org",
+            "content": f"deploy pipeline failed again ({i})",
+            "timestamp": start + timedelta(seconds=i),
+            "embedding": vector.tolist(),
+        }
+        for i, vector in enumerate(crowd)
+    ] + [
+        {
+            "room_id": SMALL_ROOM,
+            "event_id": f"$small{i}",
+            "sender": "@alice:example.org",
+            "content": f"the deploy pipeline is green ({i})",
+            "timestamp": start + timedelta(seconds=i),
+            "embedding": vector.tolist(),
+        }
+        for i, vector in enumerate(small)
+    ]
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(lambda sync_conn: ChatMessageEmbedding.__table__.create(sync_conn, checkfirst=True))
+        # _ensure_vector_index detects iterative scan support; restored after the test
+        monkeypatch.setattr(database, "PGVECTOR_ITERATIVE_SCAN", database.PGVECTOR_ITERATIVE_SCAN)
+        await database._ensure_vector_index(conn)
+        await database._ensure_fulltext_index(conn)
+        await conn.execute(insert(chat_message_vectors), rows)
+
+        monkeypatch.setattr(database, "PGVECTOR_AVAILABLE", True)
+        monkeypatch.setattr(database, "FULLTEXT_AVAILABLE", True)
+        monkeypatch.setattr(
+            rag_module, "async_session",
+            async_sessionmaker(bind=conn, class_=AsyncSession, join_transaction_mode="create_savepoint"),
+        )
+        try:
+            yield query.tolist()
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+
+@pytest.mark.parametrize("iterative", [False, True])
+async def test_small_room_vector_search_fills_limit(seeded, monkeypatch, iterative):
+    if iterative and not database.PGVECTOR_ITERATIVE_SCAN:
+        pytest.skip("pgvector < 0.8 has no iterative index scans")
+    monkeypatch.setattr(database, "PGVECTOR_ITERATIVE_SCAN", iterative)
+
+    hits = await rag_service._pgvector_search(seeded, [SMALL_ROOM], LIMIT)
+
+    assert len(hits) == LIMIT
+    assert {hit.room_id for hit in hits} == {SMALL_ROOM}
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+
+async def test_small_room_lexical_search_fills_limit(seeded):
+    hits = await rag_service.lexical_search("deploy pipeline", [SMALL_ROOM], LIMIT)
+
+    assert len(hits) == LIMIT
+    assert {hit.room_id for hit in hits} == {SMALL_ROOM}
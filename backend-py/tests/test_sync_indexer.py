@@ -0,0 +1,53 @@
+"""Edits arriving through /sync keep the thread and timestamp of the message they replace."""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services import sync_indexer as sync_module
+from app.services.rag_service import rag_service
+from app.services.sync_indexer import sync_indexer
+
+ORIGINAL_TS = datetime(2025, 1, 1, 12, 0)
+
+
+class _Session:
+    """Session whose queries return the stored row of the edited reply."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        return [SimpleNamespace(event_id="$reply", thread_id="$root", timestamp=ORIGINAL_TS)]
+
+
+async def test_edit_of_a_thread_reply_keeps_its_thread_and_timestamp(monkeypatch):
+    stored = []
+
+    async def store_messages_batch(messages, event_ids, replace=False):
+        stored.append((messages, event_ids, replace))
+        return len(messages), 0.0
+
+    monkeypatch.setattr(sync_module, "async_session", _Session)
+    monkeypatch.setattr(rag_service, "store_messages_batch", store_messages_batch)
+
+    edit = {
+        "type": "m.room.message",
+        "event_id": "$edit",
+        "sender": "@alice:example.org",
+        "origin_server_ts": 1767225600000,
+        "content": {
+            "body": "* fixed typo",
+            "m.new_content": {"body": "fixed typo"},
+            "m.relates_to": {"rel_type": "m.replace", "event_id": "$reply"},
+        },
+    }
+    await sync_indexer._index_batch({"rooms": {"join": {"!room:example.org": {"timeline": {"events": [edit]}}}}})
+
+    [(messages, event_ids, replace)] = stored
+    assert replace and event_ids == ["$reply"]
+    assert messages[0].thread_id == "$root"
+    assert messages[0].timestamp == ORIGINAL_TS
+    assert messages[0].content == "fixed typo"